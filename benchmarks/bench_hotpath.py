@@ -0,0 +1,367 @@
+# ===============================================================================
+# Copyright 2019 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""
+acquisition hot path benchmarks and regression check.
+
+    python -m benchmarks.bench_hotpath                      # all cases, 1e3..1e6 samples
+    python -m benchmarks.bench_hotpath write plot --sizes 1e3,1e7
+    python -m benchmarks.bench_hotpath --save               # store benchmarks/baseline.json
+    python -m benchmarks.bench_hotpath --check              # exit 1 on a regression
+
+every case and size runs in a fresh interpreter so peak memory (max RSS above the
+interpreter's own) belongs to that case alone. latency percentiles are per sample, timed
+on up to MAX_TIMED evenly spaced samples. baselines are machine specific, save them on the
+machine the check runs on
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from numpy import empty, percentile, linspace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+DEFAULT_SIZES = (1e3, 1e4, 1e5, 1e6)
+MAX_TIMED = 100000
+TOLERANCE = 0.3
+# simulated trigger pulses per second for end_to_end, above what the pipeline sustains
+E2E_RATE = 50000
+
+
+# cases. each returns a callable taking the sample index, plus an optional finish callable
+def case_write(n, tmp):
+    from src.logwriter import LogWriter
+    from src.records import make_sample
+
+    w = LogWriter(os.path.join(tmp, 'bench.csv'))
+    w.open(['Counter', 'Time', 'Rate', 'TimeStamp', 'Raw', 'Temp'])
+    st = time.time()
+
+    def step(i):
+        w.write_row(make_sample(i + 1, st, st + i * 0.01, 1e5, 20.))
+
+    return step, w.close
+
+
+def case_write_binary(n, tmp):
+    from src.binlog import BinaryLogWriter
+    from src.records import make_sample
+
+    w = BinaryLogWriter(os.path.join(tmp, 'bench.wtb'))
+    w.open()
+    st = time.time()
+
+    def step(i):
+        w.write_row(make_sample(i + 1, st, st + i * 0.01, 1e5, 20.))
+
+    return step, w.close
+
+
+def case_plot(n, tmp):
+    # MainWindow._plot_measurement plus an envelope update every 100 samples, about one frame
+    from src.buffers import SampleStore
+    from src.decimate import MinMaxEnvelope
+
+    store = SampleStore(('x', 'y', 't'))
+    env = MinMaxEnvelope(store, 'x', 'y')
+
+    def step(i):
+        store.append(-i, 1e5 + i % 7, 20.)
+        if not i % 100:
+            env.update()
+
+    return step, None
+
+
+def case_convert(n, tmp):
+    # MeasurementDevice._convert_to_temp, one reading at a time
+    from src.conversion import WaterModel
+    model = WaterModel()
+
+    def step(i):
+        model(1e5 + i)
+
+    return step, None
+
+
+def case_fit(n, tmp):
+    # Calibrator._plot_point/_fit without the plot, a refit after every point
+    from src.fitting import LogPolynomialFit
+    fit = LogPolynomialFit(3)
+
+    def step(i):
+        r = 1e3 + i
+        fit.add_point(r, 1233.19 - 192.57 * (r ** 0.1))
+        if fit.n > fit.nparams:
+            fit.coefficients
+
+    return step, None
+
+
+def case_format(n, tmp):
+    # MainWindow._report_measurement / wt.report_row with the status line writing to a file
+    from src.records import make_sample, StatusLine
+
+    wfile = open(os.path.join(tmp, 'status.txt'), 'w')
+    status = StatusLine(stream=wfile)
+    st = time.time()
+
+    def step(i):
+        status.update(make_sample(i + 1, st, st + i * 0.01, 1e5, 20.))
+
+    def finish():
+        status.close()
+        wfile.close()
+
+    return step, finish
+
+
+def case_csv(n, tmp):
+    # the per row work done in the writer's flush thread
+    from src.records import make_sample
+    st = time.time()
+    s = make_sample(1, st, st + 1, 1e5, 20.)
+
+    def step(i):
+        s.csv()
+
+    return step, None
+
+
+def case_profile(n, tmp):
+    from src.depthprofile import DepthProfile
+    p = DepthProfile(bin_size=1.0, depth_per_trigger=0.1)
+
+    def step(i):
+        p.add(i + 1, i * 0.01, 20. + i * 1e-4)
+
+    return step, None
+
+
+def case_end_to_end(n, tmp):
+    # simulated meter read on a fast simulated trigger line by the acquisition worker, drained
+    # into a writer. the trigger wait is part of the measured path, edges the worker cannot
+    # keep up with are merged like at the well
+    from src.device import MeasurementDevice, SignalDevice
+    from src.acquisition import AcquisitionWorker
+    from src.logwriter import LogWriter
+
+    md = MeasurementDevice(simulate=True)
+    md.open()
+    md._handle.realtime = False
+    md.reset()
+    w = LogWriter(os.path.join(tmp, 'e2e.csv'))
+    w.open()
+    sd = SignalDevice()
+    sd.trigger_backend = 'simulate'
+    sd.sim_rate = E2E_RATE
+    sd.open()
+    worker = AcquisitionWorker(md, sd, maxsize=100000, post_measurement_delay=0)
+    state = {'written': 0, 'started': False}
+
+    def step(i):
+        # one step is one sample written
+        if not state['started']:
+            state['started'] = True
+            worker.start()
+        while state['written'] <= i:
+            rows = worker.drain()
+            if not rows:
+                time.sleep(0.0001)
+                continue
+            for r in rows:
+                w.write_row(r)
+            state['written'] += len(rows)
+
+    def finish():
+        worker.stop()
+        sd.close()
+        w.close()
+
+    return step, finish
+
+
+CASES = {'write': (case_write, 1e7),
+         'write_binary': (case_write_binary, 1e7),
+         'plot': (case_plot, 1e7),
+         'convert': (case_convert, 1e7),
+         'fit': (case_fit, 1e6),
+         'format': (case_format, 1e7),
+         'csv': (case_csv, 1e7),
+         'profile': (case_profile, 1e7),
+         'end_to_end': (case_end_to_end, 1e6)}
+
+
+def run_case(name, n, trace=False):
+    """
+    runs in the child process
+    """
+    factory, _ = CASES[name]
+    n = int(n)
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with tempfile.TemporaryDirectory() as tmp:
+        step, finish = factory(n, tmp)
+
+        timed = set(linspace(0, n - 1, min(n, MAX_TIMED)).astype(int).tolist())
+        lat = empty(len(timed))
+        j = 0
+        if trace:
+            tracemalloc.start()
+
+        perf = time.perf_counter
+        st = perf()
+        for i in range(n):
+            if i in timed:
+                t0 = perf()
+                step(i)
+                lat[j] = perf() - t0
+                j += 1
+            else:
+                step(i)
+        if finish:
+            finish()
+        et = perf() - st
+
+        peak = 0
+        if trace:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    lat = lat[:j]
+    p50, p95, p99 = percentile(lat, (50, 95, 99)) if j else (0, 0, 0)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base_rss
+    if sys.platform != 'darwin':
+        rss *= 1024
+    return {'n': n, 'seconds': et, 'rate': n / et if et else 0,
+            'p50_us': p50 * 1e6, 'p95_us': p95 * 1e6, 'p99_us': p99 * 1e6, 'max_us': lat.max() * 1e6 if j else 0,
+            'peak_rss_kb': rss / 1024., 'traced_peak_kb': peak / 1024.}
+
+
+def spawn(name, n, trace):
+    args = [sys.executable, '-m', 'benchmarks.bench_hotpath', '--child', name, str(int(n))]
+    if trace:
+        args.append('--tracemalloc')
+    p = subprocess.run(args, cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if p.returncode:
+        raise RuntimeError(p.stderr.decode().strip().splitlines()[-1])
+    return json.loads(p.stdout.decode().strip().splitlines()[-1])
+
+
+def check(result, base, tolerance):
+    """
+    returns a list of regression messages
+    """
+    msgs = []
+    if result['rate'] < base['rate'] * (1 - tolerance):
+        msgs.append('rate {:0.0f}/s < baseline {:0.0f}/s'.format(result['rate'], base['rate']))
+    if result['p99_us'] > base['p99_us'] * (1 + tolerance) + 5:
+        msgs.append('p99 {:0.1f}us > baseline {:0.1f}us'.format(result['p99_us'], base['p99_us']))
+    # 4 MB of slack for allocator and page granularity
+    if result['peak_rss_kb'] > base['peak_rss_kb'] * (1 + tolerance) + 4096:
+        msgs.append('peak {:0.0f}kB > baseline {:0.0f}kB'.format(result['peak_rss_kb'], base['peak_rss_kb']))
+    return msgs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='acquisition hot path benchmarks')
+    parser.add_argument('cases', nargs='*', help='cases to run. default all: {}'.format(', '.join(CASES)))
+    parser.add_argument('--sizes', default=','.join(['{:g}'.format(s) for s in DEFAULT_SIZES]),
+                        help='comma separated sample counts, e.g. 1e3,1e7')
+    parser.add_argument('--save', action='store_true', help='store the results as the baseline')
+    parser.add_argument('--check', action='store_true', help='compare with the baseline, exit 1 on a regression')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--tracemalloc', action='store_true', help='also report the traced python heap peak (slow)')
+    parser.add_argument('--child', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_case(args.child[0], float(args.child[1]), args.tracemalloc)))
+        return
+
+    names = args.cases or list(CASES)
+    sizes = [int(float(s)) for s in args.sizes.split(',')]
+
+    baseline = {}
+    if os.path.isfile(args.baseline):
+        with open(args.baseline, 'r') as rfile:
+            baseline = json.load(rfile)
+    elif args.check:
+        print('no baseline at {}. run with --save first'.format(args.baseline))
+        sys.exit(2)
+
+    fmt = '{:<14s}{:>10s}{:>14s}{:>10s}{:>10s}{:>10s}{:>12s}  {}'
+    print(fmt.format('case', 'n', 'samples/s', 'p50 us', 'p95 us', 'p99 us', 'peak kB', ''))
+    results = {}
+    regressions = []
+    for name in names:
+        if name not in CASES:
+            print('unknown case {}'.format(name))
+            continue
+
+        for n in sizes:
+            if n > CASES[name][1]:
+                continue
+            try:
+                r = spawn(name, n, args.tracemalloc)
+            except RuntimeError as e:
+                print(fmt.format(name, str(n), 'failed', '', '', '', '', e))
+                regressions.append('{} n={} failed'.format(name, n))
+                continue
+
+            results.setdefault(name, {})[str(n)] = r
+            msgs = []
+            base = baseline.get(name, {}).get(str(n))
+            if args.check:
+                if base:
+                    msgs = check(r, base, args.tolerance)
+                else:
+                    # a case or size the baseline does not cover cannot pass the check
+                    msgs = ['no baseline, run with --save']
+                regressions.extend(['{} n={}: {}'.format(name, n, m) for m in msgs])
+
+            print(fmt.format(name, str(n), '{:0.0f}'.format(r['rate']), '{:0.2f}'.format(r['p50_us']),
+                             '{:0.2f}'.format(r['p95_us']), '{:0.2f}'.format(r['p99_us']),
+                             '{:0.0f}'.format(r['peak_rss_kb']), ('REGRESSION' if base else 'NO BASELINE') if msgs else ''))
+
+    if args.save:
+        for name, rs in results.items():
+            baseline.setdefault(name, {}).update(rs)
+        baseline['_meta'] = {'saved': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': sys.version.split()[0],
+                             'platform': sys.platform}
+        with open(args.baseline, 'w') as wfile:
+            json.dump(baseline, wfile, indent=1, sort_keys=True)
+        print('baseline written to {}'.format(args.baseline))
+
+    if args.check:
+        if regressions:
+            print('\n{} regressions'.format(len(regressions)))
+            for m in regressions:
+                print('  {}'.format(m))
+            sys.exit(1)
+        print('\nno regressions')
+
+
+if __name__ == '__main__':
+    main()
+# ============= EOF =============================================
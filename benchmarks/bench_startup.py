@@ -0,0 +1,81 @@
+# ===============================================================================
+# Copyright 2019 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""
+import time of the entry points, each in a fresh interpreter.
+
+    python -m benchmarks.bench_startup [repeats]
+
+also lists which GUI packages each import pulls in. the headless modules should load none
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+
+MODULES = ('src.device', 'src.headless', 'src.plotting', 'wtgui', 'src.calibrator')
+GUI_PACKAGES = ('traitsui', 'pyface', 'enable', 'chaco', 'scipy')
+
+PROBE = """
+import sys, time, json
+st = time.perf_counter()
+import {module}
+et = time.perf_counter() - st
+print(json.dumps([et, sorted(p for p in {packages!r} if p in sys.modules)]))
+"""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def probe(module):
+    code = PROBE.format(module=module, packages=GUI_PACKAGES)
+    env = dict(os.environ, ETS_TOOLKIT=os.environ.get('ETS_TOOLKIT', 'null'))
+    st = time.perf_counter()
+    p = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env,
+                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    wall = time.perf_counter() - st
+    if p.returncode:
+        return None, wall, p.stderr.decode().strip().splitlines()[-1:]
+    et, loaded = json.loads(p.stdout.decode().strip().splitlines()[-1])
+    return et, wall, loaded
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    print('{:<16s}{:>12s}{:>12s}  {}'.format('module', 'import ms', 'process ms', 'gui packages loaded'))
+    for m in MODULES:
+        ets, walls = [], []
+        loaded = []
+        for i in range(repeats):
+            et, wall, loaded = probe(m)
+            if et is None:
+                break
+            ets.append(et)
+            walls.append(wall)
+
+        if not ets:
+            print('{:<16s}{:>12s}{:>12s}  {}'.format(m, 'failed', '', ' '.join(loaded)))
+            continue
+
+        print('{:<16s}{:>12.1f}{:>12.1f}  {}'.format(m, sorted(ets)[len(ets) // 2] * 1000,
+                                                     sorted(walls)[len(walls) // 2] * 1000,
+                                                     ','.join(loaded) or '-'))
+
+
+if __name__ == '__main__':
+    main()
+# ============= EOF =============================================
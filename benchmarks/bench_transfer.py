@@ -0,0 +1,70 @@
+# ===============================================================================
+# Copyright 2019 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""
+compare ASCII and REAL,64 reading transfer using the simulated multimeter.
+
+    python -m benchmarks.bench_transfer [nreadings] [bus bytes/s]
+
+parse time is measured. bus time is estimated from the number of bytes sent and the bus
+rate (default 300 kB/s, a conservative GPIB figure)
+"""
+import sys
+import time
+
+from src.device import MeasurementDevice
+
+
+def run(fmt, n, repeats, bus_rate):
+    dev = MeasurementDevice(simulate=True, data_format=fmt, acquisition_mode='Batch')
+    dev.open()
+    sim = dev._handle
+    # parse time only, the bus is estimated below
+    sim.realtime = False
+
+    et = 0
+    for i in range(repeats):
+        dev.arm(n)
+        for j in range(n):
+            sim.trigger()
+
+        st = time.perf_counter()
+        values = dev.fetch()
+        et += time.perf_counter() - st
+        assert len(values) == n
+
+    nbytes = sim.bytes_sent / float(repeats)
+    parse = et / repeats
+    bus = nbytes / bus_rate
+    return nbytes, parse, bus
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 512
+    bus_rate = float(sys.argv[2]) if len(sys.argv) > 2 else 300e3
+    repeats = 20
+
+    print('{} readings per fetch, {} fetches, bus={:0.0f} B/s'.format(n, repeats, bus_rate))
+    print('{:<8s}{:>12s}{:>12s}{:>12s}{:>12s}{:>16s}'.format('format', 'bytes', 'B/reading', 'parse ms',
+                                                             'bus ms', 'readings/s'))
+    for fmt in ('ASCII', 'REAL64'):
+        nbytes, parse, bus = run(fmt, n, repeats, bus_rate)
+        print('{:<8s}{:>12.0f}{:>12.1f}{:>12.3f}{:>12.3f}{:>16.0f}'.format(fmt, nbytes, nbytes / n, parse * 1000,
+                                                                          bus * 1000, n / (parse + bus)))
+
+
+if __name__ == '__main__':
+    main()
+# ============= EOF =============================================
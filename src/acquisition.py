@@ -0,0 +1,204 @@
+# ===============================================================================
+# Copyright 2019 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+import threading
+import time
+from queue import Queue, Full, Empty
+
+from src.timing import Timings
+
+
+def edge_timestamps(previous, timestamp, n):
+    """
+    times of `n` edges that were merged into one wait. only the last edge's time is known,
+    the earlier ones are spread evenly back to the `previous` edge
+    """
+    if n <= 1 or previous is None or previous >= timestamp:
+        return [timestamp] * max(n, 1)
+    dt = (timestamp - previous) / n
+    return [previous + dt * (i + 1) for i in range(n)]
+
+
+class AcquisitionWorker(object):
+    """
+    waits for triggers and reads the measurement device on a dedicated thread. measurements
+    are pushed onto a bounded queue that the consumer drains with `drain`. if the consumer
+    falls behind and the queue is full new measurements are dropped and counted.
+
+    with an AutoTuner as `autotune` every triggered reading is reported to it and the
+    settings it picks are applied here, between two readings
+    """
+
+    def __init__(self, measurement_device, signal_device, maxsize=10000, post_measurement_delay=0,
+                 trigger_timeout=0.25, debug=False, timings=None, autotune=None):
+        self.measurement_device = measurement_device
+        self.signal_device = signal_device
+        self.timings = timings or Timings(enabled=False)
+        self.post_measurement_delay = post_measurement_delay
+        self.trigger_timeout = trigger_timeout
+        self.debug = debug
+        self.autotune = autotune
+
+        self.queue = Queue(maxsize)
+        self.acquired = 0
+        self.dropped = 0
+        # triggers in Batch mode the multimeter did not measure, they arrived after its batch
+        # was complete or while it was fetched and re-armed
+        self.unread = 0
+        self.max_depth = 0
+
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def depth(self):
+        return self.queue.qsize()
+
+    @property
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.is_alive:
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='AcquisitionWorker')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def drain(self, n=None):
+        ms = []
+        while n is None or len(ms) < n:
+            try:
+                ms.append(self.queue.get_nowait())
+            except Empty:
+                break
+        return ms
+
+    # private
+    def _put(self, measurement):
+        try:
+            self.queue.put_nowait(measurement)
+            self.acquired += 1
+            d = self.queue.qsize()
+            if d > self.max_depth:
+                self.max_depth = d
+        except Full:
+            self.dropped += 1
+
+    def _tune(self, measurement, latency):
+        sd = self.signal_device
+        trigger = getattr(sd, '_trigger', None)
+        ts, missed = None, None
+        if trigger is not None:
+            ts = trigger.timestamp
+            if trigger.counts_missed:
+                missed = trigger.missed
+
+        changes = self.autotune.observe(ts, latency, missed, measurement.counter)
+        if changes:
+            if 'nplc' in changes:
+                self.measurement_device.npoints = changes['nplc']
+            if 'delay' in changes:
+                self.post_measurement_delay = changes['delay']
+            if 'period' in changes:
+                sd.period = changes['period']
+
+    def _arm(self):
+        md = self.measurement_device
+        if getattr(md, 'acquisition_mode', 'Single') == 'Batch':
+            if md.arm(md.batch_size):
+                return md.batch_size
+            print('falling back to one reading per trigger')
+        return 0
+
+    def _run(self):
+        evt = self._stop_event
+        md = self.measurement_device
+        sd = self.signal_device
+        tm = self.timings
+
+        batch = self._arm()
+        timestamps = []
+        # edges before the meter was armed are not measured, count from here
+        last_edges = getattr(sd, 'edges', 0)
+        last_timestamp = None
+        while not evt.is_set():
+            st = tm.start()
+            if sd.waitfor(timeout=self.trigger_timeout) or self.debug:
+                if evt.is_set():
+                    break
+                st = tm.stop('trigger', st)
+
+                if batch:
+                    # the multimeter takes a reading on every hardware trigger edge. keep one
+                    # time per edge, a wait may have merged several, and fetch the readings
+                    # once the batch is complete
+                    ts = getattr(sd, 'timestamp', None) or time.time()
+                    edges = getattr(sd, 'edges', 0)
+                    # without a trigger line (debug) every wait is one reading. a wait can also
+                    # return only the edges skipped during re-arm, they are already counted
+                    n, last_edges = edges - last_edges if edges else 1, edges
+                    if n <= 0:
+                        continue
+                    timestamps.extend(edge_timestamps(last_timestamp, ts, n))
+                    last_timestamp = ts
+                    if len(timestamps) >= batch:
+                        # edges past the trigger count were not measured
+                        self.unread += len(timestamps) - batch
+                        st = tm.start()
+                        values = md.fetch()
+                        st = tm.stop('visa', st)
+                        for measurement in md.make_measurements(values, timestamps[:batch]):
+                            self._put(measurement)
+                        tm.stop('convert', st)
+
+                        timestamps = []
+                        if not md.arm(batch):
+                            batch = 0
+                        # the meter was not armed while fetching, those edges have no reading.
+                        # the next batch starts with the first edge after arm returned
+                        edges = getattr(sd, 'edges', 0)
+                        self.unread += edges - last_edges
+                        last_edges = edges
+                        last_timestamp = None
+                    continue
+
+                now = time.time()
+                rst = time.perf_counter()
+                value = md.read()
+                latency = time.perf_counter() - rst
+                st = tm.stop('visa', st)
+                measurement = md.make_measurement(value, now)
+                tm.stop('convert', st)
+                self._put(measurement)
+                if self.autotune:
+                    self._tune(measurement, latency)
+
+                if self.post_measurement_delay:
+                    evt.wait(self.post_measurement_delay)
+
+        if batch:
+            for measurement in md.finish_batch(timestamps):
+                self._put(measurement)
+
+# ============= EOF =============================================
@@ -0,0 +1,191 @@
+# ===============================================================================
+# Copyright 2019 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""
+asyncio acquisition pipeline for the command line logger.
+
+    trigger -> reads -> rows -> write
+                             -> report
+
+the blocking trigger wait and instrument read each run on their own executor thread so a
+trigger arriving during a read is queued with its timestamp instead of waiting for the read
+to finish. READ? samples the meter when it runs, so triggers that piled up during a read
+are collapsed: the newest one is read and stamped, the older ones are counted as missed.
+nothing sleeps for a fixed time. tasks wake on trigger edges and queue items
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.timing import Timings
+
+STOP = None
+
+
+class AsyncEngine(object):
+    """
+    wait(timeout) -> bool      blocks until a trigger edge or the timeout
+    timestamp() -> float       time of the last edge
+    read() -> float            blocking instrument read
+    make_row(value, ts) -> row
+    writer                     LogWriter
+    report(rows)               called with every batch of rows that is ready
+    """
+
+    def __init__(self, wait, read, make_row, writer, report=None, timestamp=None, timings=None,
+                 trigger_timeout=0.25, maxsize=10000):
+        self.wait = wait
+        self.read = read
+        self.make_row = make_row
+        self.writer = writer
+        self.report = report
+        self.timestamp = timestamp or time.time
+        self.timings = timings or Timings(enabled=False)
+        self.trigger_timeout = trigger_timeout
+        self.maxsize = maxsize
+
+        self.triggers = 0
+        self.rows = 0
+        self.dropped = 0
+        self.missed = 0
+        self._stop = None
+
+    def stop(self):
+        if self._stop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+
+    def run(self, duration=0):
+        """
+        run until `stop`, Control+C or `duration` seconds have passed
+        """
+        try:
+            asyncio.run(self.arun(duration))
+        except KeyboardInterrupt:
+            pass
+
+    async def arun(self, duration=0):
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+
+        trigger_q = asyncio.Queue(self.maxsize)
+        write_q = asyncio.Queue()
+        report_q = asyncio.Queue()
+
+        # one thread each so a slow read never holds up the trigger wait
+        self._trigger_pool = ThreadPoolExecutor(1, thread_name_prefix='trigger')
+        self._read_pool = ThreadPoolExecutor(1, thread_name_prefix='read')
+
+        tasks = [asyncio.ensure_future(self._trigger_task(trigger_q)),
+                 asyncio.ensure_future(self._read_task(trigger_q, (write_q, report_q))),
+                 asyncio.ensure_future(self._write_task(write_q)),
+                 asyncio.ensure_future(self._report_task(report_q))]
+        try:
+            if duration:
+                try:
+                    await asyncio.wait_for(self._stop.wait(), duration)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await self._stop.wait()
+        finally:
+            self._stop.set()
+            # the trigger task finishes its current wait, then the queues drain in order
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._trigger_pool.shutdown()
+            self._read_pool.shutdown()
+
+    # tasks
+    async def _trigger_task(self, out):
+        loop = self._loop
+        tm = self.timings
+        try:
+            while not self._stop.is_set():
+                st = tm.start()
+                if await loop.run_in_executor(self._trigger_pool, self.wait, self.trigger_timeout):
+                    tm.stop('trigger', st)
+                    self.triggers += 1
+                    try:
+                        out.put_nowait(self.timestamp())
+                    except asyncio.QueueFull:
+                        self.dropped += 1
+        finally:
+            await out.put(STOP)
+
+    async def _read_task(self, inp, outs):
+        loop = self._loop
+        tm = self.timings
+        while 1:
+            ts = await inp.get()
+            if ts is STOP:
+                break
+
+            # only the newest trigger can be paired with a reading taken now
+            stop = False
+            while not inp.empty():
+                nts = inp.get_nowait()
+                if nts is STOP:
+                    stop = True
+                    break
+                ts = nts
+                self.missed += 1
+
+            st = tm.start()
+            value = await loop.run_in_executor(self._read_pool, self.read)
+            st = tm.stop('visa', st)
+            row = self.make_row(value, ts)
+            tm.stop('convert', st)
+            self.rows += 1
+            for o in outs:
+                o.put_nowait(row)
+            if stop:
+                break
+
+        for o in outs:
+            o.put_nowait(STOP)
+
+    async def _write_task(self, inp):
+        tm = self.timings
+        while 1:
+            row = await inp.get()
+            if row is STOP:
+                break
+            st = tm.start()
+            self.writer.write_row(row)
+            tm.stop('write', st)
+
+    async def _report_task(self, inp):
+        if self.report is None:
+            while await inp.get() is not STOP:
+                pass
+            return
+
+        tm = self.timings
+        done = False
+        while not done:
+            rows = [await inp.get()]
+            # report whatever else is already waiting in one go
+            while not inp.empty():
+                rows.append(inp.get_nowait())
+
+            if rows[-1] is STOP:
+                rows.pop()
+                done = True
+
+            if rows:
+                st = tm.start()
+                self.report(rows)
+                tm.stop('report', st)
+
+# ============= EOF =============================================
@@ -0,0 +1,187 @@
+# ===============================================================================
+# Copyright 2019 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+from collections import deque
+
+from numpy import percentile, median
+
+# integration times the 34401A accepts for SENSE:FRES:NPLC
+NPLC_STEPS = (0.02, 0.2, 1, 2, 10, 100)
+
+# an interval this many times the median is taken as a gap left by missed triggers
+GAP = 1.6
+MIN_SAMPLES = 5
+
+
+class AutoTuner(object):
+    """
+    picks the integration time (NPLC), post measurement delay and trigger poll period from
+    the measured trigger interval and read latency.
+
+    the time budget per trigger is the fast end (10th percentile) of the recent trigger
+    intervals times `margin`. the read latency is split into the integration time and an
+    overhead (bus, conversion) so the latency of every NPLC step can be predicted. the
+    largest NPLC whose reading fits the budget is used, the delay is shrunk to whatever time
+    is left and the poll period is a tenth of the budget. with period=None, for triggers
+    that do not poll, the period is left alone.
+
+    a missed trigger halves the delay, or steps the NPLC down once there is no delay left,
+    immediately. both go back up one step at a time and only after `hold` readings without
+    a miss. triggers that can count missed edges
+    (everything but polling) report them, for polling they are estimated from gaps in the
+    trigger intervals.
+
+    every adjustment is kept in `notes` for the owner to write into the run file
+    """
+
+    def __init__(self, nplc=10, delay=0.05, period=0.01, line_frequency=60., margin=0.8, window=50, hold=20,
+                 min_nplc=0.02, max_nplc=10, min_period=0.001, max_period=None):
+        self.nplc = nplc
+        self.delay = delay
+        self.period = period
+        self.base_delay = delay
+        self.delay_limit = delay
+        self.line_frequency = line_frequency
+        self.margin = margin
+        self.hold = hold
+        self.steps = [s for s in NPLC_STEPS if min_nplc <= s <= max_nplc] or [min_nplc]
+        self.min_period = min_period
+        self.max_period = max_period or period or 0
+
+        self.missed = 0
+        self.adjustments = 0
+        self.intervals = deque(maxlen=window)
+        self.overheads = deque(maxlen=window)
+        self.notes = deque()
+
+        self._last_timestamp = None
+        self._last_missed = None
+        self._since = 0
+        self._recent_missed = 0
+
+    def integration_time(self, nplc=None):
+        return (self.nplc if nplc is None else nplc) / self.line_frequency
+
+    def observe(self, timestamp, latency, missed=None, counter=0):
+        """
+        record one triggered reading. `timestamp` is the trigger time or None without a
+        trigger line, `latency` the duration of the read (s) and `missed` the trigger's running
+        count of missed edges, None if it cannot count them.
+
+        returns a dict of the settings that changed or None
+        """
+        n = 0
+        if missed is not None:
+            if self._last_missed is not None:
+                n = max(missed - self._last_missed, 0)
+            self._last_missed = missed
+
+        if timestamp is not None:
+            if self._last_timestamp is not None:
+                dt = timestamp - self._last_timestamp
+                if dt > 0:
+                    k = 1
+                    if missed is None and len(self.intervals) >= MIN_SAMPLES:
+                        med = median(self.intervals)
+                        if dt > GAP * med:
+                            k = int(round(dt / med))
+                            n = k - 1
+                    elif n:
+                        k = n + 1
+                    self.intervals.append(dt / k)
+            self._last_timestamp = timestamp
+
+        self.missed += n
+        self._recent_missed += n
+        self.overheads.append(max(latency - self.integration_time(), 0))
+        self._since += 1
+        return self._update(counter)
+
+    def pop_notes(self):
+        ns = []
+        while self.notes:
+            ns.append(self.notes.popleft())
+        return ns
+
+    def status_str(self):
+        s = 'NPLC={:g} delay={:0.3f}s'.format(self.nplc, self.delay)
+        if self.period is not None:
+            s = '{} period={:0.3f}s'.format(s, self.period)
+        return '{} missed={} adjustments={}'.format(s, self.missed, self.adjustments)
+
+    # private
+    def _update(self, counter):
+        if len(self.intervals) < MIN_SAMPLES:
+            return
+        if not self._recent_missed and self._since < self.hold:
+            return
+
+        budget = float(percentile(self.intervals, 10)) * self.margin
+        overhead = float(percentile(self.overheads, 90))
+
+        fit = [s for s in self.steps if overhead + self.integration_time(s) <= budget]
+        target = fit[-1] if fit else self.steps[0]
+        cur = self._step_index()
+        nplc = min(target, self.nplc)
+        busy = overhead + self.integration_time() + self.delay
+        if self._recent_missed:
+            # the prediction kept up but triggers were still missed, back off anyway. misses
+            # while the reading takes a small part of the interval are not caused by it
+            if busy > budget / 2. and target >= self.nplc:
+                if self.delay > 0.001:
+                    self.delay_limit = self.delay / 2.
+                else:
+                    nplc = self.steps[max(cur - 1, 0)]
+        else:
+            if target > self.nplc:
+                nplc = self.steps[min(cur + 1, len(self.steps) - 1)]
+            self.delay_limit = min(max(self.delay_limit * 2, 0.001), self.base_delay)
+
+        read = overhead + self.integration_time(nplc)
+        delay = round(min(self.delay_limit, max(budget - read, 0)), 3)
+
+        changes = {}
+        if nplc != self.nplc:
+            changes['nplc'] = nplc
+        if abs(delay - self.delay) > max(0.002, 0.1 * self.delay):
+            changes['delay'] = delay
+        if self.period is not None:
+            period = round(min(max(budget / 10., self.min_period), self.max_period), 3)
+            if abs(period - self.period) > max(0.001, 0.1 * self.period):
+                changes['period'] = period
+
+        missed, self._recent_missed = self._recent_missed, 0
+        self._since = 0
+        if not changes:
+            return
+
+        note = ['autotune counter={}'.format(counter)]
+        for k in ('nplc', 'delay', 'period'):
+            if k in changes:
+                note.append('{} {:g}->{:g}'.format(k, getattr(self, k), changes[k]))
+                setattr(self, k, changes[k])
+        note.append('interval={:0.4f}s overhead={:0.4f}s missed={}'.format(budget / self.margin, overhead, missed))
+
+        self.adjustments += 1
+        self.notes.append(' '.join(note))
+        return changes
+
+    def _step_index(self):
+        for i, s in enumerate(self.steps):
+            if s >= self.nplc:
+                return i
+        return len(self.steps) - 1
+
+# ============= EOF =============================================
@@ -0,0 +1,356 @@
+# ===============================================================================
+# Copyright 2019 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""
+append-only binary log.
+
+a log file is a header followed by fixed size little endian records (RECORD_DTYPE)
+
+    magic       8 bytes  b'WTLBIN01'
+    length      uint32   length of the json metadata
+    metadata    json     session metadata, calibration model and coefficients, dtype
+    padding     zeros up to a multiple of 64 bytes
+
+long runs can be split into segments of `segment_rows` records named <stem>.<NNNN>.wtb.
+closed segments can be compressed with gzip (.gz) or lzma (.xz)
+"""
+import glob
+import gzip
+import json
+import lzma
+import os
+import struct
+from datetime import datetime
+
+from numpy import dtype, empty, memmap, frombuffer, concatenate, loadtxt, fromiter
+
+from src.logwriter import LogWriter
+from src.records import Sample
+
+MAGIC = b'WTLBIN01'
+ALIGN = 64
+EXT = '.wtb'
+CSV_HEADER = ['Counter', 'Time', 'Rate', 'TimeStamp', 'Raw', 'Temp']
+
+RECORD_DTYPE = dtype([('counter', '<i8'),
+                      ('time', '<f8'),
+                      ('rate', '<f8'),
+                      ('timestamp', '<f8'),
+                      ('raw', '<f8'),
+                      ('temp', '<f8')])
+
+COMPRESSORS = {'gzip': ('.gz', gzip.open), 'lzma': ('.xz', lzma.open)}
+
+
+def make_header(metadata):
+    meta = dict(metadata)
+    meta['dtype'] = RECORD_DTYPE.descr
+    payload = json.dumps(meta).encode('utf-8')
+    n = len(MAGIC) + 4 + len(payload)
+    pad = (ALIGN - n % ALIGN) % ALIGN
+    return MAGIC + struct.pack('<I', len(payload)) + payload + b'\0' * pad
+
+
+def parse_header(buf):
+    """
+    returns metadata, data offset
+    """
+    if buf[:len(MAGIC)] != MAGIC:
+        raise ValueError('not a WellTempLogger binary log')
+
+    i = len(MAGIC)
+    n, = struct.unpack('<I', buf[i:i + 4])
+    meta = json.loads(buf[i + 4:i + 4 + n].decode('utf-8'))
+    end = i + 4 + n
+    return meta, end + (ALIGN - end % ALIGN) % ALIGN
+
+
+def to_epoch(v):
+    if isinstance(v, str):
+        return datetime.fromisoformat(v).timestamp()
+    return float(v)
+
+
+def segment_path(path, i):
+    stem, ext = os.path.splitext(path)
+    return '{}.{:04d}{}'.format(stem, i, ext or EXT)
+
+
+class BinaryLogWriter(LogWriter):
+    """
+    LogWriter that packs measurement rows into RECORD_DTYPE records. rows are converted in
+    the flush thread so the acquisition path only appends to the pending list
+    """
+
+    def __init__(self, path, metadata=None, segment_rows=0, compression=None, **kw):
+        self.base_path = path
+        self.metadata = metadata or {}
+        self.segment_rows = segment_rows
+        self.compression = compression
+        self.segments = []
+        self._segment = 0
+        self._segment_count = 0
+
+        if segment_rows:
+            path = segment_path(path, 0)
+        super(BinaryLogWriter, self).__init__(path, **kw)
+
+    def open(self, header=None, mode='wb'):
+        # the column names are fixed by RECORD_DTYPE, a dict header replaces the metadata
+        if isinstance(header, dict):
+            self.metadata = header
+        self.segments.append(self.path)
+        return super(BinaryLogWriter, self).open(self.metadata, mode)
+
+    def close(self):
+        super(BinaryLogWriter, self).close()
+        if self.segment_rows:
+            self._compress(len(self.segments) - 1)
+
+    @property
+    def notes_path(self):
+        return '{}.notes.txt'.format(os.path.splitext(self.base_path)[0])
+
+    def note(self, text):
+        """
+        records have a fixed size so comment lines go to <stem>.notes.txt next to the log
+        """
+        with open(self.notes_path, 'a') as wfile:
+            wfile.write('# {}\n'.format(text))
+
+    def write_records(self, recs):
+        """
+        write a block of RECORD_DTYPE records directly, bypassing the row buffer
+        """
+        with self._io_lock:
+            self._flush()
+            for chunk in self._split(recs):
+                data = chunk.tobytes()
+                self._handle.write(data)
+                self.rows_written += len(chunk)
+                self.bytes_written += len(data)
+                self._rows_flushed(len(chunk))
+
+    # private
+    def _write_header(self, metadata):
+        data = make_header(metadata)
+        self._handle.write(data)
+        self.bytes_written += len(data)
+
+    def _write_rows(self, rows, notes=0):
+        # notes go to notes_path, every row is a record
+        for chunk in self._split(rows):
+            super(BinaryLogWriter, self)._write_rows(chunk)
+
+    def _split(self, rows):
+        """
+        yields `rows` in pieces that end on segment boundaries. lazy, a full segment is only
+        rolled over once there is a next piece for it, so no empty segment is left behind
+        """
+        i = 0
+        while i < len(rows):
+            if self.segment_rows and self._segment_count >= self.segment_rows:
+                self._roll()
+            n = self.segment_rows - self._segment_count if self.segment_rows else len(rows)
+            yield rows[i:i + n]
+            i += n
+
+    def _format_rows(self, rows):
+        recs = empty(len(rows), dtype=RECORD_DTYPE)
+        for i, r in enumerate(rows):
+            if isinstance(r, Sample):
+                recs[i] = (r.counter, r.time, r.rate, r.timestamp, r.raw, r.temp)
+            else:
+                recs[i] = (r[0], r[1], r[2], to_epoch(r[3]), r[4], r[5])
+        return recs.tobytes()
+
+    def _rows_flushed(self, n):
+        self._segment_count += n
+
+    def _roll(self):
+        # called with the io lock held
+        self._handle.close()
+        self._compress(self._segment)
+
+        self._segment += 1
+        self._segment_count = 0
+        self.path = segment_path(self.base_path, self._segment)
+        self.segments.append(self.path)
+        self._handle = open(self.path, 'wb')
+        self._write_header(self.metadata)
+
+    def _compress(self, i):
+        if not self.compression:
+            return
+
+        src = self.segments[i]
+        ext, opener = COMPRESSORS[self.compression]
+        dst = src + ext
+        with open(src, 'rb') as rfile, opener(dst, 'wb') as wfile:
+            while 1:
+                buf = rfile.read(1 << 20)
+                if not buf:
+                    break
+                wfile.write(buf)
+        os.remove(src)
+        self.segments[i] = dst
+
+
+def read_segment(path, mode='r'):
+    """
+    returns metadata, records. uncompressed segments are memory mapped so opening is
+    independent of the file size, compressed segments are decompressed into memory
+    """
+    for ext, opener in COMPRESSORS.values():
+        if path.endswith(ext):
+            with opener(path, 'rb') as rfile:
+                buf = rfile.read()
+            meta, offset = parse_header(buf)
+            n = (len(buf) - offset) // RECORD_DTYPE.itemsize
+            return meta, frombuffer(buf, dtype=RECORD_DTYPE, count=n, offset=offset)
+
+    with open(path, 'rb') as rfile:
+        head = rfile.read(ALIGN)
+        n, = struct.unpack('<I', head[len(MAGIC):len(MAGIC) + 4])
+        head += rfile.read(max(len(MAGIC) + 4 + n - len(head), 0))
+
+    meta, offset = parse_header(head)
+    # a log that is still being written can end with a partial record
+    n = (os.path.getsize(path) - offset) // RECORD_DTYPE.itemsize
+    if not n:
+        return meta, empty(0, dtype=RECORD_DTYPE)
+    return meta, memmap(path, dtype=RECORD_DTYPE, mode=mode, offset=offset, shape=(n,))
+
+
+def find_segments(path):
+    """
+    the files of the log written to `path`, the file itself or its segments in order,
+    compressed or not
+    """
+    if os.path.isfile(path):
+        return [path]
+    stem, ext = os.path.splitext(path)
+    return sorted(glob.glob('{}.[0-9][0-9][0-9][0-9]{}*'.format(stem, ext or EXT)))
+
+
+class BinaryLog(object):
+    """
+    reader for a binary log written by BinaryLogWriter. `path` is the path passed to the
+    writer, segmented logs are found automatically
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.segments = find_segments(path)
+        if not self.segments:
+            raise IOError('No binary log at {}'.format(path))
+
+        self.metadata, first = read_segment(self.segments[0])
+        self._cache = {0: first}
+
+    def __len__(self):
+        return sum(len(self.segment(i)) for i in range(len(self.segments)))
+
+    def segment(self, i):
+        if i not in self._cache:
+            self._cache[i] = read_segment(self.segments[i])[1]
+        return self._cache[i]
+
+    def iter_segments(self):
+        for i in range(len(self.segments)):
+            yield self.segment(i)
+
+    @property
+    def records(self):
+        """
+        all records. a single uncompressed log is returned as the memory map itself
+        """
+        if len(self.segments) == 1:
+            return self.segment(0)
+        return concatenate(list(self.iter_segments()))
+
+
+def csv_to_binary(src, dst, metadata=None, segment_rows=0, compression=None):
+    """
+    convert a wt CSV log (Counter,Time,Rate,TimeStamp,Raw,Temp) to a binary log
+    """
+    cols = loadtxt(src, delimiter=',', skiprows=1, usecols=(0, 1, 2, 4, 5), ndmin=2)
+    stamps = loadtxt(src, delimiter=',', skiprows=1, usecols=(3,), dtype=str, ndmin=1)
+
+    recs = empty(len(cols), dtype=RECORD_DTYPE)
+    recs['counter'] = cols[:, 0]
+    recs['time'] = cols[:, 1]
+    recs['rate'] = cols[:, 2]
+    recs['timestamp'] = fromiter((to_epoch(s) for s in stamps), dtype=float, count=len(stamps))
+    recs['raw'] = cols[:, 3]
+    recs['temp'] = cols[:, 4]
+
+    meta = {'source': os.path.basename(src)}
+    if metadata:
+        meta.update(metadata)
+
+    writer = BinaryLogWriter(dst, meta, segment_rows=segment_rows, compression=compression,
+                             flush_rows=len(recs) + 1)
+    writer.open()
+    step = segment_rows or len(recs)
+    for i in range(0, len(recs), step or 1):
+        writer.write_records(recs[i:i + step])
+    writer.close()
+    return len(recs)
+
+
+def binary_to_csv(src, dst):
+    """
+    convert a binary log to the wt CSV layout
+    """
+    log = BinaryLog(src)
+    n = 0
+    with open(dst, 'w') as wfile:
+        wfile.write('{}\n'.format(','.join(CSV_HEADER)))
+        for recs in log.iter_segments():
+            for r in recs:
+                row = (int(r['counter']), r['time'], r['rate'],
+                       datetime.fromtimestamp(r['timestamp']).isoformat(), r['raw'], r['temp'])
+                wfile.write('{}\n'.format(','.join([str(v) for v in row])))
+            n += len(recs)
+    return n
+
+
+def main():
+    """
+    python -m src.binlog <src> <dst> [segment_rows] [gzip|lzma]
+
+    converts CSV to binary if src ends with .csv, otherwise binary to CSV
+    """
+    import sys
+
+    args = sys.argv[1:]
+    if len(args) < 2:
+        print(main.__doc__)
+        return
+
+    src, dst = args[:2]
+    if src.endswith('.csv'):
+        segment_rows = int(args[2]) if len(args) > 2 else 0
+        compression = args[3] if len(args) > 3 else None
+        n = csv_to_binary(src, dst, segment_rows=segment_rows, compression=compression)
+    else:
+        n = binary_to_csv(src, dst)
+    print('converted {} rows {} -> {}'.format(n, src, dst))
+
+
+if __name__ == '__main__':
+    main()
+# ============= EOF =============================================
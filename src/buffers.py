@@ -0,0 +1,136 @@
+# ===============================================================================
+# Copyright 2019 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+from numpy import empty
+
+
+class SampleStore(object):
+    """
+    column store for plotted samples.
+
+    with window=0 the store grows by doubling its capacity, so appends are amortized O(1).
+    with window=N only the last N samples are kept. the backing array holds 2*N samples and
+    when it fills up the last N are moved to the front, so memory is constant and appends
+    are still amortized O(1). `get` always returns a contiguous view, never a copy
+    """
+
+    def __init__(self, names, window=0, capacity=1024, dtype=float):
+        self.names = tuple(names)
+        self.window = window
+        self.dtype = dtype
+        self._index = {n: i for i, n in enumerate(self.names)}
+
+        if window:
+            capacity = 2 * window
+        self._data = empty((len(self.names), max(capacity, 1)), dtype=dtype)
+
+        # absolute index of the first retained sample and total number of samples appended
+        self.offset = 0
+        self.total = 0
+        self._start = 0
+        self._end = 0
+
+    def __len__(self):
+        return self._end - self._start
+
+    @property
+    def capacity(self):
+        return self._data.shape[1]
+
+    def clear(self):
+        self.offset = 0
+        self.total = 0
+        self._start = 0
+        self._end = 0
+
+    def set_window(self, window):
+        n = len(self)
+        if window:
+            n = min(n, window)
+        data = self._data[:, self._end - n:self._end].copy()
+
+        self.window = window
+        capacity = 2 * window if window else max(2 * n, 1024)
+        self._data = empty((len(self.names), capacity), dtype=self.dtype)
+        self._data[:, :n] = data
+        self.offset = self.total - n
+        self._start = 0
+        self._end = n
+
+    def append(self, *values):
+        if self._end == self.capacity:
+            self._make_room(1)
+
+        self._data[:, self._end] = values
+        self._end += 1
+        self.total += 1
+        self._trim()
+
+    def extend(self, *columns):
+        n = len(columns[0])
+        if not n:
+            return
+
+        if self.window and n > self.window:
+            columns = [c[-self.window:] for c in columns]
+            self.total += n - self.window
+            self.offset += n - self.window
+            n = self.window
+
+        if self._end + n > self.capacity:
+            self._make_room(n)
+
+        for i, c in enumerate(columns):
+            self._data[i, self._end:self._end + n] = c
+        self._end += n
+        self.total += n
+        self._trim()
+
+    def get(self, name):
+        return self._data[self._index[name], self._start:self._end]
+
+    def absolute(self, name, idx):
+        """
+        value of `name` at the absolute sample index `idx`
+        """
+        return self._data[self._index[name], self._start + idx - self.offset]
+
+    # private
+    def _trim(self):
+        if self.window and self._end - self._start > self.window:
+            d = self._end - self._start - self.window
+            self._start += d
+            self.offset += d
+
+    def _make_room(self, n):
+        size = self._end - self._start
+        if self.window:
+            # keep at most window-n samples so that there is space for n new ones
+            keep = min(size, self.window - n) if n < self.window else 0
+            self._data[:, :keep] = self._data[:, self._end - keep:self._end]
+            self.offset += size - keep
+        else:
+            keep = size
+            capacity = self.capacity
+            while capacity < keep + n:
+                capacity *= 2
+            data = empty((len(self.names), capacity), dtype=self.dtype)
+            data[:, :keep] = self._data[:, self._start:self._end]
+            self._data = data
+
+        self._start = 0
+        self._end = keep
+
+# ============= EOF =============================================
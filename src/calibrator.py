@@ -13,27 +13,40 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ===============================================================================
-from traits.api import HasTraits, Float, Int, Array, Button, Instance, List, Property, Directory, Bool, Enum
-from traitsui.api import View, VGroup, UItem, Item, Readonly, HGroup
-from chaco.chaco_plot_editor import ChacoPlotItem
+from traits.api import HasTraits, Float, Int, Array, Button, Instance, List, Property, Directory, Bool, Enum, Str
+from traitsui.api import View, VGroup, UItem, Item, Readonly, HGroup, Handler
 from enable.api import Component, ComponentEditor
+from pyface.timer.do_later import do_after, do_later
 from chaco.api import DataView, ArrayDataSource, ScatterPlot, \
     LinePlot, LinearMapper
-import random
-from datetime import datetime
 import platform
+from concurrent.futures import ThreadPoolExecutor, wait
 import time
 import pyvisa
 import serial
 import os
-from numpy import hstack, linspace, polyval, polyfit, log
-from scipy.optimize import curve_fit
+from numpy import linspace
 
 from src.device import CalibrationDevice
+from src.buffers import SampleStore
+from src.fitting import LogPolynomialFit
+from src.conversion import get_model
+from src.calstore import CalibrationStore, CalibrationSession
+
+
+class CalibratorHandler(Handler):
+    def closed(self, info, is_ok):
+        info.object.close()
 
 
 class Calibrator(HasTraits):
     trigger_button = Button('Trigger')
+    auto_trigger = Bool(False)
+    auto_period = Float(5.0)
+    # duration of the concurrent read and the time between the two readings
+    read_time = Float
+    read_skew = Float
+    save_button = Button('Save Coefficients')
 
     xs = ArrayDataSource
     ys = ArrayDataSource
@@ -42,21 +55,46 @@ class Calibrator(HasTraits):
     fy = ArrayDataSource
 
     plot = Instance(Component)
+    sample_store = Instance(SampleStore, (('x', 'y'),))
     coeffs = List
     coeffs_str = Property(depends_on='coeffs')
+    fit_stats = Str
+    fitter = Instance(LogPolynomialFit)
     root = Directory
     is_air = Bool(True)
+    store = Instance(CalibrationStore)
+    session = Instance(CalibrationSession)
 
     measurement_device = None
     calibration_device = None
+    # callable, True while the main window scans with the measurement device
+    scanning = None
     mode = Enum('Air', 'Water')
 
+    _executor = None
+    _busy = False
+    _next_auto = 0
+    # bumped every time auto trigger is switched, a step of an older chain stops itself
+    _auto_generation = 0
+
     def open(self):
-        if self.measurement_device:
-            self.calibration_device = CalibrationDevice()
-            if self.calibration_device:
-                return True
-                return self.calibration_device.open()
+        md = self.measurement_device
+        if md:
+            if md._handle is None and not md.open():
+                return
+            self.calibration_device = CalibrationDevice(simulate=md.simulate)
+            return self.calibration_device.open()
+
+    def close(self):
+        self.auto_trigger = False
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        cd = self.calibration_device
+        if cd is not None and cd._handle is not None:
+            cd._handle.close()
+            cd._handle = None
+        self._close_session()
 
     def _get_coeffs_str(self):
         ret = ''
@@ -99,53 +137,130 @@ class Calibrator(HasTraits):
         return view
 
     def _trigger(self):
-        y1 = self._get_a()
-        y2 = self._get_b()
-        self._record_point(y1, y2)
+        """
+        read both instruments concurrently off the GUI thread. the point is added when both
+        readings are in. triggers while a read is in flight are ignored
+        """
+        if self._busy:
+            return
+
+        if self._executor is None:
+            # one worker waits on the two readers
+            self._executor = ThreadPoolExecutor(max_workers=3)
+
+        self._busy = True
+        self._executor.submit(self._read_pair)
+
+    def _read_pair(self):
+        try:
+            st = time.time()
+            fa = self._executor.submit(self._timed, self._get_a)
+            fb = self._executor.submit(self._timed, self._get_b)
+            wait((fa, fb))
+            et = time.time()
+            (y1, ta), (y2, tb) = fa.result(), fb.result()
+            # the pair is recorded at the midpoint of the two readings
+            do_later(self._add_point, (ta + tb) / 2., y1, y2, et - st, abs(ta - tb))
+        except BaseException as e:
+            print('failed reading calibration pair, Error:{}'.format(e))
+            self._busy = False
+
+    def _timed(self, read):
+        v = read()
+        return v, time.time()
+
+    def _add_point(self, timestamp, y1, y2, read_time, skew):
+        self._busy = False
+        self.read_time = read_time
+        self.read_skew = skew
+        self._record_point(y1, y2, timestamp)
         self._plot_point(y1, y2)
 
-    def _record_point(self, y1, y2):
-        d = os.path.join(self.root, 'data')
-        p = os.path.join(d, 'cal.{}.csv'.format(datetime.now().isoformat()).replace(':', '_'))
+    def _auto_step(self, generation):
+        if not self.auto_trigger or generation != self._auto_generation:
+            return
+
+        self._trigger()
+        # schedule against a fixed grid so the rate does not drift with read latency
+        now = time.time()
+        self._next_auto = max(self._next_auto + self.auto_period, now)
+        do_after(max(int((self._next_auto - now) * 1000), 1), self._auto_step, generation)
 
-        if not os.path.isdir(d):
-            os.mkdir(d)
+    def _auto_trigger_changed(self, new):
+        # switching off and on before the pending step fires must not start a second chain
+        self._auto_generation += 1
+        if new:
+            self._next_auto = time.time()
+            do_later(self._auto_step, self._auto_generation)
 
-        with open(p, 'w') as wfile:
-            row = [str(y1), str(y2)]
-            line = ','.join(row)
-            wfile.write('{}\n'.format(line))
+    def _record_point(self, y1, y2, timestamp=None):
+        if self.session is None:
+            md, cd = self.measurement_device, self.calibration_device
+            self.session = self.store.new_session(self.mode,
+                                                  md.device_id if md else '',
+                                                  cd.device_id if cd else '')
+        self.session.add_point(y1, y2, timestamp)
+
+    def _save_coefficients(self):
+        session = self.session
+        if session is not None and self.coeffs:
+            session.set_coefficients(self.coeffs)
+            self.store.update(session)
+
+    def _close_session(self):
+        if self.session is not None:
+            self._save_coefficients()
+            self.session.close()
+            self.store.update(self.session)
+            self.session = None
+
+    def _store_default(self):
+        return CalibrationStore(os.path.join(self.root, 'data', 'calibrations'))
 
     def _plot_point(self, y1, y2):
-        self.xs.set_data(hstack((self.xs.get_data(), [y1])))
-        self.ys.set_data(hstack((self.ys.get_data(), [y2])))
+        store = self.sample_store
+        store.append(y1, y2)
+        self.xs.set_data(store.get('x'))
+        self.ys.set_data(store.get('y'))
 
         # fit data
+        self.fitter.add_point(y1, y2)
         self._fit()
 
     def _fit(self):
-        xs = self.xs.get_data()
-        if len(xs) > 2:
-            ys = self.ys.get_data()
-            fx = linspace(min(xs) * 0.9, max(xs) * 1.1)
-            # coeffs = polyfit(xs, ys, 1)
-            # self.coeffs = list(coeffs
-            if self.mode == 'Water':
-                def func(x, *p):
-                    return p[0] + (p[1] * log(x)) + (p[2] * log(x) ** 2) + (p[3] * log(x) ** 3)
-            else:
-                def func(x, a, b):
-                    return a + (b * log(x))
-
-            coeffs, _ = curve_fit(func, xs, ys)
-            self.coeffs = list(coeffs)
-            fy = func(fx, *coeffs)
+        fit = self.fitter
+        if fit.n > fit.nparams:
+            coeffs = fit.coefficients
+            self.coeffs = coeffs
+            self.fit_stats = 'n={} rmse={:0.4f} r2={:0.6f}'.format(fit.n, fit.rmse, fit.r2)
+
+            fx = linspace(fit.xmin * 0.9, fit.xmax * 1.1)
+            fy = get_model(self.mode, coeffs).evaluate(fx)
             self.fx.set_data(fx)
             self.fy.set_data(fy)
 
+    def _make_fitter(self):
+        return LogPolynomialFit(3 if self.mode == 'Water' else 1)
+
+    def _fitter_default(self):
+        return self._make_fitter()
+
+    def _mode_changed(self):
+        # a session records a single mode. the points so far are refit in the new mode and
+        # the next point starts a new session
+        self._close_session()
+
+        fit = self._make_fitter()
+        store = self.sample_store
+        fit.add_points(store.get('x'), store.get('y'))
+        self.fitter = fit
+        self._fit()
+
     def _get_a(self):
-        return random.random()
-        return self.measurement_device.get_measurement()
+        # the acquisition worker owns the VISA handle while a scan runs
+        if self.scanning and self.scanning():
+            raise RuntimeError('the measurement device is in use, stop the scan to calibrate')
+        return self.measurement_device.read()
 
     def _get_b(self):
         return self.calibration_device.get_measurement()
@@ -153,13 +268,23 @@ class Calibrator(HasTraits):
     def _trigger_button_fired(self):
         self._trigger()
 
+    def _save_button_fired(self):
+        self._save_coefficients()
+
     def traits_view(self):
-        v = View(VGroup(UItem('trigger_button'),
+        v = View(VGroup(HGroup(UItem('trigger_button', enabled_when='not auto_trigger'),
+                               Item('auto_trigger', label='Auto'),
+                               Item('auto_period', label='Period (s)'),
+                               Readonly('read_time', format_str='%0.3f', label='Read (s)'),
+                               Readonly('read_skew', format_str='%0.3f', label='Skew (s)'),
+                               UItem('save_button', enabled_when='session')),
                         HGroup(UItem('mode'),
                                Readonly('coeffs_str',
-                                        label='Coefficients')),
+                                        label='Coefficients'),
+                               Readonly('fit_stats', show_label=False)),
                         UItem('plot', editor=ComponentEditor())),
                  title='Calibtator',
+                 handler=CalibratorHandler(),
                  resizable=True
                  )
         return v
@@ -0,0 +1,284 @@
+# ===============================================================================
+# Copyright 2019 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""
+calibration sessions.
+
+each session is one appendable CSV file
+
+    # mode: Air
+    # measurement_device: GPIB0::22::INSTR
+    # calibration_device: GPIB::23:INSTR
+    # started: 2019-11-20T10:11:12
+    timestamp,measured,reference
+    1574269872.1,101234.5,21.02
+    ...
+    # coefficients: 573.6,-39.7
+
+the last coefficients line is the current fit. index.yaml in the same directory lists every
+session with its mode, devices, number of points and coefficients so past sessions can be
+found without opening their files. session files are named session.<started>.csv, older
+versions wrote one cal.<timestamp>.csv file per point, see `import_legacy`
+
+    python -m src.calstore list [--mode Air]
+    python -m src.calstore refit [<id> ...] [--mode Water] [--pooled]
+    python -m src.calstore import [~/WellTempLogger/data] [--mode Air]
+"""
+import argparse
+import glob
+import os
+import time
+from datetime import datetime
+
+import yaml
+from numpy import loadtxt, array
+
+from src.logwriter import LogWriter
+from src.fitting import LogPolynomialFit
+
+COLUMNS = ['timestamp', 'measured', 'reference']
+DEGREES = {'Air': 1, 'Water': 3}
+SESSION_PREFIX = 'session.'
+LEGACY_PREFIX = 'cal.'
+DEFAULT_ROOT = os.path.join(os.path.expanduser('~'), 'WellTempLogger', 'data', 'calibrations')
+
+
+class CalibrationSession(object):
+    def __init__(self, path, mode, measurement_device='', calibration_device='', started=None):
+        self.path = path
+        self.mode = mode
+        self.measurement_device = measurement_device
+        self.calibration_device = calibration_device
+        self.started = started or datetime.now().isoformat()
+        self.npoints = 0
+        self.coefficients = []
+        self._writer = None
+
+    @property
+    def id(self):
+        return os.path.splitext(os.path.basename(self.path))[0]
+
+    def open(self):
+        self._writer = LogWriter(self.path, flush_rows=1)
+        self._writer.open()
+        for k in ('mode', 'measurement_device', 'calibration_device', 'started'):
+            self._writer.write_row(['# {}: {}'.format(k, getattr(self, k))])
+        self._writer.write_row(COLUMNS)
+        self._writer.flush()
+
+    def add_point(self, measured, reference, timestamp=None):
+        self._writer.write_row([timestamp or time.time(), measured, reference])
+        self.npoints += 1
+
+    def set_coefficients(self, coefficients):
+        self.coefficients = [float(c) for c in coefficients]
+        if self._writer:
+            self._writer.write_row(['# coefficients: {}'.format(','.join([str(c) for c in self.coefficients]))])
+
+    def close(self):
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+
+    def to_dict(self):
+        return {'id': self.id,
+                'path': os.path.basename(self.path),
+                'mode': self.mode,
+                'measurement_device': self.measurement_device,
+                'calibration_device': self.calibration_device,
+                'started': self.started,
+                'npoints': self.npoints,
+                'coefficients': self.coefficients}
+
+
+class CalibrationStore(object):
+    def __init__(self, root):
+        self.root = root
+        self.index_path = os.path.join(root, 'index.yaml')
+        self._index = None
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = []
+            if os.path.isfile(self.index_path):
+                with open(self.index_path, 'r') as rfile:
+                    self._index = yaml.safe_load(rfile) or []
+        return self._index
+
+    def new_session(self, mode, measurement_device='', calibration_device=''):
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root)
+
+        uid = datetime.now().isoformat().replace(':', '_')
+        p = os.path.join(self.root, '{}{}.csv'.format(SESSION_PREFIX, uid))
+        session = CalibrationSession(p, mode, measurement_device, calibration_device)
+        session.open()
+        self.update(session)
+        return session
+
+    def update(self, session):
+        entry = session.to_dict()
+        idx = self.index
+        for i, e in enumerate(idx):
+            if e['id'] == entry['id']:
+                idx[i] = entry
+                break
+        else:
+            idx.append(entry)
+        self._save_index()
+
+    def sessions(self, mode=None, measurement_device=None):
+        return [e for e in self.index
+                if (mode is None or e['mode'] == mode) and
+                (measurement_device is None or e['measurement_device'] == measurement_device)]
+
+    def load(self, entry):
+        """
+        returns timestamps, measured, reference arrays for an index entry
+        """
+        p = os.path.join(self.root, entry['path'])
+        data = loadtxt(p, delimiter=',', comments='#', skiprows=5, ndmin=2)
+        if not len(data):
+            return array([]), array([]), array([])
+        return data[:, 0], data[:, 1], data[:, 2]
+
+    def refit(self, entries, mode=None, pooled=False):
+        """
+        refit sessions. with pooled=True all points of `entries` are fitted together and
+        a single list of coefficients is returned, otherwise a {id: coefficients} dict.
+        per-session refits are written back to the index.
+
+        a pooled fit needs one Air or Water mode. raises ValueError for a mix of modes or for
+        sessions of unknown mode, e.g. imported legacy files, unless `mode` names it
+        """
+        if pooled:
+            modes = sorted(set(e['mode'] for e in entries))
+            if mode is None:
+                if len(modes) != 1:
+                    raise ValueError('cannot pool sessions of different modes: {}'.format(', '.join(modes)))
+                mode = modes[0]
+            elif any(m in DEGREES and m != mode for m in modes):
+                raise ValueError('cannot pool {} with {} sessions'.format(mode, ', '.join(modes)))
+
+            if mode not in DEGREES:
+                raise ValueError('cannot fit sessions of mode {}, pass mode=Air or mode=Water'.format(mode))
+
+            fit = LogPolynomialFit(DEGREES[mode])
+            for e in entries:
+                _, xs, ys = self.load(e)
+                fit.add_points(xs, ys)
+            return fit.coefficients
+
+        ret = {}
+        for e in entries:
+            m = mode or e['mode']
+            if m not in DEGREES:
+                continue
+            fit = LogPolynomialFit(DEGREES[m])
+            _, xs, ys = self.load(e)
+            fit.add_points(xs, ys)
+            if fit.n > fit.nparams:
+                e['coefficients'] = ret[e['id']] = fit.coefficients
+                e['npoints'] = fit.n
+
+        self._save_index()
+        return ret
+
+    def import_legacy(self, directory, mode='Unknown'):
+        """
+        collect the one-point-per-file cal.<timestamp>.csv files written by older versions
+        into a single session. sessions of this store are never imported, including those
+        written as cal.<started>.csv before sessions had their own prefix
+        """
+        own = set(os.path.abspath(os.path.join(self.root, e['path'])) for e in self.index)
+        ps = [p for p in sorted(glob.glob(os.path.join(directory, '{}*.csv'.format(LEGACY_PREFIX))))
+              if os.path.abspath(p) not in own]
+        if not ps:
+            return
+
+        session = self.new_session(mode)
+        for p in ps:
+            ts = os.path.getmtime(p)
+            with open(p, 'r') as rfile:
+                for line in rfile:
+                    line = line.strip()
+                    if line:
+                        y1, y2 = line.split(',')[:2]
+                        session.add_point(float(y1), float(y2), timestamp=ts)
+        session.close()
+        self.update(session)
+        return session
+
+    # private
+    def _save_index(self):
+        tmp = '{}.tmp'.format(self.index_path)
+        with open(tmp, 'w') as wfile:
+            yaml.safe_dump(self.index, wfile, default_flow_style=False)
+        os.replace(tmp, self.index_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='list, refit and import calibration sessions')
+    parser.add_argument('--root', default=DEFAULT_ROOT, help='calibration store. defaults to {}'.format(DEFAULT_ROOT))
+    sub = parser.add_subparsers(dest='command')
+
+    p = sub.add_parser('list', help='list the sessions')
+    p.add_argument('--mode', choices=sorted(DEGREES) + ['Unknown'])
+
+    p = sub.add_parser('refit', help='refit sessions and store the coefficients, or fit them together')
+    p.add_argument('ids', nargs='*', help='session ids. default all sessions of --mode')
+    p.add_argument('--mode', choices=sorted(DEGREES), help='fit as this mode instead of the recorded one')
+    p.add_argument('--pooled', action='store_true', help='fit all points together and print the coefficients')
+
+    p = sub.add_parser('import', help='collect the cal.<timestamp>.csv files of older versions into a session')
+    p.add_argument('directory', nargs='?', default=os.path.dirname(DEFAULT_ROOT))
+    p.add_argument('--mode', choices=sorted(DEGREES), default='Unknown')
+
+    args = parser.parse_args()
+    store = CalibrationStore(args.root)
+    if args.command == 'refit':
+        entries = store.sessions(args.mode if not args.ids else None)
+        if args.ids:
+            entries = [e for e in entries if e['id'] in args.ids]
+        if not entries:
+            print('no sessions to refit')
+            return
+        try:
+            ret = store.refit(entries, args.mode, args.pooled)
+        except ValueError as e:
+            parser.exit(1, 'Error: {}\n'.format(e))
+        if args.pooled:
+            print('pooled {} sessions: {}'.format(len(entries), ','.join([str(c) for c in ret])))
+        else:
+            for k, cs in ret.items():
+                print('{:<40s}{}'.format(k, ','.join([str(c) for c in cs])))
+    elif args.command == 'import':
+        session = store.import_legacy(args.directory, args.mode)
+        if session is None:
+            print('no cal.*.csv files in {}'.format(args.directory))
+        else:
+            print('imported {} points into {}'.format(session.npoints, session.id))
+    else:
+        fmt = '{:<40s}{:<9s}{:>8s}  {}'
+        print(fmt.format('id', 'mode', 'points', 'coefficients'))
+        for e in store.sessions(getattr(args, 'mode', None)):
+            print(fmt.format(e['id'], e['mode'], str(e['npoints']), ','.join([str(c) for c in e['coefficients']])))
+
+
+if __name__ == '__main__':
+    main()
+
+# ============= EOF =============================================
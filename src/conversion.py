@@ -0,0 +1,97 @@
+# ===============================================================================
+# Copyright 2019 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+from numpy import asarray, log, ndim
+
+AIR_COEFFICIENTS = (573.6081692, -39.74119491)
+WATER_COEFFICIENTS = (1233.19043, -192.56687, 10.78172, -0.24088)
+
+
+class CalibrationModel(object):
+    """
+    temperature as a polynomial in ln(resistance)
+
+        T = c0 + c1*ln(R) + c2*ln(R)**2 + ...
+
+    coefficients are in ascending order. calling the model accepts a scalar or an array
+    and evaluates the whole array in one pass
+    """
+    name = ''
+    default_coefficients = ()
+
+    def __init__(self, coefficients=None):
+        if coefficients is None:
+            coefficients = self.default_coefficients
+        self.coefficients = tuple(float(c) for c in coefficients)
+
+    def __call__(self, values):
+        return self.evaluate(values)
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, ','.join([str(c) for c in self.coefficients]))
+
+    @property
+    def degree(self):
+        return len(self.coefficients) - 1
+
+    def evaluate(self, values):
+        x = log(asarray(values, dtype=float))
+
+        # horner
+        cs = self.coefficients
+        y = cs[-1]
+        for c in cs[-2::-1]:
+            y = y * x + c
+
+        if not ndim(y):
+            y = float(y)
+        return y
+
+
+class AirModel(CalibrationModel):
+    name = 'Air'
+    default_coefficients = AIR_COEFFICIENTS
+
+
+class WaterModel(CalibrationModel):
+    name = 'Water'
+    default_coefficients = WATER_COEFFICIENTS
+
+
+MODELS = {'Air': AirModel, 'Water': WaterModel}
+
+
+def get_model(name, coefficients=None):
+    """
+    returns a CalibrationModel for `name` ('Air' or 'Water', case insensitive). uses the
+    default coefficients unless `coefficients` are given
+    """
+    for k, v in MODELS.items():
+        if k.lower() == name.lower():
+            return v(coefficients)
+
+    raise ValueError('Unknown calibration model "{}". Available={}'.format(name, ','.join(MODELS)))
+
+
+def convert(values, model):
+    """
+    convert resistance values to temperature with `model`, a CalibrationModel or a model
+    name
+    """
+    if not isinstance(model, CalibrationModel):
+        model = get_model(model)
+    return model(values)
+
+# ============= EOF =============================================
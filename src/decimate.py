@@ -0,0 +1,254 @@
+# ===============================================================================
+# Copyright 2019 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+from numpy import arange, argmin, argmax, array, asarray, column_stack, concatenate, empty, flatnonzero, \
+    lexsort, diff, r_, minimum, maximum, ceil, abs as nabs
+
+
+def minmax(x, y, nbins):
+    """
+    min/max envelope. returns at most 2*nbins points, the min and max of each bin in
+    index order
+    """
+    x = asarray(x)
+    y = asarray(y)
+    n = len(y)
+    if n <= 2 * nbins:
+        return x, y
+
+    width = int(ceil(n / float(nbins)))
+    m = n // width
+    full = y[:m * width].reshape(m, width)
+    offsets = arange(m) * width
+    imin = offsets + argmin(full, axis=1)
+    imax = offsets + argmax(full, axis=1)
+    if m * width < n:
+        tail = y[m * width:]
+        imin = r_[imin, m * width + argmin(tail)]
+        imax = r_[imax, m * width + argmax(tail)]
+
+    idx = _interleave(imin, imax)
+    return x[idx], y[idx]
+
+
+def lttb(x, y, threshold):
+    """
+    largest-triangle-three-buckets downsampling. keeps the first and last point and the
+    point from each bucket that forms the largest triangle with its neighbours
+    """
+    x = asarray(x, dtype=float)
+    y = asarray(y, dtype=float)
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return x, y
+
+    edges = (arange(threshold - 1) * (n - 2) / float(threshold - 2)).astype(int) + 1
+    edges[-1] = n - 1
+
+    idx = empty(threshold, dtype=int)
+    idx[0] = 0
+    idx[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        s, e = edges[i], edges[i + 1]
+        ns = e
+        ne = edges[i + 2] if i + 2 < len(edges) else n
+        if ne <= ns:
+            ne = ns + 1
+        cx = x[ns:ne].mean()
+        cy = y[ns:ne].mean()
+
+        ax, ay = x[a], y[a]
+        areas = nabs((ax - cx) * (y[s:e] - ay) - (ax - x[s:e]) * (cy - ay))
+        a = s + argmax(areas)
+        idx[i + 1] = a
+
+    return x[idx], y[idx]
+
+
+def _interleave(imin, imax):
+    pairs = column_stack((minimum(imin, imax), maximum(imin, imax)))
+    return pairs.ravel()
+
+
+METHODS = {'minmax': minmax, 'lttb': lttb}
+
+
+class MinMaxEnvelope(object):
+    """
+    incremental min/max envelope over one column of a SampleStore.
+
+    buckets span a fixed number of samples keyed by absolute sample index. `update` only
+    folds in the samples appended since the previous call and when there are more than
+    2*target buckets neighbouring buckets are merged and the bucket width doubles, so the
+    cost per update does not depend on the number of samples in the store
+    """
+
+    def __init__(self, store, xname, yname, target=1000):
+        self.store = store
+        self.xname = xname
+        self.yname = yname
+        self.target = target
+        self.reset()
+
+    def reset(self):
+        self.width = 1
+        self._seen = 0
+        self._offset = 0
+        self._k = array([], dtype=int)
+        self._imin = array([], dtype=int)
+        self._imax = array([], dtype=int)
+        self._vmin = array([])
+        self._vmax = array([])
+
+    def __len__(self):
+        return len(self._k)
+
+    def update(self):
+        store = self.store
+        total = store.total
+        if total < self._seen:
+            self.reset()
+
+        if total == self._seen and store.offset == self._offset:
+            return False
+
+        if total > self._seen:
+            first = max(self._seen, store.offset)
+            ys = store.get(self.yname)[first - store.offset:]
+            self._add(first, ys)
+            self._seen = total
+
+        self._offset = store.offset
+        self._drop(store.offset)
+        while len(self._k) > 2 * self.target:
+            self._merge()
+        return True
+
+    def points(self):
+        """
+        returns the envelope as x, y arrays
+        """
+        store = self.store
+        if not len(self._k):
+            return array([]), array([])
+
+        idx = _interleave(self._imin, self._imax) - store.offset
+        # adjacent buckets can share a point when min and max are the same sample
+        keep = r_[True, diff(idx) != 0]
+        idx = idx[keep]
+        return store.get(self.xname)[idx], store.get(self.yname)[idx]
+
+    # private
+    def _add(self, start, ys):
+        w = self.width
+        n = len(ys)
+        ks, imins, imaxs = [], [], []
+
+        # finish the current partial bucket
+        i = 0
+        head = min(n, (w - start % w) % w)
+        if head:
+            ks.append([start // w])
+            imins.append([start + argmin(ys[:head])])
+            imaxs.append([start + argmax(ys[:head])])
+            i = head
+
+        m = (n - i) // w
+        if m:
+            full = ys[i:i + m * w].reshape(m, w)
+            offsets = start + i + arange(m) * w
+            ks.append(offsets // w)
+            imins.append(offsets + argmin(full, axis=1))
+            imaxs.append(offsets + argmax(full, axis=1))
+            i += m * w
+
+        if i < n:
+            ks.append([(start + i) // w])
+            imins.append([start + i + argmin(ys[i:])])
+            imaxs.append([start + i + argmax(ys[i:])])
+
+        ks = concatenate(ks).astype(int)
+        imins = concatenate(imins).astype(int)
+        imaxs = concatenate(imaxs).astype(int)
+
+        offset = self.store.offset
+        column = self.store.get(self.yname)
+        vmins = column[imins - offset]
+        vmaxs = column[imaxs - offset]
+
+        if len(self._k) and self._k[-1] == ks[0]:
+            # merge with the last stored bucket
+            if self._vmin[-1] <= vmins[0]:
+                imins[0], vmins[0] = self._imin[-1], self._vmin[-1]
+            if self._vmax[-1] >= vmaxs[0]:
+                imaxs[0], vmaxs[0] = self._imax[-1], self._vmax[-1]
+            self._truncate(len(self._k) - 1)
+
+        self._k = concatenate((self._k, ks))
+        self._imin = concatenate((self._imin, imins))
+        self._imax = concatenate((self._imax, imaxs))
+        self._vmin = concatenate((self._vmin, vmins))
+        self._vmax = concatenate((self._vmax, vmaxs))
+
+    def _truncate(self, n):
+        self._k = self._k[:n]
+        self._imin = self._imin[:n]
+        self._imax = self._imax[:n]
+        self._vmin = self._vmin[:n]
+        self._vmax = self._vmax[:n]
+
+    def _drop(self, offset):
+        if not len(self._k):
+            return
+
+        w = self.width
+        keep = (self._k + 1) * w > offset
+        if not keep.all():
+            self._k = self._k[keep]
+            self._imin = self._imin[keep]
+            self._imax = self._imax[keep]
+            self._vmin = self._vmin[keep]
+            self._vmax = self._vmax[keep]
+
+        # the oldest bucket may be partially outside the store
+        if len(self._k) and (self._imin[0] < offset or self._imax[0] < offset):
+            end = min((self._k[0] + 1) * w, self.store.total)
+            ys = self.store.get(self.yname)[:end - offset]
+            self._imin[0] = offset + argmin(ys)
+            self._imax[0] = offset + argmax(ys)
+            self._vmin[0] = ys.min()
+            self._vmax[0] = ys.max()
+
+    def _merge(self):
+        k = self._k // 2
+        starts = r_[0, flatnonzero(diff(k)) + 1]
+
+        order = lexsort((self._vmin, k))
+        first = r_[True, diff(k[order]) != 0]
+        sel = order[first]
+        imin, vmin = self._imin[sel], self._vmin[sel]
+
+        order = lexsort((-self._vmax, k))
+        first = r_[True, diff(k[order]) != 0]
+        sel = order[first]
+        imax, vmax = self._imax[sel], self._vmax[sel]
+
+        self._k = k[starts]
+        self._imin, self._vmin = imin, vmin
+        self._imax, self._vmax = imax, vmax
+        self.width *= 2
+
+# ============= EOF =============================================
@@ -0,0 +1,207 @@
+# ===============================================================================
+# Copyright 2019 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+from math import sqrt
+
+from numpy import zeros, full, inf, nan, arange, sqrt as asqrt, where, column_stack, savetxt, asarray, bincount, \
+    minimum, maximum, concatenate, diff
+
+COLUMNS = ('depth', 'count', 'mean', 'std', 'min', 'max', 'gradient', 'speed')
+
+
+class DepthProfile(object):
+    """
+    temperature profile binned by depth, updated in O(1) per sample.
+
+    depth is counter * depth_per_trigger. each bin keeps count, mean and M2 (Welford),
+    min and max of the temperature and the mean descent speed. the gradient dT/dz between
+    a bin and the one above it is updated whenever either mean changes
+    """
+
+    def __init__(self, bin_size=1.0, depth_per_trigger=1.0, capacity=256):
+        self.bin_size = float(bin_size)
+        self.depth_per_trigger = float(depth_per_trigger)
+        self._capacity = capacity
+        self.reset()
+
+    def reset(self):
+        n = self._capacity
+        self.count = zeros(n, dtype=int)
+        self.mean = zeros(n)
+        self.m2 = zeros(n)
+        self.min = full(n, inf)
+        self.max = full(n, -inf)
+        self.gradient = full(n, nan)
+        self.speed_sum = zeros(n)
+        self.speed_count = zeros(n, dtype=int)
+
+        self.nbins = 0
+        self.samples = 0
+        self.speed = 0
+        self.version = 0
+        self._last = None
+
+    def add(self, counter, t, temp):
+        """
+        counter is the trigger count, t the time (s) of the trigger
+        """
+        depth = counter * self.depth_per_trigger
+        i = int(depth // self.bin_size)
+        if i < 0:
+            return
+        if i >= len(self.count):
+            self._grow(i + 1)
+        if i >= self.nbins:
+            self.nbins = i + 1
+
+        n = self.count[i] + 1
+        self.count[i] = n
+        d = temp - self.mean[i]
+        self.mean[i] += d / n
+        self.m2[i] += d * (temp - self.mean[i])
+        if temp < self.min[i]:
+            self.min[i] = temp
+        if temp > self.max[i]:
+            self.max[i] = temp
+
+        if i > 0 and self.count[i - 1]:
+            self.gradient[i] = (self.mean[i] - self.mean[i - 1]) / self.bin_size
+        if i + 1 < self.nbins and self.count[i + 1]:
+            self.gradient[i + 1] = (self.mean[i + 1] - self.mean[i]) / self.bin_size
+
+        # descent speed from the interval between consecutive triggers
+        if self._last is not None:
+            lc, lt = self._last
+            dt = t - lt
+            if dt > 0:
+                self.speed = (counter - lc) * self.depth_per_trigger / dt
+                self.speed_sum[i] += self.speed
+                self.speed_count[i] += 1
+        self._last = counter, t
+
+        self.samples += 1
+        self.version += 1
+
+    def extend(self, counters, ts, temps):
+        """
+        add arrays of samples at once. per bin statistics of the block are merged into the
+        running ones (Chan et al.) so the result matches adding the samples one by one
+        """
+        counters = asarray(counters)
+        ts = asarray(ts, dtype=float)
+        temps = asarray(temps, dtype=float)
+        if not len(counters):
+            return
+
+        depth = counters * self.depth_per_trigger
+        bins = (depth // self.bin_size).astype(int)
+        keep = bins >= 0
+        counters, ts, temps, bins = counters[keep], ts[keep], temps[keep], bins[keep]
+        if not len(bins):
+            return
+
+        n = bins.max() + 1
+        if n > len(self.count):
+            self._grow(n)
+        self.nbins = max(self.nbins, n)
+
+        nb = bincount(bins, minlength=n)
+        sb = bincount(bins, temps, minlength=n)
+        hit = nb > 0
+        mb = where(hit, sb / nb.clip(1), 0)
+        m2b = bincount(bins, (temps - mb[bins]) ** 2, minlength=n)
+
+        na = self.count[:n]
+        tot = na + nb
+        delta = mb - self.mean[:n]
+        self.mean[:n] = where(hit, self.mean[:n] + delta * nb / tot.clip(1), self.mean[:n])
+        self.m2[:n] += where(hit, m2b + delta ** 2 * na * nb / tot.clip(1), 0)
+        self.count[:n] = tot
+
+        mn = full(n, inf)
+        mx = full(n, -inf)
+        minimum.at(mn, bins, temps)
+        maximum.at(mx, bins, temps)
+        self.min[:n] = minimum(self.min[:n], mn)
+        self.max[:n] = maximum(self.max[:n], mx)
+
+        # speeds between consecutive samples, including the last sample of the previous call
+        pc = concatenate(([self._last[0]], counters)) if self._last else counters
+        pt = concatenate(([self._last[1]], ts)) if self._last else ts
+        dt = diff(pt)
+        if len(dt):
+            ok = dt > 0
+            sp = (diff(pc) * self.depth_per_trigger)[ok] / dt[ok]
+            sbins = bins[-len(dt):][ok]
+            self.speed_sum[:n] += bincount(sbins, sp, minlength=n)
+            self.speed_count[:n] += bincount(sbins, minlength=n)
+            if len(sp):
+                self.speed = sp[-1]
+
+        m = self.nbins
+        c = self.count[:m]
+        g = full(m, nan)
+        g[1:] = where((c[1:] > 0) & (c[:-1] > 0), diff(self.mean[:m]) / self.bin_size, nan)
+        self.gradient[:m] = g
+
+        self._last = counters[-1], ts[-1]
+        self.samples += len(bins)
+        self.version += 1
+
+    def std(self, i):
+        n = self.count[i]
+        return sqrt(self.m2[i] / (n - 1)) if n > 1 else 0
+
+    def table(self):
+        """
+        populated bins as an array with COLUMNS
+        """
+        n = self.nbins
+        count = self.count[:n]
+        idx = count > 0
+        depth = (arange(n) + 0.5) * self.bin_size
+        std = asqrt(where(count > 1, self.m2[:n] / (count - 1).clip(1), 0))
+        sc = self.speed_count[:n]
+        speed = where(sc > 0, self.speed_sum[:n] / sc.clip(1), nan)
+        t = column_stack((depth, count, self.mean[:n], std, self.min[:n], self.max[:n],
+                          self.gradient[:n], speed))
+        return t[idx]
+
+    def export(self, path):
+        savetxt(path, self.table(), delimiter=',', header=','.join(COLUMNS), comments='',
+                fmt=('%0.3f', '%d', '%0.5f', '%0.5f', '%0.5f', '%0.5f', '%0.6f', '%0.4f'))
+        return path
+
+    # private
+    def _grow(self, n):
+        size = len(self.count)
+        while size < n:
+            size *= 2
+
+        def grow(a, fill):
+            b = full(size, fill, dtype=a.dtype)
+            b[:len(a)] = a
+            return b
+
+        self.count = grow(self.count, 0)
+        self.mean = grow(self.mean, 0)
+        self.m2 = grow(self.m2, 0)
+        self.min = grow(self.min, inf)
+        self.max = grow(self.max, -inf)
+        self.gradient = grow(self.gradient, nan)
+        self.speed_sum = grow(self.speed_sum, 0)
+        self.speed_count = grow(self.speed_count, 0)
+
+# ============= EOF =============================================
@@ -13,15 +13,37 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ===============================================================================
-from traits.api import HasTraits, Float, Int, Bool
-from pyface.api import warning
+from traits.api import HasTraits, Float, Int, Bool, Enum, Instance
+import sys
 import random
-from datetime import datetime
 import platform
 import time
 import pyvisa
 import serial
-import math
+from numpy import array
+
+from src.trigger import make_trigger, PulseTrainTrigger
+from src.conversion import CalibrationModel, AirModel, WaterModel
+from src.simulation import SimulatedDMM
+from src.records import make_sample
+
+# SCPI error codes, the start of a SYST:ERR? reply
+UNDEFINED_HEADER = '-113'
+TRIGGER_IGNORED = '-211'
+QUEUE_OVERFLOW = '-350'
+ERROR_QUEUE = 20
+
+
+def warning(parent, message):
+    """
+    show a warning dialog when running under the GUI, otherwise print it. pyface is only
+    imported if the application already loaded it so headless use never pulls in a toolkit
+    """
+    if 'pyface' in sys.modules:
+        from pyface.api import warning as _warning
+        _warning(parent, message)
+    else:
+        print('Warning: {}'.format(message))
 
 
 class Device(HasTraits):
@@ -33,6 +55,12 @@ class Device(HasTraits):
 
 class SignalDevice(Device):
     period = Float(0.01, auto_set=False, enter_set=True)
+    trigger_backend = Enum('auto', 'modem', 'poll', 'simulate')
+    # pulse train used by the simulate backend
+    sim_rate = Float(10.)
+    sim_jitter = Float(0.)
+
+    _trigger = None
 
     def __init__(self):
         if platform.system == 'Windows':
@@ -40,24 +68,82 @@ class SignalDevice(Device):
         else:
             self.device_id = '/dev/tty.UC-232A'
 
+    @property
+    def edges(self):
+        return self._trigger.edges if self._trigger else 0
+
+    @property
+    def missed(self):
+        return self._trigger.missed if self._trigger else 0
+
+    @property
+    def polling(self):
+        return hasattr(self._trigger, 'period')
+
+    @property
+    def timestamp(self):
+        return self._trigger.timestamp if self._trigger else time.time()
+
     def open(self):
+        if self.trigger_backend == 'simulate':
+            self._trigger = PulseTrainTrigger(self.sim_rate, self.sim_jitter)
+            return True
+
         try:
             self._handle = serial.Serial(self.device_id)
-            return True
         except serial.SerialException:
             warning(None, 'Triggering device {} not available. Please check connections'.format(self.device_id))
+            return
 
-    def waitfor(self):
+        self._trigger = make_trigger(self._handle, self.trigger_backend, self.period)
+        return True
+
+    def close(self):
+        if self._trigger:
+            self._trigger.close()
+            self._trigger = None
         if self._handle:
-            while 1:
-                if self._handle.dsr:
-                    return True
+            self._handle.close()
+            self._handle = None
+
+    def reset(self):
+        if self._trigger:
+            self._trigger.reset()
+
+    def waitfor(self, timeout=None):
+        if self._trigger:
+            return self._trigger.wait(timeout)
 
-                time.sleep(self.period)
+    def connect(self, callback):
+        """
+        call `callback` on every simulated trigger pulse, e.g. the simulated multimeter's
+        `trigger`. ignored for hardware triggers
+        """
+        if hasattr(self._trigger, 'connect'):
+            self._trigger.connect(callback)
+
+    def _sim_rate_changed(self, new):
+        if isinstance(self._trigger, PulseTrainTrigger):
+            self._trigger.rate = new
+
+    def _sim_jitter_changed(self, new):
+        if isinstance(self._trigger, PulseTrainTrigger):
+            self._trigger.jitter = new
+
+    def _period_changed(self, new):
+        if self._trigger is not None and hasattr(self._trigger, 'period'):
+            self._trigger.period = new
 
 
 class VisaDevice(Device):
+    simulate = Bool(False)
+
     def open(self):
+        if self.simulate:
+            self._handle = self._make_simulator()
+            self._configure()
+            return True
+
         rm = pyvisa.ResourceManager()
         res = rm.list_resources()
         if self.device_id not in res:
@@ -73,14 +159,30 @@ class VisaDevice(Device):
     def _configure(self):
         pass
 
+    def _make_simulator(self):
+        raise NotImplementedError
+
 
 class MeasurementDevice(VisaDevice):
     counter = 0
     starttime = 0
     device_id = 'GPIB0::22::INSTR'
-    npoints = Int(10)
+    # integration time in power line cycles, SENSE:FRES:NPLC
+    npoints = Float(10)
     use_air_calibration = Bool(True)
-    rate = Float
+    calibration_model = Instance(CalibrationModel)
+
+    # Batch arms the multimeter for batch_size externally triggered readings and fetches
+    # them from reading memory in one transfer
+    acquisition_mode = Enum('Single', 'Batch')
+    batch_size = Int(50)
+
+    # REAL64 transfers readings as IEEE 754 doubles instead of ASCII text
+    data_format = Enum('ASCII', 'REAL64')
+
+    # whether the meter knows the external trigger commands, probed in _configure
+    supports_batch = True
+
     def init(self):
         if not self.counter:
             self.starttime = time.time()
@@ -91,37 +193,169 @@ class MeasurementDevice(VisaDevice):
 
     def _configure(self):
         self._handle.write('CONF:FRES 1MOHM, 0.000001MOHM')
-        self._handle.write('SENSE:FRES:NPLC {}'.format(self.npoints))
+        self._handle.write('SENSE:FRES:NPLC {:g}'.format(self.npoints))
+        self._configure_format()
+        self._probe_batch()
+
+    def _probe_batch(self):
+        # the immediate trigger settings are harmless to send, a meter without the trigger
+        # subsystem answers Undefined header
+        self._handle.write('TRIG:SOUR IMM')
+        self._handle.write('TRIG:COUN 1')
+        errs = self._drain_errors()
+        self.supports_batch = not any(e.startswith(UNDEFINED_HEADER) for e in errs)
+        if not self.supports_batch and self.acquisition_mode == 'Batch':
+            print('device does not support batch acquisition, Error:{}'.format(errs[0]))
+
+    def _configure_format(self):
+        if self.data_format == 'REAL64':
+            self._handle.write('FORM:DATA REAL,64')
+            err = self._handle.query('SYST:ERR?')
+            if not err.startswith('+0'):
+                print('device does not support binary transfer, using ASCII. Error:{}'.format(err))
+                self.data_format = 'ASCII'
+        else:
+            self._handle.write('FORM:DATA ASC')
+            # older meters only support ASCII and do not know the command
+            self._handle.query('SYST:ERR?')
 
     def get_measurement(self):
+        value = self.read()
+        return self.make_measurement(value, time.time())
+
+    def read(self):
+        return self._read()
+
+    def make_measurement(self, value, timestamp):
         self.counter += 1
+        return make_sample(self.counter, self.starttime, timestamp, value, self._convert_to_temp(value))
+
+    def arm(self, n):
+        """
+        arm the multimeter for n externally triggered readings stored in reading memory.
+        returns False if the instrument does not support it or the commands failed.
+
+        INIT is the last command so the caller knows the meter takes readings from the
+        moment arm returns
+        """
+        if not self.supports_batch:
+            return False
+
+        try:
+            # edges that arrive while the meter is not armed leave Trigger ignored in the
+            # error queue, at high rates until it overflows. they are expected and do not
+            # stop the batch. *CLS clears the backlog in one transaction
+            self._handle.write('*CLS')
+            self._handle.write('TRIG:SOUR EXT')
+            self._handle.write('SAMP:COUN 1')
+            self._handle.write('TRIG:COUN {}'.format(n))
+            errs = [e for e in self._drain_errors() if not e.startswith((TRIGGER_IGNORED, QUEUE_OVERFLOW))]
+            if any(e.startswith(UNDEFINED_HEADER) for e in errs):
+                print('device does not support batch acquisition, Error:{}'.format(errs[0]))
+                self.supports_batch = False
+                self._disarm()
+                return False
+            if errs:
+                print('arming device reported {}'.format(', '.join(errs)))
+
+            self._handle.write('INIT')
+        except BaseException as e:
+            print('failed arming device, Error:{}'.format(e))
+            return False
+        return True
+
+    def fetch(self):
+        """
+        fetch all readings from reading memory
+        """
+        try:
+            if self.data_format == 'REAL64':
+                return self._query_binary('FETC?')
+
+            resp = self._handle.query('FETC?')
+        except BaseException as e:
+            print('failed fetching from device, Error:{}'.format(e))
+            return []
+
+        return [float(r) for r in resp.split(',') if r.strip()]
+
+    def get_measurements(self, timestamps):
+        """
+        fetch the readings for a completed batch and pair them with the trigger timestamps
+        """
+        return self.make_measurements(self.fetch(), timestamps)
+
+    def make_measurements(self, values, timestamps):
+        if len(values) != len(timestamps):
+            print('expected {} readings got {}'.format(len(timestamps), len(values)))
 
-        t = time.time() - self.starttime
-        r = self.counter / t
-        self.rate = r
-        value = self._read()
-        row = [self.counter, t, r, datetime.now().isoformat(), value, self._convert_to_temp(value)]
+        return [self.make_measurement(v, t) for v, t in zip(values, timestamps)]
 
-        return row
+    def finish_batch(self, timestamps):
+        """
+        stop an incomplete batch, return the readings taken so far and go back to
+        immediate triggering
+        """
+        ms = []
+        if timestamps:
+            try:
+                self._handle.write('ABOR')
+            except BaseException as e:
+                print('failed aborting device, Error:{}'.format(e))
+            ms = self.get_measurements(timestamps)
+
+        self._disarm()
+        return ms
 
     # private
+    def _disarm(self):
+        try:
+            self._handle.write('ABOR')
+            self._handle.write('TRIG:SOUR IMM')
+            self._handle.write('TRIG:COUN 1')
+            self._drain_errors()
+        except BaseException as e:
+            print('failed disarming device, Error:{}'.format(e))
+
+    def _drain_errors(self):
+        """
+        read the error queue until it is empty. returns the errors, e.g. ['-211,"Trigger ignored"']
+        """
+        errs = []
+        for i in range(ERROR_QUEUE):
+            err = self._handle.query('SYST:ERR?').strip()
+            if err.startswith('+0') or err.startswith('0,'):
+                break
+            errs.append(err)
+        return errs
+
+    def _make_simulator(self):
+        return SimulatedDMM(realtime=True)
+
+    def _npoints_changed(self, new):
+        if self._handle:
+            self._handle.write('SENSE:FRES:NPLC {:g}'.format(new))
+
+    def _data_format_changed(self):
+        if self._handle:
+            self._configure_format()
+
     def _convert_to_temp(self, v):
-        if self.use_air_calibration:
-            a = -39.74119491
-            c = 573.6081692
-            v = a*math.log(v)+c
-        else:
-            a = 1233.19043
-            b = -192.56687
-            c = 10.78172
-            d = -0.24088
-            x=math.log(v)
-            v = a+b*x+c*x**2+d*x**3
-            
-        return v
+        return self.calibration_model(v)
+
+    def _calibration_model_default(self):
+        return AirModel() if self.use_air_calibration else WaterModel()
+
+    def _use_air_calibration_changed(self, new):
+        self.calibration_model = AirModel() if new else WaterModel()
+
+    def _query_binary(self, cmd):
+        return self._handle.query_binary_values(cmd, datatype='d', is_big_endian=True, container=array)
 
     def _read(self):
         try:
+            if self.data_format == 'REAL64':
+                return float(self._query_binary('READ?')[0])
             return float(self._handle.query('READ?'))
         except BaseException as e:
             print('failed reading from device, Error:{}'.format(e))
@@ -134,6 +368,10 @@ class CalibrationDevice(VisaDevice):
     def _configure(self):
         pass
 
+    def _make_simulator(self):
+        # reference thermometer reading degrees C
+        return SimulatedDMM(resistance=20., noise=1e-4, realtime=True)
+
     def get_measurement(self):
-        return random.random()
+        return float(self._handle.query('READ?'))
 # ============= EOF =============================================
@@ -0,0 +1,150 @@
+# ===============================================================================
+# Copyright 2019 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+from math import sqrt, factorial
+
+from numpy import zeros, outer, dot, asarray, log, vander, inf
+from numpy.linalg import lstsq
+
+
+class IncrementalLeastSquares(object):
+    """
+    linear least squares from running sufficient statistics (X'X, X'y, y'y). adding a point
+    is O(p**2) and the coefficients and residual statistics are available at any time
+    without revisiting the data
+    """
+
+    def __init__(self, nparams):
+        self.nparams = nparams
+        self.reset()
+
+    def reset(self):
+        p = self.nparams
+        self.n = 0
+        self.xtx = zeros((p, p))
+        self.xty = zeros(p)
+        self.yty = 0.
+        self.ysum = 0.
+        self._coefficients = None
+
+    def add(self, row, y):
+        row = asarray(row, dtype=float)
+        self.n += 1
+        self.xtx += outer(row, row)
+        self.xty += row * y
+        self.yty += y * y
+        self.ysum += y
+        self._coefficients = None
+
+    def add_many(self, rows, ys):
+        rows = asarray(rows, dtype=float)
+        ys = asarray(ys, dtype=float)
+        self.n += len(ys)
+        self.xtx += dot(rows.T, rows)
+        self.xty += dot(rows.T, ys)
+        self.yty += dot(ys, ys)
+        self.ysum += ys.sum()
+        self._coefficients = None
+
+    @property
+    def solution(self):
+        """
+        coefficients of the basis the rows were given in
+        """
+        if self._coefficients is None:
+            self._coefficients = lstsq(self.xtx, self.xty, rcond=None)[0]
+        return self._coefficients
+
+    @property
+    def coefficients(self):
+        return list(self.solution)
+
+    @property
+    def sse(self):
+        b = self.solution
+        return max(self.yty - 2 * dot(b, self.xty) + dot(b, dot(self.xtx, b)), 0)
+
+    @property
+    def rmse(self):
+        dof = self.n - self.nparams
+        return sqrt(self.sse / dof) if dof > 0 else inf
+
+    @property
+    def r2(self):
+        if not self.n:
+            return 0
+        sst = self.yty - self.ysum ** 2 / self.n
+        return 1 - self.sse / sst if sst > 0 else 0
+
+
+class LogPolynomialFit(IncrementalLeastSquares):
+    """
+    fits T = c0 + c1*ln(R) + ... + cd*ln(R)**d, the form of the air (d=1) and water (d=3)
+    calibration models.
+
+    the basis is centered on ln(R) of the first point to keep X'X well conditioned.
+    `coefficients` are converted back to powers of ln(R) so they can be used directly
+    with src.conversion.CalibrationModel
+    """
+
+    def __init__(self, degree):
+        self.degree = degree
+        self.center = None
+        self.xmin = inf
+        self.xmax = -inf
+        super(LogPolynomialFit, self).__init__(degree + 1)
+
+    def reset(self):
+        super(LogPolynomialFit, self).reset()
+        self.center = None
+        self.xmin = inf
+        self.xmax = -inf
+
+    def add_point(self, x, y):
+        lx = log(x)
+        if self.center is None:
+            self.center = lx
+
+        u = lx - self.center
+        self.add([u ** k for k in range(self.nparams)], y)
+        self.xmin = min(self.xmin, x)
+        self.xmax = max(self.xmax, x)
+
+    def add_points(self, xs, ys):
+        xs = asarray(xs, dtype=float)
+        if not len(xs):
+            return
+
+        lx = log(xs)
+        if self.center is None:
+            self.center = lx[0]
+
+        self.add_many(vander(lx - self.center, self.nparams, increasing=True), ys)
+        self.xmin = min(self.xmin, xs.min())
+        self.xmax = max(self.xmax, xs.max())
+
+    @property
+    def coefficients(self):
+        a = self.solution
+        c = self.center or 0
+        p = self.nparams
+        # expand sum a_k (ln(R) - c)**k into powers of ln(R)
+        return [float(sum(a[k] * comb(k, j) * (-c) ** (k - j) for k in range(j, p))) for j in range(p)]
+
+
+def comb(n, k):
+    return factorial(n) // (factorial(k) * factorial(n - k))
+
+# ============= EOF =============================================
@@ -0,0 +1,137 @@
+# ===============================================================================
+# Copyright 2019 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""
+acquisition without the GUI.
+
+    python -m src.headless <well name> [--simulate] [--duration s] [--binary] [--autotune]
+
+uses the same devices, acquisition worker and log writers as wtgui.py and reads the
+settings saved by the GUI from ~/WellTempLogger/config.yaml. every entry of the `channels`
+section is logged alongside the main device pair, see src/session.py. nothing here
+imports traitsui, pyface, enable or chaco
+"""
+import argparse
+import os
+import time
+
+import yaml
+
+from src.session import SessionManager
+from src.records import StatusLine
+
+PROJECT_ROOT = os.path.join(os.path.expanduser('~'), 'WellTempLogger')
+REPORT_PERIOD = 1.0
+
+
+def load_config(path):
+    if not os.path.isfile(path):
+        return {}
+    with open(path, 'r') as rfile:
+        return yaml.safe_load(rfile) or {}
+
+
+def run(well_name, simulate=False, duration=0, binary=False, config=None, quiet=False, rate=None, jitter=None,
+        autotune=False, publish=None):
+    cfg = load_config(config or os.path.join(PROJECT_ROOT, 'config.yaml'))
+    main = dict(cfg.get('main') or {})
+    if binary:
+        main['log_format'] = 'Binary'
+    if autotune:
+        main['autotune'] = True
+
+    primary = {'name': well_name, 'well_name': well_name,
+               'measurement_device': dict(cfg.get('measurement_device') or {}),
+               'signal_device': cfg.get('signal_device') or {},
+               'publish': publish or main.get('publish')}
+    ctxs = [primary] + (cfg.get('channels') or [])
+    if simulate:
+        for c in ctxs:
+            c.setdefault('measurement_device', {})['simulate'] = True
+            sd = c['signal_device'] = dict(c.get('signal_device') or {}, trigger_backend='simulate')
+            if rate is not None:
+                sd['sim_rate'] = rate
+            if jitter is not None:
+                sd['sim_jitter'] = jitter
+
+    session = SessionManager(PROJECT_ROOT)
+    session.load(ctxs, defaults=main)
+    failed = session.open()
+    if failed:
+        print('failed opening channels {}'.format(', '.join([c.name for c in failed])))
+        if len(failed) == len(session):
+            return
+
+    for c in session.channels:
+        if c.output_path:
+            print('{} logging to {}'.format(c.name, c.output_path))
+        if c.publisher:
+            print('{} publishing on {}'.format(c.name, c.publish))
+
+    # a single channel gets a status line rewritten in place, several get a table
+    status = StatusLine() if not quiet and len(session) == 1 else None
+    st = time.time()
+    reported = st
+    session.start()
+    try:
+        while not duration or time.time() - st < duration:
+            time.sleep(main.get('consume_period', 0.05))
+            for name, rows in session.consume().items():
+                if status and rows:
+                    status.count += len(rows) - 1
+                    status.update(rows[-1])
+
+            now = time.time()
+            if status is None and now - reported > REPORT_PERIOD:
+                reported = now
+                print(session.status_str())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if status:
+            status.close()
+        session.close()
+        for c in session.channels:
+            if c.output_path:
+                print('{} {}'.format(c.name, c.writer_throughput))
+                if c.tuner:
+                    print('{} autotune {}'.format(c.name, c.tuner.status_str()))
+                if c.timings.enabled:
+                    print(c.timings.report())
+                    c.timings.dump('{}.timing.yaml'.format(c.output_path))
+    return [c.output_path for c in session.channels]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='WellTempLogger without the GUI')
+    parser.add_argument('well_name')
+    parser.add_argument('--simulate', action='store_true', help='use the simulated multimeter and trigger')
+    parser.add_argument('--rate', type=float, help='simulated trigger rate (Hz)')
+    parser.add_argument('--jitter', type=float, help='simulated trigger jitter (s)')
+    parser.add_argument('--duration', type=float, default=0, help='seconds to log. 0 runs until Control+C')
+    parser.add_argument('--binary', action='store_true', help='write a binary log. see src/binlog.py')
+    parser.add_argument('--config', help='settings file. defaults to ~/WellTempLogger/config.yaml')
+    parser.add_argument('--autotune', action='store_true',
+                        help='adjust NPLC, delay and poll period to keep up with the triggers. Single acquisition mode only')
+    parser.add_argument('--publish', help='serve samples on a socket, e.g. tcp:127.0.0.1:5555. see src/publish.py')
+    parser.add_argument('--quiet', action='store_true', help='print a status table instead of the latest measurement')
+    args = parser.parse_args()
+    run(args.well_name, args.simulate, args.duration, args.binary, args.config, args.quiet, args.rate, args.jitter,
+        args.autotune, args.publish)
+
+
+if __name__ == '__main__':
+    main()
+# ============= EOF =============================================
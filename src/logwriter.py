@@ -0,0 +1,184 @@
+# ===============================================================================
+# Copyright 2019 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+import atexit
+import os
+import threading
+import time
+
+from src.records import Sample
+
+
+class LogWriter(object):
+    """
+    keeps one file handle open for the whole session. rows are buffered in memory and
+    flushed from a background thread when `flush_rows` rows are pending or `flush_interval`
+    seconds have passed, whichever comes first. if `fsync` is set the data is also forced
+    to disk after every flush
+    """
+
+    def __init__(self, path, flush_rows=100, flush_interval=1.0, fsync=False):
+        self.path = path
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+
+        self.rows_written = 0
+        self.notes_written = 0
+        self.bytes_written = 0
+        self.flush_count = 0
+        self.write_time = 0
+
+        self._handle = None
+        self._pending = []
+        self._pending_notes = 0
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._alive = False
+        self._opened_at = 0
+
+    @property
+    def is_open(self):
+        return self._handle is not None
+
+    def open(self, header=None, mode='w'):
+        root = os.path.dirname(self.path)
+        if root and not os.path.isdir(root):
+            os.makedirs(root)
+
+        self._handle = open(self.path, mode)
+        self._opened_at = time.time()
+        if header is not None:
+            self._write_header(header)
+
+        self._alive = True
+        self._thread = threading.Thread(target=self._run, name='LogWriter')
+        self._thread.daemon = True
+        self._thread.start()
+        atexit.register(self.close)
+        return True
+
+    def write_row(self, row):
+        with self._lock:
+            self._pending.append(row)
+            n = len(self._pending)
+
+        if n >= self.flush_rows:
+            self._wake.set()
+
+    def note(self, text):
+        """
+        write a `# text` comment line in order with the rows. readers skip these lines.
+        notes are counted in notes_written, not rows_written
+        """
+        with self._lock:
+            self._pending.append(['# {}'.format(text)])
+            self._pending_notes += 1
+
+    def flush(self):
+        with self._io_lock:
+            self._flush()
+
+    def close(self):
+        if self._handle is None:
+            return
+
+        self._alive = False
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self._thread = None
+
+        self.flush()
+        with self._io_lock:
+            self._handle.close()
+            self._handle = None
+
+        try:
+            atexit.unregister(self.close)
+        except AttributeError:
+            pass
+
+    def throughput(self):
+        """
+        returns (rows/s, bytes/s) averaged over the session and the time spent in write calls
+        """
+        et = time.time() - self._opened_at if self._opened_at else 0
+        if et <= 0:
+            return 0, 0, 0
+        return self.rows_written / et, self.bytes_written / et, self.write_time
+
+    def throughput_str(self):
+        rr, br, wt = self.throughput()
+        return '{:0.1f} rows/s {:0.1f} kB/s io={:0.3f}s flushes={}'.format(rr, br / 1024., wt, self.flush_count)
+
+    # private
+    def _flush(self):
+        # called with the io lock held. the pending rows are taken under it too so
+        # concurrent flushes write batches in the order the rows were queued
+        if self._handle is None:
+            return
+
+        with self._lock:
+            rows, self._pending = self._pending, []
+            notes, self._pending_notes = self._pending_notes, 0
+
+        st = time.time()
+        if rows:
+            self._write_rows(rows, notes)
+
+        self._handle.flush()
+        if self.fsync:
+            os.fsync(self._handle.fileno())
+
+        self.write_time += time.time() - st
+        self.flush_count += 1
+
+    def _write_header(self, header):
+        # written straight to the handle so the header is not counted in rows_written
+        data = self._format_rows([header])
+        with self._io_lock:
+            self._handle.write(data)
+            self._handle.flush()
+        self.bytes_written += len(data)
+
+    def _write_rows(self, rows, notes=0):
+        data = self._format_rows(rows)
+        self._handle.write(data)
+        self.rows_written += len(rows) - notes
+        self.notes_written += notes
+        self.bytes_written += len(data)
+        self._rows_flushed(len(rows))
+
+    def _rows_flushed(self, n):
+        pass
+
+    def _format_rows(self, rows):
+        # samples are formatted here, in the flush thread, instead of when they are queued
+        return ''.join(['{}\n'.format(row.csv() if isinstance(row, Sample) else ','.join([str(r) for r in row]))
+                        for row in rows])
+
+    def _run(self):
+        while self._alive:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except (OSError, ValueError) as e:
+                print('failed writing to {}, Error:{}'.format(self.path, e))
+
+# ============= EOF =============================================
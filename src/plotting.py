@@ -0,0 +1,253 @@
+# ===============================================================================
+# Copyright 2019 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+import time
+
+from traits.api import HasTraits, Instance, Str, Int, Enum, Any
+
+from src.decimate import MinMaxEnvelope, METHODS
+
+
+def is_shown(component):
+    """
+    True if the window the component is drawn in is visible. components on a hidden tab, or
+    that were never put in a window, are not
+    """
+    window = getattr(component, 'window', None)
+    control = getattr(window, 'control', None)
+    if control is None:
+        return False
+
+    try:
+        return control.isVisible()
+    except AttributeError:
+        # wx
+        return control.IsShownOnScreen()
+
+
+class UpdateCoalescer(object):
+    """
+    limits UI refreshes to `rate` frames per second. samples are `push`ed as they arrive,
+    `tick` is called from the GUI timer and, once a frame is due, hands the latest sample to
+    `apply` and updates the plots that are shown. hidden plots are refreshed when they are
+    shown again, plots skip the redraw themselves if their data did not change
+    """
+
+    def __init__(self, plots=(), apply=None, rate=10.):
+        self.plots = list(plots)
+        self.apply = apply
+        self.rate = rate
+        self.frames = 0
+        self.pending = 0
+
+        self._latest = None
+        self._last = 0
+        self._dirty = set()
+
+    def push(self, sample):
+        self._latest = sample
+        self.pending += 1
+
+    def tick(self, force=False):
+        """
+        returns True if a frame was due
+        """
+        now = time.time()
+        if not force and (self.rate <= 0 or now - self._last < 1. / self.rate):
+            return False
+
+        self._last = now
+        if self.pending:
+            self._dirty.update(range(len(self.plots)))
+            if self.apply is not None:
+                self.apply(self._latest)
+            self.pending = 0
+
+        for i in list(self._dirty):
+            plot = self.plots[i]
+            if force or is_shown(plot.component):
+                plot.update()
+                self._dirty.discard(i)
+
+        self.frames += 1
+        return True
+
+    def reset(self):
+        self._latest = None
+        self.pending = 0
+        self._dirty.clear()
+
+
+class DecimatedPlot(HasTraits):
+    """
+    line plot of two SampleStore columns reduced to about one point per screen pixel.
+
+    while the plot is not zoomed the incremental min/max envelope is shown. when the user
+    zooms or pans the visible range is re-resolved from the raw samples with `method`.
+
+    chaco is imported when the component is first built
+    """
+    component = Instance('enable.api.Component')
+    store = Any
+    xname = Str
+    yname = Str
+    x_label = Str
+    y_label = Str
+    target = Int(1000)
+    method = Enum('minmax', 'lttb')
+
+    envelope = Instance(MinMaxEnvelope)
+
+    _line = Any
+    _zoom = Any
+
+    def update(self):
+        if self.envelope.update() and self._zoom is None:
+            self._set_data(*self.envelope.points())
+
+    def reset(self):
+        self.envelope.reset()
+        self._zoom = None
+        self._set_data([], [])
+
+    # private
+    def _set_data(self, x, y):
+        if self._line is None:
+            return
+        self._line.index.set_data(x)
+        self._line.value.set_data(y)
+
+    def _resolve(self, low, high):
+        x = self.store.get(self.xname)
+        y = self.store.get(self.yname)
+        mask = (x >= low) & (x <= high)
+        x, y = x[mask], y[mask]
+
+        # about one point per pixel along the depth axis
+        n = int(self.component.height)
+        if n < 100:
+            n = self.target
+
+        func = METHODS[self.method]
+        if self.method == 'minmax':
+            n //= 2
+        self._set_data(*func(x, y, n))
+
+    def _index_range_updated(self):
+        rng = self.component.index_range
+        if 'auto' in (rng.low_setting, rng.high_setting):
+            if self._zoom is not None:
+                self._zoom = None
+                self._set_data(*self.envelope.points())
+        else:
+            bounds = (rng.low, rng.high)
+            if bounds != self._zoom:
+                self._zoom = bounds
+                self._resolve(*bounds)
+
+    def _envelope_default(self):
+        return MinMaxEnvelope(self.store, self.xname, self.yname, target=self.target)
+
+    def _component_default(self):
+        from chaco.api import DataView, ArrayDataSource, LinePlot, LinearMapper
+        from chaco.tools.api import PanTool, ZoomTool
+
+        view = DataView(border_visible=True, orientation='v')
+        line = LinePlot(index=ArrayDataSource([]),
+                        value=ArrayDataSource([]),
+                        color='blue',
+                        orientation='v',
+                        index_mapper=LinearMapper(range=view.index_range),
+                        value_mapper=LinearMapper(range=view.value_range))
+
+        view.index_range.sources.append(line.index)
+        view.value_range.sources.append(line.value)
+        view.add(line)
+
+        view.x_axis.title = self.y_label
+        view.y_axis.title = self.x_label
+        view.bgcolor = 'white'
+        view.padding_bg_color = 'lightgray'
+
+        view.tools.append(PanTool(view))
+        view.overlays.append(ZoomTool(component=view, tool_mode='box', always_on=False))
+
+        view.index_range.on_trait_change(self._index_range_updated, 'updated')
+        self._line = line
+        self._set_data(*self.envelope.points())
+        return view
+
+
+class ProfilePlot(HasTraits):
+    """
+    binned temperature profile from a DepthProfile. mean with min and max envelope, depth
+    increasing downwards
+    """
+    component = Instance('enable.api.Component')
+    profile = Any
+
+    _lines = Any
+    _version = -1
+
+    def update(self):
+        p = self.profile
+        if self._lines is None or p.version == self._version:
+            return
+
+        self._version = p.version
+        t = p.table()
+        depth = -t[:, 0]
+        for line, col in zip(self._lines, (2, 4, 5)):
+            line.index.set_data(depth)
+            line.value.set_data(t[:, col])
+
+    def reset(self):
+        self._version = -1
+        if self._lines:
+            for line in self._lines:
+                line.index.set_data([])
+                line.value.set_data([])
+
+    def _component_default(self):
+        from chaco.api import DataView, ArrayDataSource, LinePlot, LinearMapper
+        from chaco.tools.api import PanTool, ZoomTool
+
+        view = DataView(border_visible=True, orientation='v')
+        lines = []
+        for color, width in (('blue', 2), ('gray', 1), ('gray', 1)):
+            line = LinePlot(index=ArrayDataSource([]),
+                            value=ArrayDataSource([]),
+                            color=color,
+                            line_width=width,
+                            orientation='v',
+                            index_mapper=LinearMapper(range=view.index_range),
+                            value_mapper=LinearMapper(range=view.value_range))
+            view.index_range.sources.append(line.index)
+            view.value_range.sources.append(line.value)
+            view.add(line)
+            lines.append(line)
+
+        view.x_axis.title = 'Temp C'
+        view.y_axis.title = 'Depth'
+        view.bgcolor = 'white'
+        view.padding_bg_color = 'lightgray'
+        view.tools.append(PanTool(view))
+        view.overlays.append(ZoomTool(component=view, tool_mode='box', always_on=False))
+
+        self._lines = lines
+        self.update()
+        return view
+
+# ============= EOF =============================================
@@ -0,0 +1,439 @@
+# ===============================================================================
+# Copyright 2019 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""
+live sample stream for other programs on the same machine.
+
+a Publisher listens on a unix socket (unix:/tmp/wt.sock) or TCP (tcp:127.0.0.1:5555). a
+client may send one JSON line right after connecting
+
+    {"format": "json" | "binary", "offset": <seq> | -<n>}
+
+and then receives every published sample, either as newline delimited JSON objects with
+`seq` and the Sample fields or as RECORD structs. without the line the stream is live
+JSON. `offset` replays the retained history from sequence number `seq`, or the last n
+samples if negative, before going live.
+
+every subscriber has its own bounded buffer. if a subscriber cannot keep up its oldest
+samples are dropped, `seq` shows the gap, acquisition is never blocked.
+
+    python -m src.publish tcp:127.0.0.1:5555 [--binary] [--offset -100]
+
+prints the stream, see Subscriber for use from python
+"""
+import argparse
+import json
+import os
+import selectors
+import socket
+import stat
+import struct
+import threading
+import time
+from collections import deque
+
+from src.records import FIELDS, Sample
+
+# seq, counter, time, rate, timestamp, raw, temp. little endian
+RECORD = struct.Struct('<Qqddddd')
+HANDSHAKE_TIMEOUT = 0.5
+SEND_CHUNK = 1 << 16
+
+
+def parse_address(address):
+    """
+    'unix:/path', 'tcp:host:port' or 'host:port'. returns (family, sockaddr)
+    """
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[5:]
+    if address.startswith('tcp:'):
+        address = address[4:]
+    host, port = address.rsplit(':', 1)
+    return socket.AF_INET, (host or '127.0.0.1', int(port))
+
+
+def is_socket(path):
+    try:
+        return stat.S_ISSOCK(os.stat(path).st_mode)
+    except OSError:
+        return False
+
+
+def encode_json(seq, s):
+    return '{}\n'.format(json.dumps({'seq': seq, 'counter': s.counter, 'time': s.time, 'rate': s.rate,
+                                     'timestamp': s.timestamp, 'raw': s.raw, 'temp': s.temp})).encode('utf-8')
+
+
+def encode_binary(seq, s):
+    return RECORD.pack(seq, s.counter, s.time, s.rate, s.timestamp, s.raw, s.temp)
+
+
+ENCODERS = {'json': encode_json, 'binary': encode_binary}
+
+
+class _Client(object):
+    def __init__(self, sock, maxlen):
+        self.sock = sock
+        self.queue = deque(maxlen=maxlen)
+        self.encode = encode_json
+        self.out = b''
+        self.inbuf = b''
+        self.subscribed = False
+        self.connected_at = time.time()
+        self.sent = 0
+        self.dropped = 0
+
+
+class Publisher(object):
+    """
+    serves published samples to any number of subscribers from a background thread.
+    `publish` and `publish_many` only append to in-memory buffers and never block
+    """
+
+    def __init__(self, address, history=10000, buffer=1000):
+        self.address = address
+        self.buffer = buffer
+        self.history = deque(maxlen=history)
+        self.seq = 0
+
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._selector = None
+        self._server = None
+        self._wake_r, self._wake_w = None, None
+        self._thread = None
+        self._alive = False
+
+    @property
+    def subscribers(self):
+        return sum(1 for c in self._snapshot() if c.subscribed)
+
+    @property
+    def dropped(self):
+        return sum(c.dropped for c in self._snapshot())
+
+    def open(self):
+        family, addr = parse_address(self.address)
+        if family == socket.AF_UNIX and os.path.exists(addr):
+            # a stale socket from a previous run. anything else is not ours to remove
+            if not is_socket(addr):
+                raise OSError('{} exists and is not a socket'.format(addr))
+            os.remove(addr)
+
+        self._server = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind(addr)
+        self._server.listen(8)
+        self._server.setblocking(False)
+
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._server, selectors.EVENT_READ, 'accept')
+        self._selector.register(self._wake_r, selectors.EVENT_READ, 'wake')
+
+        self._alive = True
+        self._thread = threading.Thread(target=self._run, name='Publisher')
+        self._thread.daemon = True
+        self._thread.start()
+        return True
+
+    def close(self):
+        if not self._alive:
+            return
+
+        self._alive = False
+        self._wake()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+        for c in self._snapshot():
+            self._drop(c)
+        self._selector.close()
+        self._server.close()
+        self._wake_r.close()
+        self._wake_w.close()
+
+        family, addr = parse_address(self.address)
+        if family == socket.AF_UNIX and is_socket(addr):
+            os.remove(addr)
+
+    def publish(self, sample):
+        self.publish_many((sample,))
+
+    def publish_many(self, samples):
+        if not self._alive or not samples:
+            return
+
+        with self._lock:
+            for s in samples:
+                self.seq += 1
+                item = (self.seq, s)
+                self.history.append(item)
+                for c in self._clients.values():
+                    if c.subscribed:
+                        if len(c.queue) == c.queue.maxlen:
+                            c.dropped += 1
+                        c.queue.append(item)
+        self._wake()
+
+    def status_str(self):
+        return '{} subscribers={} published={} dropped={}'.format(self.address, self.subscribers, self.seq,
+                                                                  self.dropped)
+
+    # private
+    def _snapshot(self):
+        with self._lock:
+            return list(self._clients.values())
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass
+
+    def _run(self):
+        sel = self._selector
+        while self._alive:
+            pending = [c for c in self._snapshot() if not c.subscribed]
+            events = sel.select(HANDSHAKE_TIMEOUT / 2. if pending else None)
+            for key, mask in events:
+                if key.data == 'accept':
+                    self._accept()
+                elif key.data == 'wake':
+                    try:
+                        while self._wake_r.recv(4096):
+                            pass
+                    except (BlockingIOError, OSError):
+                        pass
+                else:
+                    self._serve(key.data, mask)
+
+            now = time.time()
+            for c in self._snapshot():
+                if c.sock.fileno() != -1:
+                    self._serve(c, 0, now)
+
+    def _serve(self, c, mask, now=None):
+        """
+        handle one client. any error drops that client only, the others keep their stream
+        """
+        try:
+            if mask & selectors.EVENT_READ:
+                self._read(c)
+            if mask & selectors.EVENT_WRITE and c.sock.fileno() != -1:
+                self._send(c)
+            if now is not None:
+                if not c.subscribed and now - c.connected_at > HANDSHAKE_TIMEOUT:
+                    self._subscribe(c, {})
+                if c.subscribed:
+                    self._send(c)
+        except Exception as e:
+            print('dropping subscriber, Error:{}'.format(e))
+            self._drop(c)
+
+    def _accept(self):
+        try:
+            sock, _ = self._server.accept()
+        except (BlockingIOError, OSError):
+            return
+        sock.setblocking(False)
+        c = _Client(sock, self.buffer)
+        with self._lock:
+            self._clients[sock.fileno()] = c
+        self._selector.register(sock, selectors.EVENT_READ, c)
+
+    def _read(self, c):
+        try:
+            data = c.sock.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+
+        if not data:
+            self._drop(c)
+            return
+
+        if not c.subscribed:
+            c.inbuf += data
+            if b'\n' in c.inbuf:
+                line = c.inbuf.split(b'\n', 1)[0]
+                try:
+                    ctx = json.loads(line.decode('utf-8') or '{}')
+                except ValueError:
+                    ctx = {}
+                self._subscribe(c, ctx if isinstance(ctx, dict) else {})
+
+    def _subscribe(self, c, ctx):
+        fmt = ctx.get('format')
+        c.encode = ENCODERS.get(fmt, encode_json) if isinstance(fmt, str) else encode_json
+        offset = ctx.get('offset')
+        # anything but a whole number, including true/false, means live only
+        if not isinstance(offset, int) or isinstance(offset, bool):
+            offset = None
+        with self._lock:
+            if offset is not None and self.history:
+                if offset < 0:
+                    items = list(self.history)[offset:]
+                else:
+                    items = [h for h in self.history if h[0] >= offset]
+                c.queue = deque(items[-c.queue.maxlen:], maxlen=c.queue.maxlen)
+                c.dropped += max(len(items) - c.queue.maxlen, 0)
+            c.subscribed = True
+
+    def _send(self, c):
+        if not c.out:
+            with self._lock:
+                items = []
+                n = 0
+                while c.queue and n < SEND_CHUNK:
+                    seq, s = c.queue.popleft()
+                    b = c.encode(seq, s)
+                    items.append(b)
+                    n += len(b)
+            c.out = b''.join(items)
+
+        if c.out:
+            try:
+                n = c.sock.send(c.out)
+            except (BlockingIOError, InterruptedError):
+                n = 0
+            except OSError:
+                self._drop(c)
+                return
+            c.out = c.out[n:]
+            c.sent += n
+
+        # only ask for writability while there is something the socket did not take
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if c.out or c.queue else 0)
+        self._selector.modify(c.sock, events, c)
+
+    def _drop(self, c):
+        with self._lock:
+            self._clients.pop(c.sock.fileno(), None)
+        try:
+            self._selector.unregister(c.sock)
+        except (KeyError, ValueError):
+            pass
+        c.sock.close()
+
+
+class Subscriber(object):
+    """
+    client for a Publisher.
+
+        with Subscriber('tcp:127.0.0.1:5555', offset=-100) as sub:
+            for seq, sample in sub:
+                ...
+
+    yields (seq, Sample). `missed` counts the samples the publisher dropped for this
+    subscriber, found from gaps in seq
+    """
+
+    def __init__(self, address, fmt='json', offset=None, timeout=None):
+        self.address = address
+        self.format = fmt
+        self.offset = offset
+        self.timeout = timeout
+        self.missed = 0
+        self.last_seq = None
+        self._sock = None
+        self._buf = b''
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self):
+        while 1:
+            for item in self.read():
+                yield item
+
+    def open(self):
+        family, addr = parse_address(self.address)
+        self._sock = socket.socket(family, socket.SOCK_STREAM)
+        self._sock.connect(addr)
+        self._sock.settimeout(self.timeout)
+        ctx = {'format': self.format}
+        if self.offset is not None:
+            ctx['offset'] = self.offset
+        self._sock.sendall('{}\n'.format(json.dumps(ctx)).encode('utf-8'))
+
+    def close(self):
+        if self._sock:
+            self._sock.close()
+            self._sock = None
+
+    def read(self):
+        """
+        block until data arrives and return the complete samples received. raises EOFError
+        when the publisher closes the connection and socket.timeout after `timeout` seconds
+        """
+        data = self._sock.recv(SEND_CHUNK)
+        if not data:
+            raise EOFError('publisher closed the connection')
+
+        buf = self._buf + data
+        items = []
+        if self.format == 'binary':
+            n = len(buf) // RECORD.size * RECORD.size
+            for r in RECORD.iter_unpack(buf[:n]):
+                items.append((r[0], Sample(*r[1:])))
+            self._buf = buf[n:]
+        else:
+            lines = buf.split(b'\n')
+            self._buf = lines.pop()
+            for line in lines:
+                d = json.loads(line.decode('utf-8'))
+                items.append((d['seq'], Sample(*[d[k] for k in FIELDS])))
+
+        for seq, _ in items:
+            if self.last_seq is not None and seq > self.last_seq + 1:
+                self.missed += seq - self.last_seq - 1
+            self.last_seq = seq
+        return items
+
+
+def main():
+    parser = argparse.ArgumentParser(description='print the live sample stream of a WellTempLogger publisher')
+    parser.add_argument('address', help='unix:/path or tcp:host:port')
+    parser.add_argument('--binary', action='store_true', help='receive packed records instead of JSON')
+    parser.add_argument('--offset', type=int, help='replay from sequence number, or the last n samples if negative')
+    args = parser.parse_args()
+
+    sub = Subscriber(args.address, 'binary' if args.binary else 'json', args.offset)
+    sub.open()
+    try:
+        for seq, s in sub:
+            print('{:<10d}{}'.format(seq, s.report()))
+    except (KeyboardInterrupt, EOFError):
+        pass
+    finally:
+        sub.close()
+        if sub.missed:
+            print('missed {} samples'.format(sub.missed))
+
+
+if __name__ == '__main__':
+    main()
+# ============= EOF =============================================
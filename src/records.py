@@ -0,0 +1,120 @@
+# ===============================================================================
+# Copyright 2019 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+import sys
+import time
+from datetime import datetime
+
+# positional layout of a measurement row, matches the columns of the CSV log
+FIELDS = ('counter', 'time', 'rate', 'timestamp', 'raw', 'temp')
+# what indexing a Sample returns, the old row lists held the timestamp as an ISO string
+ROW_FIELDS = ('counter', 'time', 'rate', 'isoformat', 'raw', 'temp')
+
+REPORT_HEADER = 'Counter  Time      Rate    TimeStamp                                     Raw                     Temp'
+REPORT_FMT = '{:<10s}{:<10s}{:<10s}{:<30s}{:<20s}{:<10s}'
+
+
+class Sample(object):
+    """
+    one measurement. timestamps are kept as numbers, `timestamp` is the wall clock (epoch s)
+    of the trigger and `mono` time.monotonic() when the sample was made. strings are only
+    built by the sinks that need them, see `csv` and `report`.
+
+    indexing and iteration follow the old row lists so code written for them keeps working,
+    item 3 is the ISO timestamp string. use the attributes for the epoch timestamp
+    """
+    __slots__ = ('counter', 'time', 'rate', 'timestamp', 'raw', 'temp', 'mono')
+
+    def __init__(self, counter, time, rate, timestamp, raw, temp, mono=None):
+        self.counter = counter
+        self.time = time
+        self.rate = rate
+        self.timestamp = timestamp
+        self.raw = raw
+        self.temp = temp
+        self.mono = mono
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [getattr(self, k) for k in ROW_FIELDS[i]]
+        return getattr(self, ROW_FIELDS[i])
+
+    def __len__(self):
+        return len(FIELDS)
+
+    def __iter__(self):
+        return iter((self.counter, self.time, self.rate, self.isoformat, self.raw, self.temp))
+
+    def __repr__(self):
+        return 'Sample({})'.format(self.csv())
+
+    @property
+    def isoformat(self):
+        return datetime.fromtimestamp(self.timestamp).isoformat()
+
+    def csv(self):
+        return '{},{},{},{},{},{}'.format(self.counter, self.time, self.rate, self.isoformat, self.raw, self.temp)
+
+    def report(self):
+        return REPORT_FMT.format('{:05n}'.format(self.counter),
+                                 '{:0.1f}'.format(self.time),
+                                 '{:0.1f}'.format(self.rate),
+                                 self.isoformat,
+                                 '{:0.6f}'.format(self.raw),
+                                 '{:0.3f}'.format(self.temp))
+
+
+def make_sample(counter, starttime, timestamp, raw, temp):
+    t = timestamp - starttime
+    return Sample(counter, t, counter / t if t > 0 else 0, timestamp, raw, temp, time.monotonic())
+
+
+class StatusLine(object):
+    """
+    console output for the acquisition loop. `update` only keeps the latest sample, the line
+    is rewritten in place at most every `period` seconds
+    """
+
+    def __init__(self, period=0.5, stream=None):
+        self.period = period
+        self.stream = stream or sys.stdout
+        self.count = 0
+        self._latest = None
+        self._last = 0
+        self._width = 0
+
+    def update(self, sample, extra=''):
+        self._latest = sample
+        self.count += 1
+        now = time.monotonic()
+        if now - self._last >= self.period:
+            self._last = now
+            self._write(extra)
+
+    def close(self, extra=''):
+        if self._latest is not None:
+            self._write(extra)
+            self.stream.write('\n')
+            self.stream.flush()
+
+    def _write(self, extra):
+        s = self._latest
+        line = 'n={} {} {}'.format(self.count, s.report(), extra).rstrip()
+        pad = max(self._width - len(line), 0)
+        self._width = len(line)
+        self.stream.write('\r{}{}'.format(line, ' ' * pad))
+        self.stream.flush()
+
+# ============= EOF =============================================
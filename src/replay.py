@@ -0,0 +1,270 @@
+# ===============================================================================
+# Copyright 2019 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""
+replay a recorded log through the live acquisition pipeline.
+
+    python -m src.replay ~/WellTempLogger/data/W1.<date>.csv --speed 10
+
+a ReplayTrigger releases the recorded triggers at their recorded times divided by
+`speed` (1 is real time, 0 as fast as possible) and a ReplayMeasurementDevice returns
+the recorded Raw values. both plug into the AcquisitionWorker like the real devices so
+conversion, writing, plotting, the depth profile and the stats run exactly as they do
+at the well. the Temp column is recomputed with the current calibration.
+
+at full speed the replay waits while the worker queue holds `max_backlog` samples, so
+the rate is what the consumer sustains instead of a count of dropped samples. timed
+replays are not held back and drop samples like a live run would
+
+the command line replays through a session Channel into <out>/data and reports the
+throughput, the GUI's Replay button replays into the plots
+"""
+import argparse
+import os
+import time
+
+from numpy import asarray
+
+from src.binlog import BinaryLog, EXT
+from src.conversion import get_model, MODELS
+from src.device import MeasurementDevice, SignalDevice
+from src.records import StatusLine
+from src.reprocess import read_csv_log
+from src.session import Channel
+from src.trigger import Trigger
+
+BACKLOG_WAIT = 0.005
+
+
+class ReplaySource(object):
+    """
+    rows of a wt CSV or binary log and the replay clock. `speed` can be changed while
+    replaying
+    """
+
+    def __init__(self, path, speed=1.0, max_backlog=1000):
+        self.path = path
+        self.speed = speed
+        # callable returning the number of samples waiting to be consumed, see `follow`
+        self.backlog = None
+        self.max_backlog = max_backlog
+        self.times = None
+        self.raw = None
+        self.index = -1
+        self.started = 0
+        self.finished_at = 0
+
+        self._t0 = 0
+        self._clock = 0
+
+    def __len__(self):
+        return 0 if self.raw is None else len(self.raw)
+
+    @property
+    def finished(self):
+        return self.raw is not None and self.index >= len(self.raw) - 1
+
+    @property
+    def current(self):
+        return self.raw[self.index]
+
+    def load(self):
+        if self.path.endswith(EXT) or not os.path.isfile(self.path):
+            recs = BinaryLog(self.path).records
+            self.times = asarray(recs['time'], dtype=float)
+            self.raw = asarray(recs['raw'], dtype=float)
+        else:
+            counter, t, rate, stamps, raw = read_csv_log(self.path)
+            self.times = t
+            self.raw = raw
+        self.index = -1
+        return len(self.raw)
+
+    def start(self):
+        self.index = -1
+        self.started = time.perf_counter()
+        self.finished_at = 0
+        self._clock = self.started
+        self._t0 = self.times[0] if len(self) else 0
+
+    def next(self, timeout=None):
+        """
+        wait for the next row. returns False if `timeout` passes first or the log is done
+        """
+        if self.finished:
+            if not self.finished_at:
+                self.finished_at = time.perf_counter()
+            if timeout:
+                time.sleep(timeout)
+            return False
+
+        i = self.index + 1
+        if self.speed <= 0:
+            if self.backlog and self.backlog() >= self.max_backlog:
+                time.sleep(min(timeout or BACKLOG_WAIT, BACKLOG_WAIT))
+                return False
+        else:
+            # the recorded time of row i on the replay clock. re-anchored after a speed change
+            due = self._clock + (self.times[i] - self._t0) / self.speed
+            dt = due - time.perf_counter()
+            if dt > 0:
+                if timeout is not None and dt > timeout:
+                    time.sleep(timeout)
+                    return False
+                time.sleep(dt)
+
+        self.index = i
+        return True
+
+    def follow(self, worker):
+        """
+        hold a full speed replay back while `worker`'s queue is half full
+        """
+        self.backlog = worker.queue.qsize
+        if worker.queue.maxsize:
+            self.max_backlog = max(worker.queue.maxsize // 2, 1)
+
+    def set_speed(self, speed):
+        if self.index >= 0:
+            self._clock = time.perf_counter()
+            self._t0 = self.times[self.index]
+        self.speed = speed
+
+    def rate(self):
+        """
+        rows replayed per second
+        """
+        et = (self.finished_at or time.perf_counter()) - self.started
+        return (self.index + 1) / et if et > 0 else 0
+
+    def status_str(self):
+        speed = '{:g}x'.format(self.speed) if self.speed > 0 else 'max'
+        return '{}/{} rows {} {:0.0f} rows/s'.format(self.index + 1, len(self), speed, self.rate())
+
+
+class ReplayTrigger(Trigger):
+    """
+    releases one edge per recorded row, from the worker thread that waits on it
+    """
+    name = 'replay'
+
+    def __init__(self, source):
+        super(ReplayTrigger, self).__init__()
+        self.source = source
+
+    def wait(self, timeout=None):
+        if self.source.next(timeout):
+            self.edges += 1
+            self.timestamp = time.time()
+            return True
+        return False
+
+
+class ReplaySignalDevice(SignalDevice):
+    def __init__(self, source):
+        super(ReplaySignalDevice, self).__init__()
+        self.source = source
+        self.device_id = 'replay'
+
+    def open(self):
+        self._trigger = ReplayTrigger(self.source)
+        return True
+
+    def close(self):
+        self._trigger = None
+
+
+class ReplayMeasurementDevice(MeasurementDevice):
+    """
+    returns the Raw value of the row the ReplayTrigger released last
+    """
+    device_id = 'replay'
+
+    def __init__(self, source, **kw):
+        super(ReplayMeasurementDevice, self).__init__(**kw)
+        self.source = source
+
+    def open(self):
+        return True
+
+    def read(self):
+        return float(self.source.current)
+
+
+def run(path, out, speed=0, model=None, binary=False, publish=None, quiet=False):
+    source = ReplaySource(path, speed)
+    n = source.load()
+    md = ReplayMeasurementDevice(source)
+    if model:
+        md.calibration_model = get_model(model)
+
+    stem = os.path.basename(path).split('.')[0]
+    channel = Channel('replay', well_name='{}.replay'.format(stem), log_format='Binary' if binary else 'CSV',
+                      measurement_device=md, signal_device=ReplaySignalDevice(source), post_measurement_delay=0,
+                      publish=publish)
+    if not channel.open(out):
+        return
+
+    channel.writer.note('replay of {} speed={}'.format(path, speed or 'max'))
+    print('replaying {} rows of {} into {}'.format(n, path, channel.output_path))
+    status = None if quiet else StatusLine()
+
+    source.start()
+    channel.start()
+    source.follow(channel.worker)
+    stats = {}
+    try:
+        while 1:
+            time.sleep(0.05)
+            rows = channel.consume()
+            if status and rows:
+                status.count += len(rows) - 1
+                status.update(rows[-1], source.status_str())
+            if source.finished and not channel.worker.depth:
+                channel.consume()
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if status:
+            status.close(source.status_str())
+        stats = channel.stats()
+        channel.close()
+
+    print('{} acquired={} dropped={}'.format(source.status_str(), stats['acquired'], stats['dropped']))
+    print(channel.writer_throughput)
+    if channel.timings.enabled:
+        print(channel.timings.report())
+    return channel.output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='replay a recorded log through the acquisition pipeline')
+    parser.add_argument('path', help='wt CSV or binary log')
+    parser.add_argument('--speed', type=float, default=0,
+                        help='1 replays in real time, 10 ten times faster. 0, the default, replays as fast as possible')
+    parser.add_argument('--model', choices=sorted(MODELS), help='calibration used for Temp. defaults to Air')
+    parser.add_argument('--out', default=os.path.join(os.path.expanduser('~'), 'WellTempLogger', 'replay'),
+                        help='the replayed log is written to <out>/data')
+    parser.add_argument('--binary', action='store_true', help='write a binary log')
+    parser.add_argument('--publish', help='serve the replayed samples, see src/publish.py')
+    parser.add_argument('--quiet', action='store_true')
+    args = parser.parse_args()
+    run(args.path, args.out, args.speed, args.model, args.binary, args.publish, args.quiet)
+
+
+if __name__ == '__main__':
+    main()
+# ============= EOF =============================================
@@ -0,0 +1,252 @@
+# ===============================================================================
+# Copyright 2019 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""
+recompute Temp and the depth profile of every log in a directory with a new calibration.
+
+    python -m src.reprocess ~/WellTempLogger/data --model Water --coefficients 1233.2,-192.6,10.8,-0.24
+
+files are processed in a process pool. for each log <name>.csv (or .wtb) the output
+directory gets <name>.csv with the new Temp column and <name>.profile.csv. a manifest
+records the size and mtime of each input together with the model, so files whose input and
+model are unchanged are skipped on the next run. summary.csv lists every log.
+
+the segments of a binary log, compressed or not, are reprocessed as one log <stem>.wtb
+"""
+import argparse
+import json
+import os
+import re
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from numpy import array, asarray, nanmin, nanmax, nanmean, loadtxt, savetxt, empty
+
+from src.conversion import get_model, MODELS
+from src.depthprofile import DepthProfile
+from src.binlog import BinaryLog, BinaryLogWriter, CSV_HEADER, EXT, COMPRESSORS, find_segments
+
+MANIFEST = 'manifest.json'
+SUMMARY = 'summary.csv'
+SUMMARY_COLUMNS = ['file', 'rows', 'temp_min', 'temp_max', 'temp_mean', 'max_depth', 'seconds']
+SKIP_SUFFIXES = ('.profile.csv', '.timing.yaml')
+# <stem>.wtb, a segment <stem>.<NNNN>.wtb and either compressed
+BINARY_LOG = re.compile(r'^(?P<stem>.+?)(?P<segment>\.\d{{4}})?{}({})?$'.format(re.escape(EXT), '|'.join(
+    [re.escape(ext) for ext, _ in COMPRESSORS.values()])))
+
+
+def read_csv_log(path):
+    """
+    returns counter, time, rate, timestamp (str), raw arrays of a wt CSV log.
+    `# ...` note lines are ignored
+    """
+    with warnings.catch_warnings():
+        # numpy warns about skipped comment lines and about logs without rows
+        warnings.simplefilter('ignore', UserWarning)
+        cols = loadtxt(path, delimiter=',', skiprows=1, comments='#', usecols=(0, 1, 2, 3, 4), dtype=str,
+                       ndmin=2)
+
+    if not len(cols):
+        e = array([])
+        return e, e, e, array([], dtype=str), e
+
+    return (cols[:, 0].astype(float).astype(int), cols[:, 1].astype(float), cols[:, 2].astype(float),
+            cols[:, 3], cols[:, 4].astype(float))
+
+
+def find_logs(root):
+    """
+    CSV logs and binary logs. the segments of a binary log are one recording, returned as
+    <root>/<stem>.wtb which BinaryLog resolves to its segments
+    """
+    ps = []
+    for name in sorted(os.listdir(root)):
+        if name.startswith('cal.') or name in (SUMMARY,) or name.endswith(SKIP_SUFFIXES):
+            continue
+        if name.endswith('.csv'):
+            ps.append(os.path.join(root, name))
+            continue
+
+        m = BINARY_LOG.match(name)
+        if m:
+            p = os.path.join(root, m.group('stem') + EXT if m.group('segment') else name)
+            if p not in ps:
+                ps.append(p)
+    return ps
+
+
+def output_name(path):
+    """
+    name of the reprocessed log. binary logs are written as one uncompressed <stem>.wtb
+    """
+    name = os.path.basename(path)
+    m = BINARY_LOG.match(name)
+    return m.group('stem') + EXT if m else name
+
+
+def fingerprint(path, model_name, coefficients, bin_size, depth_per_trigger):
+    sts = [os.stat(p) for p in find_segments(path)]
+    return {'size': sum(st.st_size for st in sts), 'mtime_ns': max(st.st_mtime_ns for st in sts),
+            'segments': len(sts),
+            'model': model_name, 'coefficients': [float(c) for c in coefficients],
+            'bin_size': bin_size, 'depth_per_trigger': depth_per_trigger}
+
+
+def process_file(path, out_dir, model_name, coefficients, bin_size, depth_per_trigger):
+    """
+    runs in a worker process. returns a summary dict
+    """
+    st = time.perf_counter()
+    model = get_model(model_name, coefficients)
+    name = output_name(path)
+    stem = os.path.splitext(name)[0]
+    out = os.path.join(out_dir, name)
+
+    if BINARY_LOG.match(os.path.basename(path)):
+        log = BinaryLog(path)
+        recs = log.records.copy()
+        recs['temp'] = model.evaluate(recs['raw'])
+        counter, t, temp = recs['counter'], recs['time'], recs['temp']
+
+        meta = dict(log.metadata)
+        meta.pop('dtype', None)
+        meta.update({'calibration_model': model.name, 'calibration_coefficients': list(model.coefficients),
+                     'reprocessed': True})
+        writer = BinaryLogWriter(out, meta)
+        writer.open()
+        writer.write_records(recs)
+        writer.close()
+    else:
+        counter, t, rate, stamps, raw = read_csv_log(path)
+        temp = asarray(model.evaluate(raw))
+        rows = empty((len(temp), len(CSV_HEADER)), dtype=object)
+        for i, c in enumerate((counter, t, rate, stamps, raw, temp)):
+            rows[:, i] = c
+        savetxt(out, rows, fmt='%s', delimiter=',', header=','.join(CSV_HEADER), comments='')
+
+    profile = DepthProfile(bin_size, depth_per_trigger)
+    profile.extend(counter, t, temp)
+    profile.export(os.path.join(out_dir, '{}.profile.csv'.format(stem)))
+
+    n = len(temp)
+    return {'file': name,
+            'rows': n,
+            'temp_min': float(nanmin(temp)) if n else 0,
+            'temp_max': float(nanmax(temp)) if n else 0,
+            'temp_mean': float(nanmean(temp)) if n else 0,
+            'max_depth': float(counter.max() * depth_per_trigger) if n else 0,
+            'seconds': time.perf_counter() - st}
+
+
+def load_manifest(out_dir):
+    p = os.path.join(out_dir, MANIFEST)
+    if os.path.isfile(p):
+        with open(p, 'r') as rfile:
+            return json.load(rfile)
+    return {}
+
+
+def save_manifest(out_dir, manifest):
+    p = os.path.join(out_dir, MANIFEST)
+    tmp = '{}.tmp'.format(p)
+    with open(tmp, 'w') as wfile:
+        json.dump(manifest, wfile, indent=1, sort_keys=True)
+    os.replace(tmp, p)
+
+
+def write_summary(out_dir, manifest):
+    with open(os.path.join(out_dir, SUMMARY), 'w') as wfile:
+        wfile.write('{}\n'.format(','.join(SUMMARY_COLUMNS)))
+        for name in sorted(manifest):
+            s = manifest[name]['summary']
+            wfile.write('{}\n'.format(','.join([str(s[k]) for k in SUMMARY_COLUMNS])))
+
+
+def reprocess(root, out_dir=None, model_name='Air', coefficients=None, bin_size=1.0, depth_per_trigger=1.0,
+              workers=None, force=False):
+    out_dir = out_dir or os.path.join(root, 'reprocessed')
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+
+    model = get_model(model_name, coefficients)
+    coefficients = list(model.coefficients)
+
+    manifest = load_manifest(out_dir)
+    todo = []
+    logs = find_logs(root)
+    for p in logs:
+        name = os.path.basename(p)
+        fp = fingerprint(p, model_name, coefficients, bin_size, depth_per_trigger)
+        prev = manifest.get(name)
+        if not force and prev and prev['input'] == fp and os.path.isfile(os.path.join(out_dir, output_name(p))):
+            continue
+        todo.append((p, fp))
+
+    print('{} logs, {} to process, {} unchanged. model={} {}'.format(len(logs), len(todo), len(logs) - len(todo),
+                                                                     model_name, coefficients))
+    st = time.perf_counter()
+    rows = 0
+    failed = []
+    with ProcessPoolExecutor(workers) as pool:
+        futures = {pool.submit(process_file, p, out_dir, model_name, coefficients, bin_size,
+                               depth_per_trigger): (p, fp) for p, fp in todo}
+        for i, f in enumerate(as_completed(futures)):
+            p, fp = futures[f]
+            name = os.path.basename(p)
+            try:
+                s = f.result()
+            except BaseException as e:
+                failed.append(name)
+                print('[{}/{}] {} failed, Error:{}'.format(i + 1, len(todo), name, e))
+                continue
+
+            manifest[name] = {'input': fp, 'summary': s}
+            rows += s['rows']
+            et = time.perf_counter() - st
+            print('[{}/{}] {} rows={} {:0.0f} rows/s'.format(i + 1, len(todo), name, s['rows'],
+                                                            rows / et if et else 0))
+
+    save_manifest(out_dir, manifest)
+    write_summary(out_dir, manifest)
+
+    et = time.perf_counter() - st
+    print('processed {} logs, {} rows in {:0.2f}s ({:0.0f} rows/s). {} failed'.format(len(todo) - len(failed), rows,
+                                                                                     et, rows / et if et else 0,
+                                                                                     len(failed)))
+    print('summary written to {}'.format(os.path.join(out_dir, SUMMARY)))
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='recompute temperatures and profiles of logged runs')
+    parser.add_argument('root', help='directory of logs')
+    parser.add_argument('--out', help='output directory. defaults to <root>/reprocessed')
+    parser.add_argument('--model', default='Air', choices=sorted(MODELS))
+    parser.add_argument('--coefficients', help='comma separated coefficients. defaults to the model defaults')
+    parser.add_argument('--bin-size', type=float, default=1.0)
+    parser.add_argument('--depth-per-trigger', type=float, default=1.0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--force', action='store_true', help='process unchanged logs too')
+    args = parser.parse_args()
+
+    coeffs = [float(c) for c in args.coefficients.split(',')] if args.coefficients else None
+    reprocess(args.root, args.out, args.model, coeffs, args.bin_size, args.depth_per_trigger, args.workers,
+              args.force)
+
+
+if __name__ == '__main__':
+    main()
+# ============= EOF =============================================
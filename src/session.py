@@ -0,0 +1,296 @@
+# ===============================================================================
+# Copyright 2019 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""
+several measurement/trigger device pairs logged at once.
+
+each Channel has its own AcquisitionWorker thread, queue, output file and timings so a
+slow instrument only delays its own channel. channels are described in config.yaml
+
+    channels:
+    - name: probe2
+      well_name: W2
+      log_format: CSV
+      measurement_device: {device_id: GPIB0::23::INSTR, npoints: 10}
+      signal_device: {device_id: /dev/tty.UC-232B, trigger_backend: auto}
+      publish: tcp:127.0.0.1:5556
+"""
+import inspect
+import os
+from datetime import datetime
+
+from src.device import SignalDevice, MeasurementDevice, warning
+from src.acquisition import AcquisitionWorker
+from src.autotune import AutoTuner
+from src.publish import Publisher
+from src.logwriter import LogWriter
+from src.binlog import BinaryLogWriter, CSV_HEADER
+from src.timing import Timings, STAGES
+
+MEASUREMENT_ATTRS = ('device_id', 'npoints', 'use_air_calibration', 'acquisition_mode', 'batch_size', 'data_format',
+                     'simulate')
+SIGNAL_ATTRS = ('device_id', 'period', 'trigger_backend', 'sim_rate', 'sim_jitter')
+# settings of the `main` config section a channel inherits unless it overrides them
+CHANNEL_DEFAULTS = ('queue_size', 'post_measurement_delay', 'flush_rows', 'flush_interval', 'fsync', 'segment_rows',
+                    'compression', 'timing_enabled', 'log_format', 'autotune')
+
+
+def make_writer(path, log_format, md, sd, well_name, segment_rows=0, compression=None, **kw):
+    """
+    open a CSV or binary log for a measurement/signal device pair
+    """
+    if log_format == 'Binary':
+        model = md.calibration_model
+        meta = {'well_name': well_name,
+                'started': datetime.now().isoformat(),
+                'measurement_device': md.device_id,
+                'signal_device': sd.device_id,
+                'npoints': md.npoints,
+                'calibration_model': model.name,
+                'calibration_coefficients': model.coefficients}
+        writer = BinaryLogWriter(path, meta, segment_rows=segment_rows, compression=compression, **kw)
+        writer.open()
+    else:
+        writer = LogWriter(path, **kw)
+        writer.open(CSV_HEADER)
+    return writer
+
+
+def configure(obj, ctx, attrs):
+    for k in attrs:
+        if k in ctx:
+            setattr(obj, k, ctx[k])
+
+
+class Channel(object):
+    def __init__(self, name, well_name='', log_format='CSV', measurement_device=None, signal_device=None,
+                 queue_size=10000, post_measurement_delay=0.05, flush_rows=100, flush_interval=1.0, fsync=False,
+                 segment_rows=0, compression=None, timing_enabled=True, autotune=False, publish=None, debug=False):
+        self.name = name
+        self.well_name = well_name or name
+        self.log_format = log_format
+        self.measurement_device = measurement_device or MeasurementDevice()
+        self.signal_device = signal_device or SignalDevice()
+
+        self.queue_size = queue_size
+        self.post_measurement_delay = post_measurement_delay
+        self.writer_kw = dict(flush_rows=flush_rows, flush_interval=flush_interval, fsync=fsync,
+                              segment_rows=segment_rows, compression=compression)
+        self.debug = debug
+        # let an AutoTuner pick NPLC, delay and poll period while logging
+        self.autotune = autotune
+        self.tuner = None
+        # socket address the channel's samples are served on, see src/publish.py
+        self.publish = publish
+        self.publisher = None
+        self.timings = Timings(STAGES, enabled=timing_enabled)
+
+        self.output_path = None
+        self.writer_throughput = ''
+        self.writer = None
+        self.worker = None
+        self.last_row = None
+        self._opened = False
+
+    @classmethod
+    def from_dict(cls, ctx, defaults=None):
+        kw = {k: v for k, v in (defaults or {}).items() if k in CHANNEL_DEFAULTS}
+        kw.update({k: v for k, v in ctx.items() if k not in ('measurement_device', 'signal_device')})
+
+        # a misspelled or outdated key must not keep the channel from loading
+        args = set(inspect.signature(cls.__init__).parameters) - {'self'}
+        unknown = sorted(k for k in kw if k not in args)
+        if unknown:
+            warning(None, 'channel {} ignores unknown settings: {}'.format(kw.get('name'), ', '.join(map(str, unknown))))
+            kw = {k: v for k, v in kw.items() if k in args}
+
+        md = MeasurementDevice()
+        configure(md, ctx.get('measurement_device') or {}, MEASUREMENT_ATTRS)
+        sd = SignalDevice()
+        configure(sd, ctx.get('signal_device') or {}, SIGNAL_ATTRS)
+        return cls(measurement_device=md, signal_device=sd, **kw)
+
+    def to_dict(self):
+        md, sd = self.measurement_device, self.signal_device
+        return {'name': self.name,
+                'well_name': self.well_name,
+                'log_format': self.log_format,
+                'publish': self.publish,
+                'measurement_device': {k: getattr(md, k) for k in MEASUREMENT_ATTRS},
+                'signal_device': {k: getattr(sd, k) for k in SIGNAL_ATTRS}}
+
+    def open(self, root):
+        if self._opened:
+            return True
+
+        md, sd = self.measurement_device, self.signal_device
+        if not md.open():
+            return
+        if not sd.open() and not (self.debug or md.simulate):
+            return
+        if md.simulate:
+            sd.connect(md._handle.trigger)
+
+        uid = datetime.now().isoformat().replace(':', '_')
+        ext = 'wtb' if self.log_format == 'Binary' else 'csv'
+        self.output_path = os.path.join(root, 'data', '{}.{}.{}'.format(self.well_name, uid, ext))
+        self.writer = make_writer(self.output_path, self.log_format, md, sd, self.well_name, **self.writer_kw)
+        if self.publish:
+            self.publisher = Publisher(self.publish)
+            try:
+                self.publisher.open()
+            except OSError as e:
+                print('failed publishing {} on {}, Error:{}'.format(self.name, self.publish, e))
+                self.publisher = None
+        md.reset()
+        self._opened = True
+        return True
+
+    def start(self):
+        md, sd = self.measurement_device, self.signal_device
+        md.init()
+        self.tuner = None
+        if self.autotune and md.acquisition_mode == 'Batch':
+            # the tuner works from the latency of each READ?, batches are read in bulk
+            warning(None, 'channel {} autotune only works in Single acquisition mode, it is off'.format(self.name))
+        elif self.autotune:
+            self.tuner = AutoTuner(md.npoints, self.post_measurement_delay, sd.period if sd.polling else None)
+
+        # without a trigger line the channel is read every post_measurement_delay
+        self.worker = AcquisitionWorker(md, sd,
+                                        maxsize=self.queue_size,
+                                        post_measurement_delay=self.post_measurement_delay,
+                                        debug=self.debug or sd._trigger is None,
+                                        timings=self.timings,
+                                        autotune=self.tuner)
+        self.worker.start()
+
+    def stop(self):
+        if self.worker:
+            self.worker.stop()
+            self.consume()
+            self.worker = None
+        if self.writer:
+            self.writer.flush()
+
+    def close(self):
+        self.stop()
+        if self.writer:
+            self.writer.close()
+            self.writer_throughput = self.writer.throughput_str()
+            self.writer = None
+        if self.publisher:
+            self.publisher.close()
+            self.publisher = None
+        self.signal_device.close()
+        self._opened = False
+
+    def consume(self):
+        """
+        write everything the worker acquired since the last call. returns the rows
+        """
+        if not self.worker:
+            return []
+
+        rows = self.worker.drain()
+        notes = self.tuner.pop_notes() if self.tuner else []
+        # an empty poll is not a write, it would dilute the write timings
+        if not rows and not notes:
+            return rows
+
+        # the live stream goes out first so it never waits on the log
+        if self.publisher:
+            self.publisher.publish_many(rows)
+
+        tm = self.timings
+        st = tm.start()
+        for row in rows:
+            self.writer.write_row(row)
+        for note in notes:
+            self.writer.note(note)
+        tm.stop('write', st)
+        if rows:
+            self.last_row = rows[-1]
+        return rows
+
+    def stats(self):
+        w = self.worker
+        sd = self.signal_device
+        return {'name': self.name,
+                'acquired': w.acquired if w else 0,
+                'dropped': w.dropped if w else 0,
+                'unread': w.unread if w else 0,
+                'queue': w.depth if w else 0,
+                'edges': sd.edges,
+                'missed': sd.missed,
+                'rate': self.last_row.rate if self.last_row else 0,
+                'nplc': self.measurement_device.npoints,
+                'subscribers': self.publisher.subscribers if self.publisher else 0,
+                'write': self.writer.throughput_str() if self.writer else ''}
+
+
+class SessionManager(object):
+    """
+    runs a list of Channels. `consume` is called periodically by the owner, the GUI's
+    timer loop or the headless main loop
+    """
+
+    def __init__(self, root, channels=None):
+        self.root = root
+        self.channels = channels or []
+
+    def __len__(self):
+        return len(self.channels)
+
+    def load(self, ctxs, defaults=None):
+        self.channels = [Channel.from_dict(c, defaults) for c in ctxs or []]
+
+    def dump(self):
+        return [c.to_dict() for c in self.channels]
+
+    def open(self):
+        """
+        open every channel. returns the channels that failed
+        """
+        return [c for c in self.channels if not c.open(self.root)]
+
+    def start(self):
+        for c in self.channels:
+            if c._opened:
+                c.start()
+
+    def stop(self):
+        for c in self.channels:
+            c.stop()
+
+    def close(self):
+        for c in self.channels:
+            c.close()
+
+    def consume(self):
+        return {c.name: c.consume() for c in self.channels}
+
+    def stats(self):
+        return [c.stats() for c in self.channels]
+
+    def status_str(self):
+        fmt = '{:<12s}{:>10s}{:>10s}{:>8s}{:>10s}{:>10s}{:>8s}'
+        lines = [fmt.format('channel', 'acquired', 'dropped', 'queue', 'missed', 'rate', 'NPLC')]
+        for s in self.stats():
+            lines.append(fmt.format(s['name'], str(s['acquired']), str(s['dropped']), str(s['queue']),
+                                    str(s['missed']), '{:0.2f}'.format(s['rate']), '{:g}'.format(s['nplc'])))
+        return '\n'.join(lines)
+
+# ============= EOF =============================================
@@ -0,0 +1,207 @@
+# ===============================================================================
+# Copyright 2019 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+import random
+import threading
+import time
+
+from pyvisa.util import to_ieee_block, from_ieee_block
+
+NO_ERROR = '+0,"No error"'
+UNDEFINED_HEADER = '-113,"Undefined header"'
+TRIGGER_IGNORED = '-211,"Trigger ignored"'
+QUEUE_OVERFLOW = '-350,"Error queue overflow"'
+ERROR_QUEUE = 20
+
+
+class SimulatedDMM(object):
+    """
+    stands in for a pyvisa resource connected to the 4-wire resistance multimeter. it
+    understands the subset of SCPI used by MeasurementDevice. readings are a random walk
+    around `resistance` ohms.
+
+    hardware triggers are simulated by calling `trigger`. while armed (INIT) each trigger
+    stores one reading in memory until the trigger count is reached. a trigger that arrives
+    while the previous reading is still integrating is ignored and counted (realtime only).
+
+    with realtime=True calls take as long as they would on the bus. a reading integrates for
+    NPLC power line cycles, every transaction costs `latency` seconds and data moves at
+    `bus_rate` bytes/s
+    """
+
+    def __init__(self, resistance=1e5, noise=0.001, supports_batch=True, realtime=False, line_frequency=60.,
+                 latency=0.0005, bus_rate=300e3):
+        self.resistance = resistance
+        self.noise = noise
+        self.supports_batch = supports_batch
+        self.realtime = realtime
+        self.line_frequency = line_frequency
+        self.latency = latency
+        self.bus_rate = bus_rate
+
+        self.nplc = 10
+        self.trigger_source = 'IMM'
+        self.trigger_count = 1
+        self.sample_count = 1
+        self.armed = False
+        self.data_format = 'ASC'
+
+        self.queries = 0
+        self.writes = 0
+        self.bytes_sent = 0
+        self.ignored = 0
+
+        self._busy_until = 0
+        self._memory = []
+        self._triggers = 0
+        self._errors = []
+        self._lock = threading.Lock()
+
+    @property
+    def integration_time(self):
+        return self.nplc / self.line_frequency
+
+    def write(self, cmd):
+        self.writes += 1
+        self._transfer(len(cmd) + 1)
+        for c in cmd.split(';'):
+            self._command(c.strip())
+
+    def query(self, cmd):
+        self.queries += 1
+        cmd = cmd.strip().upper()
+        if cmd in ('READ?', 'FETC?'):
+            resp = self._format(self._readings(cmd))
+            self.bytes_sent += len(resp) + 1
+            self._transfer(len(cmd) + len(resp) + 2)
+            return resp
+
+        self._transfer(len(cmd) + 1)
+        if cmd == 'DATA:POIN?':
+            return '{:d}'.format(len(self._memory))
+        elif cmd == 'SYST:ERR?':
+            return self._errors.pop(0) if self._errors else NO_ERROR
+        elif cmd == '*IDN?':
+            return 'SIMULATED,DMM,0,1.0'
+
+        self._error(UNDEFINED_HEADER)
+        return ''
+
+    def query_binary_values(self, cmd, datatype='f', is_big_endian=False, container=list):
+        self.queries += 1
+        cmd = cmd.strip().upper()
+        if self.data_format != 'REAL,64':
+            raise ValueError('instrument is not in binary output mode')
+
+        # the instrument sends big endian unless FORM:BORD SWAP
+        block = to_ieee_block(self._readings(cmd), 'd', True)
+        self.bytes_sent += len(block) + 1
+        self._transfer(len(cmd) + len(block) + 2)
+        return from_ieee_block(block, datatype, is_big_endian, container)
+
+    def trigger(self):
+        """
+        external trigger pulse
+        """
+        with self._lock:
+            if not self.armed:
+                # external triggers are only an error when the meter waits for them
+                if self.trigger_source == 'EXT':
+                    self._error(TRIGGER_IGNORED)
+                return
+
+            if self.realtime:
+                now = time.monotonic()
+                if now < self._busy_until:
+                    self.ignored += 1
+                    self._error(TRIGGER_IGNORED)
+                    return
+                self._busy_until = now + self.integration_time * self.sample_count
+
+            self._memory.extend(self._reading() for _ in range(self.sample_count))
+            self._triggers += 1
+            if self._triggers >= self.trigger_count:
+                self.armed = False
+
+    def close(self):
+        pass
+
+    # private
+    def _error(self, err):
+        if len(self._errors) < ERROR_QUEUE:
+            self._errors.append(err)
+        else:
+            self._errors[-1] = QUEUE_OVERFLOW
+
+    def _transfer(self, nbytes):
+        if self.realtime:
+            time.sleep(self.latency + nbytes / self.bus_rate)
+
+    def _command(self, cmd):
+        if not cmd:
+            return
+
+        head, _, arg = cmd.upper().partition(' ')
+        if head in ('CONF:FRES', '*RST'):
+            pass
+        elif head == '*CLS':
+            self._errors = []
+        elif head == 'SENSE:FRES:NPLC':
+            self.nplc = float(arg)
+        elif head == 'FORM:DATA':
+            arg = arg.replace(' ', '')
+            if arg in ('ASC', 'ASCII'):
+                self.data_format = 'ASC'
+            elif arg in ('REAL', 'REAL,64'):
+                self.data_format = 'REAL,64'
+            else:
+                self._error(UNDEFINED_HEADER)
+        elif not self.supports_batch:
+            self._error(UNDEFINED_HEADER)
+        elif head == 'TRIG:SOUR':
+            self.trigger_source = arg
+        elif head == 'TRIG:COUN':
+            self.trigger_count = int(float(arg))
+        elif head == 'SAMP:COUN':
+            self.sample_count = int(float(arg))
+        elif head == 'INIT':
+            with self._lock:
+                self._memory = []
+                self._triggers = 0
+                self.armed = True
+        elif head == 'ABOR':
+            self.armed = False
+        else:
+            self._error(UNDEFINED_HEADER)
+
+    def _readings(self, cmd):
+        if cmd == 'READ?':
+            if self.realtime:
+                time.sleep(self.integration_time)
+            return [self._reading()]
+
+        with self._lock:
+            rs = self._memory
+            self._memory = []
+        return rs
+
+    def _reading(self):
+        self.resistance *= 1 + random.gauss(0, self.noise)
+        return self.resistance
+
+    def _format(self, rs):
+        return ','.join(['{:+0.9E}'.format(r) for r in rs])
+
+# ============= EOF =============================================
@@ -0,0 +1,141 @@
+# ===============================================================================
+# Copyright 2019 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+from collections import deque
+from time import perf_counter
+
+import yaml
+
+NBUCKETS = 32
+
+
+class StageStats(object):
+    """
+    rolling window of durations for one stage plus a cumulative log2 histogram. bucket i
+    counts durations in [2**(i-1), 2**i) microseconds
+    """
+
+    def __init__(self, name, window=1000):
+        self.name = name
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.histogram = [0] * NBUCKETS
+        self.durations = deque(maxlen=window)
+        self.stamps = deque(maxlen=window)
+
+    def add(self, dt, now):
+        self.count += 1
+        self.total += dt
+        if dt > self.max:
+            self.max = dt
+        self.durations.append(dt)
+        self.stamps.append(now)
+        self.histogram[min(int(dt * 1e6).bit_length(), NBUCKETS - 1)] += 1
+
+    def summary(self):
+        ds = sorted(self.durations)
+        n = len(ds)
+        if not n:
+            return {'count': 0}
+
+        span = self.stamps[-1] - self.stamps[0]
+        return {'count': self.count,
+                'rate': (n - 1) / span if span > 0 else 0,
+                'mean': self.total / self.count,
+                'p50': ds[n // 2],
+                'p95': ds[min(int(n * 0.95), n - 1)],
+                'window_max': ds[-1],
+                'max': self.max}
+
+
+class Timings(object):
+    """
+    hot path instrumentation.
+
+        st = timings.start()
+        ...
+        st = timings.stop('visa', st)
+
+    `stop` returns the current time so consecutive stages can be chained. with
+    enabled=False `start` returns 0 and `stop` returns immediately
+    """
+
+    def __init__(self, stages=(), window=1000, enabled=True):
+        self.window = window
+        self.enabled = enabled
+        self.stages = {}
+        self.order = []
+        for s in stages:
+            self._stage(s)
+
+    def start(self):
+        if self.enabled:
+            return perf_counter()
+        return 0
+
+    def stop(self, name, st):
+        if not st:
+            return 0
+
+        now = perf_counter()
+        try:
+            stage = self.stages[name]
+        except KeyError:
+            stage = self._stage(name)
+        stage.add(now - st, now)
+        return now
+
+    def reset(self):
+        for s in self.order:
+            self.stages[s] = StageStats(s, self.window)
+
+    def summary(self):
+        return {s: self.stages[s].summary() for s in self.order}
+
+    def report(self):
+        lines = ['{:<10s}{:>8s}{:>10s}{:>10s}{:>10s}{:>10s}'.format('stage', 'n', 'rate/s', 'p50 ms',
+                                                                     'p95 ms', 'max ms')]
+        for s in self.order:
+            sm = self.stages[s].summary()
+            if sm['count']:
+                lines.append('{:<10s}{:>8d}{:>10.1f}{:>10.3f}{:>10.3f}{:>10.3f}'.format(s, sm['count'], sm['rate'],
+                                                                                       sm['p50'] * 1000,
+                                                                                       sm['p95'] * 1000,
+                                                                                       sm['max'] * 1000))
+        return '\n'.join(lines)
+
+    def dump(self, path):
+        ctx = {}
+        for s in self.order:
+            stage = self.stages[s]
+            sm = stage.summary()
+            sm['histogram_us_log2'] = list(stage.histogram)
+            ctx[s] = sm
+
+        with open(path, 'w') as wfile:
+            yaml.dump(ctx, wfile, default_flow_style=None)
+
+    # private
+    def _stage(self, name):
+        stage = StageStats(name, self.window)
+        self.stages[name] = stage
+        self.order.append(name)
+        return stage
+
+
+STAGES = ('trigger', 'visa', 'convert', 'report', 'write', 'plot')
+
+# ============= EOF =============================================
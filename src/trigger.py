@@ -0,0 +1,289 @@
+# ===============================================================================
+# Copyright 2019 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+import random
+import struct
+import sys
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# linux asm-generic/ioctls.h and termios.h
+TIOCMGET = 0x5415
+TIOCMIWAIT = 0x545C
+TIOCGICOUNT = 0x545D
+TIOCM_CTS = 0x020
+TIOCM_CAR = 0x040
+TIOCM_RNG = 0x080
+TIOCM_DSR = 0x100
+
+# struct serial_icounter_struct, cts, dsr, rng, dcd are the first four ints
+ICOUNT_FMT = '20i'
+ICOUNT_INDEX = {TIOCM_CTS: 0, TIOCM_DSR: 1, TIOCM_RNG: 2, TIOCM_CAR: 3}
+
+# seconds `close` waits for a blocking trigger thread to return
+CLOSE_TIMEOUT = 1.0
+
+
+def rising_edges(transitions, level):
+    """
+    number of rising edges in `transitions` line changes starting from `level`. changes
+    alternate, from high the first one is falling
+    """
+    return transitions // 2 if level else (transitions + 1) // 2
+
+
+class Trigger(object):
+    """
+    base trigger source. `wait` blocks until the next rising edge of the trigger line and
+    returns True, or returns False if `timeout` seconds pass first.
+
+    edges counts every rising edge seen. missed counts edges that arrived while the
+    consumer was busy and were folded into the next `wait`. counts_missed is False for
+    sources that cannot see those edges
+    """
+    name = ''
+    counts_missed = True
+
+    def __init__(self):
+        self.edges = 0
+        self.missed = 0
+        self.timestamp = 0
+
+    def wait(self, timeout=None):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def reset(self):
+        self.edges = 0
+        self.missed = 0
+
+
+class PollingTrigger(Trigger):
+    """
+    samples the modem line every `period` seconds. pulses shorter than `period` are missed
+    without being counted
+    """
+    name = 'poll'
+    counts_missed = False
+
+    def __init__(self, handle, period=0.01, line='dsr'):
+        super(PollingTrigger, self).__init__()
+        self.handle = handle
+        self.period = period
+        self.line = line
+        self._last = None
+
+    def wait(self, timeout=None):
+        st = time.time()
+        while 1:
+            state = getattr(self.handle, self.line)
+            last, self._last = self._last, state
+            if state and last is False:
+                self.edges += 1
+                self.timestamp = time.time()
+                return True
+
+            if timeout is not None and time.time() - st > timeout:
+                return False
+
+            time.sleep(self.period)
+
+
+class EventTrigger(Trigger):
+    """
+    trigger fed by edges from another thread. edges that pile up between two calls to
+    `wait` are counted as missed
+    """
+
+    def __init__(self):
+        super(EventTrigger, self).__init__()
+        self._pending = 0
+        self._cond = threading.Condition()
+
+    def wait(self, timeout=None):
+        with self._cond:
+            if not self._pending:
+                self._cond.wait(timeout)
+
+            if not self._pending:
+                return False
+
+            self.missed += self._pending - 1
+            self._pending = 0
+            return True
+
+    def _signal(self, n=1, timestamp=None):
+        with self._cond:
+            self.edges += n
+            self._pending += n
+            self.timestamp = timestamp or time.time()
+            self._cond.notify_all()
+
+
+class ModemWaitTrigger(EventTrigger):
+    """
+    blocks in the kernel on modem line changes (TIOCMIWAIT) instead of polling. the
+    interrupt counters (TIOCGICOUNT) give the number of transitions since the previous
+    wakeup so short pulses are still counted. linux only.
+
+    `close` closes the port. the descriptor is looked up on every call, never kept, so a
+    number the system hands out again after the close is not waited on
+    """
+    name = 'modem'
+
+    def __init__(self, handle, mask=TIOCM_DSR):
+        super(ModemWaitTrigger, self).__init__()
+        self.handle = handle
+        self.mask = mask
+        self._index = ICOUNT_INDEX[mask]
+
+        # raises OSError if the driver does not support the interrupt counters
+        self._count = self._icount()
+        self._level = self._modem_level()
+
+        self._alive = True
+        self._thread = threading.Thread(target=self._run, name='ModemWaitTrigger')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self):
+        if not self._alive:
+            return
+
+        self._alive = False
+        # closing the port ends the wait once the driver returns (hangup or the next line
+        # change), the thread then fails on the closed port and exits
+        self.handle.close()
+        self._thread.join(CLOSE_TIMEOUT)
+        if self._thread.is_alive():
+            print('trigger thread still waiting on {}, it exits on the next line change'.format(
+                getattr(self.handle, 'port', self.handle)))
+
+    # private
+    def _fileno(self):
+        # pyserial raises SerialException, an OSError, once the port is closed
+        return self.handle.fileno()
+
+    def _icount(self):
+        buf = bytearray(struct.calcsize(ICOUNT_FMT))
+        fcntl.ioctl(self._fileno(), TIOCGICOUNT, buf, True)
+        return struct.unpack(ICOUNT_FMT, buf)[self._index]
+
+    def _modem_level(self):
+        buf = bytearray(struct.calcsize('i'))
+        fcntl.ioctl(self._fileno(), TIOCMGET, buf, True)
+        return bool(struct.unpack('i', buf)[0] & self.mask)
+
+    def _run(self):
+        while self._alive:
+            try:
+                fcntl.ioctl(self._fileno(), TIOCMIWAIT, self.mask)
+                now = time.time()
+                count = self._icount()
+                level = self._modem_level()
+            except (OSError, ValueError) as e:
+                if self._alive:
+                    print('trigger wait failed, Error:{}'.format(e))
+                break
+
+            rising = rising_edges(count - self._count, self._level)
+            self._count = count
+            self._level = level
+            if rising:
+                self._signal(rising, now)
+
+
+class FakeTrigger(EventTrigger):
+    """
+    trigger source for running without hardware. call `fire` to emit edges
+    """
+    name = 'fake'
+
+    def fire(self, n=1):
+        self._signal(n)
+
+
+class PulseTrainTrigger(EventTrigger):
+    """
+    simulated trigger line. emits `rate` pulses per second with gaussian `jitter` (s) on
+    each pulse time. `callbacks` are called on every pulse before the edge is signalled,
+    e.g. SimulatedDMM.trigger so the simulated meter sees the same hardware trigger.
+    stops after `count` pulses if count is set
+    """
+    name = 'pulse'
+
+    def __init__(self, rate=10., jitter=0., count=0, callbacks=None):
+        super(PulseTrainTrigger, self).__init__()
+        self.rate = rate
+        self.jitter = jitter
+        self.count = count
+        self.callbacks = list(callbacks or [])
+        self.pulses = 0
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='PulseTrainTrigger')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def connect(self, callback):
+        self.callbacks.append(callback)
+
+    def close(self):
+        self._stop.set()
+
+    # private
+    def _run(self):
+        nxt = time.time()
+        while not self._stop.is_set():
+            nxt += 1. / self.rate if self.rate > 0 else 1
+            at = nxt + (random.gauss(0, self.jitter) if self.jitter else 0)
+            dt = at - time.time()
+            if dt > 0 and self._stop.wait(dt):
+                break
+            if self.rate <= 0:
+                continue
+
+            for cb in self.callbacks:
+                cb()
+            self.pulses += 1
+            self._signal(1, time.time())
+            if self.count and self.pulses >= self.count:
+                break
+
+
+def make_trigger(handle, backend='auto', period=0.01):
+    """
+    returns a trigger for the serial `handle`. `backend` is 'auto', 'modem' or 'poll'.
+    'auto' uses the modem-line wait where the platform and driver support it and falls
+    back to polling otherwise
+    """
+    if backend in ('auto', 'modem') and fcntl is not None and sys.platform.startswith('linux'):
+        try:
+            return ModemWaitTrigger(handle)
+        except (OSError, AttributeError, ValueError) as e:
+            if backend == 'modem':
+                raise
+            print('modem line wait not available, polling instead. Error:{}'.format(e))
+
+    return PollingTrigger(handle, period)
+
+# ============= EOF =============================================
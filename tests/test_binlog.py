@@ -0,0 +1,26 @@
+import os
+import time
+
+import pytest
+
+from src.binlog import BinaryLogWriter, BinaryLog, read_segment
+from src.records import make_sample
+
+
+@pytest.mark.parametrize('n,compression', [(1000, None), (1000, 'gzip'), (1383, None)])
+def test_segments_hold_segment_rows(tmpdir, n, compression):
+    p = os.path.join(str(tmpdir), 'log.wtb')
+    # flushes that do not line up with the segments
+    w = BinaryLogWriter(p, segment_rows=100, compression=compression, flush_rows=37, flush_interval=100)
+    w.open()
+    st = time.time()
+    for i in range(n):
+        w.write_row(make_sample(i + 1, st, st + i, 1e5, 20.))
+    w.close()
+
+    sizes = [len(read_segment(s)[1]) for s in w.segments]
+    assert sizes == [100] * (n // 100) + ([n % 100] if n % 100 else [])
+    assert len(os.listdir(str(tmpdir))) == len(sizes)
+
+    counter = BinaryLog(p).records['counter']
+    assert list(counter) == list(range(1, n + 1))
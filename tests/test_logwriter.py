@@ -0,0 +1,17 @@
+import os
+
+from src.logwriter import LogWriter
+
+
+def test_csv_header_is_not_a_row(tmpdir):
+    p = os.path.join(str(tmpdir), 'log.csv')
+    w = LogWriter(p)
+    w.open(header=['counter', 'time'])
+    for i in range(3):
+        w.write_row([i, i])
+    w.note('hello')
+    w.close()
+
+    assert (w.rows_written, w.notes_written) == (3, 1)
+    with open(p) as rfile:
+        assert rfile.read().splitlines() == ['counter,time', '0,0', '1,1', '2,2', '# hello']
@@ -0,0 +1,43 @@
+import socket
+import time
+
+from src.publish import Publisher, Subscriber
+from src.records import make_sample
+
+
+def publish(pub, n, start=1):
+    st = time.time()
+    pub.publish_many([make_sample(i, st - 1, st, 1e5, 20.) for i in range(start, start + n)])
+
+
+def test_malformed_handshake_drops_only_that_client():
+    port = _free_port()
+    pub = Publisher('tcp:127.0.0.1:{}'.format(port))
+    pub.open()
+    try:
+        publish(pub, 10)
+
+        bad = socket.create_connection(('127.0.0.1', port))
+        bad.sendall(b'{"offset": "abc", "format": ["json"]}\n')
+
+        with Subscriber(pub.address, offset=-5, timeout=2) as sub:
+            items = []
+            while len(items) < 5:
+                items.extend(sub.read())
+            publish(pub, 3, 11)
+            while len(items) < 8:
+                items.extend(sub.read())
+
+        assert [seq for seq, _ in items] == list(range(6, 14))
+        assert pub._thread.is_alive()
+        bad.close()
+    finally:
+        pub.close()
+
+
+def _free_port():
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
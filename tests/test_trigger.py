@@ -0,0 +1,94 @@
+import time
+
+from src.acquisition import AcquisitionWorker
+from src.device import MeasurementDevice, SignalDevice
+from src.trigger import FakeTrigger, rising_edges
+
+
+def wait_until(cond, timeout=2.):
+    et = time.time() + timeout
+    while time.time() < et:
+        if cond():
+            return True
+        time.sleep(0.005)
+    return False
+
+
+def make_worker(maxsize=100):
+    md = MeasurementDevice(simulate=True)
+    md.open()
+    md._handle.realtime = False
+    md.reset()
+
+    sd = SignalDevice()
+    sd._trigger = FakeTrigger()
+    worker = AcquisitionWorker(md, sd, maxsize=maxsize, trigger_timeout=0.05)
+    return worker, sd._trigger
+
+
+def test_rising_edges():
+    assert rising_edges(0, False) == 0
+    assert rising_edges(1, False) == 1
+    assert rising_edges(1, True) == 0
+    assert rising_edges(2, False) == 1
+    assert rising_edges(2, True) == 1
+    assert rising_edges(3, True) == 1
+    assert rising_edges(3, False) == 2
+
+
+def test_one_reading_per_trigger():
+    worker, trigger = make_worker()
+    worker.start()
+    try:
+        for i in range(5):
+            trigger.fire()
+            assert wait_until(lambda: worker.acquired == i + 1)
+    finally:
+        worker.stop()
+
+    assert len(worker.drain()) == 5
+    assert trigger.edges == 5
+    assert trigger.missed == 0
+
+
+def test_merged_edges_are_missed():
+    worker, trigger = make_worker()
+    # edges that pile up before the worker waits are folded into one reading
+    trigger.fire(3)
+    worker.start()
+    try:
+        assert wait_until(lambda: worker.acquired == 1)
+        time.sleep(0.1)
+    finally:
+        worker.stop()
+
+    assert worker.acquired == 1
+    assert trigger.edges == 3
+    assert trigger.missed == 2
+
+
+def test_full_queue_drops():
+    worker, trigger = make_worker(maxsize=2)
+    worker.start()
+    try:
+        for i in range(5):
+            trigger.fire()
+            assert wait_until(lambda: worker.acquired + worker.dropped == i + 1)
+    finally:
+        worker.stop()
+
+    assert worker.acquired == 2
+    assert worker.dropped == 3
+    assert len(worker.drain()) == 2
+
+
+def test_stop_joins_waiting_worker():
+    worker, trigger = make_worker()
+    worker.start()
+    assert worker.is_alive
+
+    st = time.time()
+    worker.stop()
+    assert not worker.is_alive
+    # the worker only waits one trigger timeout
+    assert time.time() - st < 1
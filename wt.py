@@ -19,6 +19,15 @@ import time
 import serial
 import pyvisa
 
+from src.logwriter import LogWriter
+from src.trigger import make_trigger, PulseTrainTrigger
+from src.simulation import SimulatedDMM
+from src.conversion import get_model
+from src.timing import Timings, STAGES
+from src.aioengine import AsyncEngine
+from src.records import make_sample, StatusLine
+from src.publish import Publisher
+
 WELCOME = """
 Well Temp Logger
 
@@ -26,23 +35,58 @@ by Jake Ross (2019)
  
 """
 DEBUG=False
+# simulated multimeter and trigger pulse train, no instruments needed
+SIMULATE = False
+SIM_RATE = 10
+SIM_JITTER = 0.
 DEVICE_ID = 'GPIB0::22::INSTR'
 SIGNAL_DEV_ADDR = '/dev/tty.UC-232AC'
 SIGNAL_DELAY = 0.05
 POST_MEASUREMENT_DELAY=0.05
 NPOINTS=10
+TRIGGER_BACKEND = 'auto'
+CALIBRATION = 'Air'
+TIMING = True
+FLUSH_ROWS = 100
+FLUSH_INTERVAL = 1.0
+FSYNC = False
+STATUS_PERIOD = 0.5
+# serve the samples to local programs, e.g. 'tcp:127.0.0.1:5555' or 'unix:/tmp/wt.sock'. see src/publish.py
+PUBLISH = None
+# wt.py takes one READ? per trigger. the multimeter's Batch mode (readings taken on the
+# hardware trigger and fetched in bulk) is only available from the GUI and src.headless
+# asyncio runs trigger waits, reads, writing and reporting as tasks without fixed sleeps.
+# loop is the original sequential loop
+ENGINE = 'asyncio'
 
 
 class SignalDevice:
     _handle=None
+    _trigger=None
     def open(self):
+        if SIMULATE:
+            self._trigger = PulseTrainTrigger(SIM_RATE, SIM_JITTER)
+            print('using {} trigger'.format(self._trigger.name))
+            return True
+
         try:
             self._handle = serial.Serial(SIGNAL_DEV_ADDR)
+            self._trigger = make_trigger(self._handle, TRIGGER_BACKEND, SIGNAL_DELAY)
+            print('using {} trigger'.format(self._trigger.name))
             return True
         except serial.SerialException:
             if DEBUG:
                 return True
 
+    def wait(self, timeout):
+        if self._trigger:
+            return self._trigger.wait(timeout)
+        else:
+            if DEBUG:
+                # no trigger line, read every POST_MEASUREMENT_DELAY instead of spinning
+                time.sleep(POST_MEASUREMENT_DELAY)
+                return True
+
     def active(self):
         if self._handle:
             return self._handle.dsr
@@ -63,6 +107,12 @@ def welcome():
 
 
 def open_device():
+    if SIMULATE:
+        inst = SimulatedDMM(realtime=True)
+        inst.write('CONF:FRES 1MOHM, 0.000001MOHM')
+        inst.write('SENSE:FRES:NPLC {}'.format(NPOINTS))
+        return inst
+
     rm = pyvisa.ResourceManager()
     res = rm.list_resources()
     if DEVICE_ID not in res:
@@ -81,51 +131,124 @@ def open_signal_device():
         return dev
 
 
-def start_logging(dev, signal_device):
-    # setup output file
+def open_writer():
     root = 'data'
     p = 'wt-{}.csv'.format(datetime.now().isoformat())
     if not os.path.isdir(root):
         os.mkdir(root)
 
     p = os.path.join(root, p)
+    writer = LogWriter(p, flush_rows=FLUSH_ROWS, flush_interval=FLUSH_INTERVAL, fsync=FSYNC)
+    writer.open()
+    return p, writer
+
+
+def finish_logging(p, writer, tm, signal_device):
+    writer.close()
+    print('wrote {} rows to {}. {}'.format(writer.rows_written, p, writer.throughput_str()))
+    if TIMING:
+        print(tm.report())
+        tm.dump('{}.timing.yaml'.format(p))
+    if signal_device._trigger:
+        t = signal_device._trigger
+        print('triggers={} missed={}'.format(t.edges, t.missed))
+
+
+def open_publisher():
+    if PUBLISH:
+        pub = Publisher(PUBLISH)
+        pub.open()
+        print('publishing samples on {}'.format(PUBLISH))
+        return pub
+
+
+def start_logging_async(dev, signal_device):
+    p, writer = open_writer()
+    pub = open_publisher()
+    tm = Timings(STAGES, enabled=TIMING)
+
+    row = assemble_header()
+    write_row(writer, row)
+    report_line(row)
+
+    starttime = time.time()
+    counter = [0]
+
+    def make_row(value, timestamp):
+        row = assemble_row(counter[0], value, starttime, timestamp)
+        counter[0] += 1
+        return row
+
+    status = StatusLine(STATUS_PERIOD)
+
+    def report(rows):
+        status.update(rows[-1])
+        status.count += len(rows) - 1
+        if pub:
+            pub.publish_many(rows)
+
+    def timestamp():
+        t = signal_device._trigger
+        return t.timestamp if t else time.time()
+
+    engine = AsyncEngine(signal_device.wait, lambda: read_device(dev), make_row, writer,
+                         report=report, timestamp=timestamp, timings=tm)
+    try:
+        engine.run()
+    finally:
+        status.close()
+        if engine.missed:
+            print('{} triggers arrived during a read and were not read'.format(engine.missed))
+        if pub:
+            pub.close()
+        finish_logging(p, writer, tm, signal_device)
+
+
+def start_logging(dev, signal_device):
+    # setup output file
+    p, writer = open_writer()
+    pub = open_publisher()
+
+    tm = Timings(STAGES, enabled=TIMING)
 
     counter = 0
     starttime = time.time()
-    while 1:
-        if wait_for_signal(signal_device):
-            value = read_device(dev)
-            if counter == 0:
-                row = assemble_header()
-                write_row(p, row)
-                report_line(row)
-
-            row = assemble_row(counter, value, starttime)
-            write_row(p, row)
-            report_row(row)
-            counter += 1
-            time.sleep(POST_MEASUREMENT_DELAY)
+    status = StatusLine(STATUS_PERIOD)
+    try:
+        while 1:
+            st = tm.start()
+            if wait_for_signal(signal_device):
+                st = tm.stop('trigger', st)
+                value = read_device(dev)
+                st = tm.stop('visa', st)
+                if counter == 0:
+                    row = assemble_header()
+                    write_row(writer, row)
+                    report_line(row)
+
+                row = assemble_row(counter, value, starttime)
+                st = tm.stop('convert', st)
+                if pub:
+                    pub.publish(row)
+                write_row(writer, row)
+                st = tm.stop('write', st)
+                report_row(status, row)
+                tm.stop('report', st)
+                counter += 1
+                time.sleep(POST_MEASUREMENT_DELAY)
+    finally:
+        status.close()
+        if pub:
+            pub.close()
+        finish_logging(p, writer, tm, signal_device)
 
 def wait_for_signal(signal_device):
     if DEBUG:
         print('waiting for signal')
-    st = time.time()
-    timeout = 100
-    was_deactive=False
-    while 1:
-        if time.time() - st > timeout:
-            break
-        
-        if DEBUG:
-            signal_device.report_pin_states()
-            
-        if not signal_device.active():
-            was_deactive=True
-            
-        if was_deactive and signal_device.active():
-            return True
+        signal_device.report_pin_states()
 
-        time.sleep(SIGNAL_DELAY)
+    timeout = 100
+    return signal_device.wait(timeout)
 
 
 def read_device(dev, verbose=False):
@@ -144,35 +267,29 @@ def assemble_header():
     return ['counter', 'time', 'rate', 'datetime', 'raw_value', 'temp']
 
 
-def assemble_row(counter, value, starttime):
-    t = time.time() - starttime
-    r = counter / t
-    row = [counter, t, r, datetime.now().isoformat(), value]
-    return row
+def assemble_row(counter, value, starttime, timestamp=None):
+    if timestamp is None:
+        timestamp = time.time()
+    return make_sample(counter, starttime, timestamp, value, convert_to_temp(value))
 
 
-def report_row(row):
-    c = '{:09n}'.format(row[0])
-    t = '{:0.1f}'.format(row[1])
-    r = '{:0.2f}'.format(row[2])
-    dt = '{}'.format(row[3])
-    v = '{}'.format(row[4])
-    temp = '{}'.format(convert_to_temp(row[4]))
-    report_line((c, t, r, dt, v, temp))
+def report_row(status, row):
+    status.update(row)
 
 
 def report_line(row):
     print('{:<10s}{:<10s}{:<10s}{:<30s}{:<20s}{:<10s}'.format(*row))
 
 
-def write_row(p, row):
-    with open(p, 'a') as wfile:
-        line = ','.join([str(r) for r in row])
-        wfile.write('{}\n'.format(line))
+def write_row(writer, row):
+    writer.write_row(row)
 
 
 def convert_to_temp(v):
-    return v
+    return MODEL(v)
+
+
+MODEL = get_model(CALIBRATION)
 
 
 def warning(msg):
@@ -187,7 +304,10 @@ def main():
         sd = open_signal_device()
         if sd:
             print('opened signal device')
-            start_logging(dev, sd)
+            if ENGINE == 'asyncio':
+                start_logging_async(dev, sd)
+            else:
+                start_logging(dev, sd)
         else:
             warning('Failed to connect to Signal Device')
     else:
@@ -16,17 +16,26 @@
 from datetime import datetime
 import os
 import yaml
-from numpy import array
 
-from chaco.chaco_plot_editor import ChacoPlotItem
-from numpy import hstack
+from enable.api import ComponentEditor
 from pyface.message_dialog import warning, information
 from pyface.timer.do_later import do_after, do_later
-from traits.api import HasTraits, Button, Float, File, Bool, Str, Array, Int, Instance
+from traits.api import HasTraits, Button, Float, File, Bool, Str, Int, Instance, Enum
 from traitsui.api import View, UItem, HGroup, VGroup, Item, Readonly, Tabbed, spring
 
 from src.device import SignalDevice, MeasurementDevice
-from src.calibrator import Calibrator
+from src.logwriter import LogWriter
+from src.binlog import BinaryLogWriter
+from src.buffers import SampleStore
+from src.plotting import DecimatedPlot, ProfilePlot, UpdateCoalescer
+from src.depthprofile import DepthProfile
+from src.acquisition import AcquisitionWorker
+from src.autotune import AutoTuner
+from src.publish import Publisher
+from src.replay import ReplaySource, ReplayMeasurementDevice, ReplaySignalDevice
+from src.timing import Timings, STAGES
+from src.session import SessionManager
+from src.records import StatusLine, REPORT_HEADER
 
 DEBUG = os.getenv('DEBUG') in ('True', 'true')
 PROJECT_ROOT = os.path.join(os.path.expanduser('~'), 'WellTempLogger')
@@ -37,21 +46,66 @@ class MainWindow(HasTraits):
     start_button = Button('Start')
     stop_button = Button('Stop')
     reset_button = Button('Reset')
+    export_profile_button = Button('Export Profile')
     calibrate_button = Button('Calibrate')
+    replay_button = Button('Replay')
     last_measurement = Str
+    rate = Float
+    frame_rate = Float(10., auto_set=False, enter_set=True)
     output_path = File
     well_name = Str
     post_measurement_delay = Float(0.05, auto_set=False, enter_set=True)
-
-    _scan_thread = None
+    flush_rows = Int(100)
+    flush_interval = Float(1.0)
+    fsync = Bool(False)
+    write_throughput = Str
+    log_format = Enum('CSV', 'Binary')
+    segment_rows = Int(0)
+    compression = Enum(None, 'gzip', 'lzma')
+    plot_window = Int(0, auto_set=False, enter_set=True)
+    queue_size = Int(10000)
+    consume_period = Float(0.05)
+    queue_depth = Int
+    dropped = Int
+    trigger_edges = Int
+    trigger_missed = Int
+    timing_enabled = Bool(True)
+    autotune = Bool(False)
+    autotune_status = Str
+    # socket address samples are served on, e.g. tcp:127.0.0.1:5555. empty disables
+    publish = Str
+    publish_status = Str
+    publisher = Instance(Publisher)
+    # recorded log fed through the pipeline instead of the instruments. speed 0 is as fast as possible
+    replay_path = File
+    replay_speed = Float(1.0, auto_set=False, enter_set=True)
+    replay_status = Str
+    replay_source = Instance(ReplaySource)
+    _live_devices = None
+    timing_report = Str
+    timings = Instance(Timings)
+    # additional device pairs from the `channels` section of config.yaml
+    session = Instance(SessionManager)
+    channels_status = Str
+
+    _worker = None
+    _writer = None
+    _timing_reported = 0
+    update_coalescer = Instance(UpdateCoalescer)
+    # console output, one line rewritten in place instead of a line per sample
+    status_line = Instance(StatusLine, ())
 
     _alive = Bool
     measurement_device = Instance(MeasurementDevice, ())
     signal_device = Instance(SignalDevice, ())
 
-    xs = Array
-    ys = Array
-    ts = Array
+    sample_store = Instance(SampleStore)
+    depth_per_trigger = Float(1.0)
+    profile_bin_size = Float(1.0)
+    profile = Instance(DepthProfile)
+    profile_plot = Instance(ProfilePlot)
+    raw_plot = Instance(DecimatedPlot)
+    temp_plot = Instance(DecimatedPlot)
     # private
     _initialized = False
 
@@ -71,22 +125,42 @@ class MainWindow(HasTraits):
                         for k, v in g.items():
                             setattr(obj, k, v)
 
+                self.session.load(yobj.get('channels'), defaults=yobj.get('main'))
+
     def _get_dump_obj(self):
         def make_dump(obj, attrs):
             return {k: getattr(obj, k) for k in attrs}
 
-        ctx = {'main': make_dump(self, ('post_measurement_delay',)),
-               'signal_device': make_dump(self.signal_device, ('period',)),
-               'measurement_device': make_dump(self.measurement_device, ('npoints',))}
+        ctx = {'main': make_dump(self, ('post_measurement_delay', 'flush_rows', 'flush_interval', 'fsync',
+                                        'plot_window', 'queue_size', 'consume_period',
+                                        'log_format', 'segment_rows', 'compression', 'timing_enabled',
+                                        'depth_per_trigger', 'profile_bin_size', 'frame_rate', 'autotune', 'publish', 'replay_speed')),
+               'signal_device': make_dump(self.signal_device, ('period', 'trigger_backend', 'sim_rate', 'sim_jitter')),
+               'measurement_device': make_dump(self.measurement_device, ('npoints', 'acquisition_mode',
+                                                                          'batch_size', 'data_format', 'simulate'))}
+        if self.session:
+            ctx['channels'] = self.session.dump()
         return ctx
 
     def dump(self):
         with open(self.persistence_path, 'w') as wfile:
             yaml.dump(self._get_dump_obj(), wfile, default_flow_style=False)
 
+    def close(self):
+        self._stop_scan()
+        self._close_writer()
+        self._close_publisher()
+        self.session.close()
+        self.signal_device.close()
+        self._restore_live_devices()
+
     def _calibrate_button_fired(self):
+        # chaco and the calibrator are only loaded when first used
+        from src.calibrator import Calibrator
+
         cb = Calibrator(root=PROJECT_ROOT,
                         measurement_device=self.measurement_device)
+        cb.scanning = lambda: self._alive
 
         if cb.open():
             cb.edit_traits(kind='live')
@@ -104,28 +178,127 @@ class MainWindow(HasTraits):
         self.measurement_device.init()
         self._start_scan()
         
+    def _replay_button_fired(self):
+        if self._initialized:
+            warning(None, 'Please Reset before replaying')
+            return
+
+        source = ReplaySource(self.replay_path, self.replay_speed)
+        try:
+            source.load()
+        except (IOError, ValueError, IndexError) as e:
+            warning(None, 'Cannot replay {}. Error:{}'.format(self.replay_path, e))
+            return
+
+        if not self.well_name:
+            self.well_name = '{}.replay'.format(os.path.basename(self.replay_path).split('.')[0])
+
+        # the configured devices are put back on Reset
+        md = self.measurement_device
+        self._live_devices = md, self.signal_device
+        self.replay_source = source
+        self.measurement_device = ReplayMeasurementDevice(source, calibration_model=md.calibration_model)
+        self.signal_device = ReplaySignalDevice(source)
+
+        if not self._initialize_output_file():
+            self._restore_live_devices()
+            return
+        self._writer.note('replay of {} speed={}'.format(self.replay_path, self.replay_speed or 'max'))
+
+        self.measurement_device.open()
+        self.signal_device.open()
+        self._open_publisher()
+        self._initialized = True
+        self.measurement_device.reset()
+        self.measurement_device.init()
+        source.start()
+        self._start_scan()
+
+    def _replay_speed_changed(self, new):
+        if self.replay_source:
+            self.replay_source.set_speed(new)
+
+    def _restore_live_devices(self):
+        if self._live_devices:
+            self.measurement_device, self.signal_device = self._live_devices
+            self._live_devices = None
+            self.replay_source = None
+
     def _test_button_fired(self):
         self._test_connections()
         
     def _stop_button_fired(self):
-        self._alive = False
+        self._stop_scan()
+        if self._writer:
+            self._writer.flush()
+            self.write_throughput = self._writer.throughput_str()
+        self._dump_timings()
+        self._export_profile()
 
     def _reset_button_fired(self):
         def clear():
-            self.xs = array([])
-            self.ys = array([])
-            self.ts = array([])
+            self.sample_store.clear()
+            self.raw_plot.reset()
+            self.temp_plot.reset()
+            self.profile.bin_size = self.profile_bin_size
+            self.profile.depth_per_trigger = self.depth_per_trigger
+            self.profile.reset()
+            self.profile_plot.reset()
+            self.update_coalescer.reset()
 
         do_later(clear)
 
         if self.measurement_device:
             self.measurement_device.reset()
-
+        self.timings.reset()
+
+        self._close_writer()
+        self._close_publisher()
+        self.session.close()
+        # the next Start opens the port and the trigger thread again
+        self.signal_device.close()
+        self._restore_live_devices()
         self._initialized = False
 
     def _start_scan(self):
+        tuner = None
+        replay = self.replay_source is not None
+        if self.autotune and not replay and self.measurement_device.acquisition_mode == 'Batch':
+            warning(None, 'Auto Tune only works in Single acquisition mode, it is off for this scan')
+        elif self.autotune and not replay:
+            sd = self.signal_device
+            tuner = AutoTuner(self.measurement_device.npoints, self.post_measurement_delay,
+                              sd.period if sd.polling else None)
+
+        self._worker = AcquisitionWorker(self.measurement_device, self.signal_device,
+                                         maxsize=self.queue_size,
+                                         post_measurement_delay=0 if replay else self.post_measurement_delay,
+                                         debug=DEBUG and not replay,
+                                         timings=self.timings,
+                                         autotune=tuner)
+        if replay:
+            self.replay_source.follow(self._worker)
+        self.dropped = 0
         self._alive = True
-        do_later(self._scan)
+        self._worker.start()
+        self.session.start()
+        do_later(self._consume, self._worker)
+
+    def _stop_scan(self):
+        self._alive = False
+        if self._worker:
+            self._worker.stop()
+            # handle anything acquired before the worker stopped
+            self._consume(self._worker)
+            self._worker = None
+            self.status_line.close()
+        self.session.stop()
+
+    def _post_measurement_delay_changed(self, new):
+        if self._worker:
+            self._worker.post_measurement_delay = new
+            if self._worker.autotune:
+                self._worker.autotune.base_delay = new
 
     def _initialize_output_file(self):
         if not self.well_name:
@@ -134,25 +307,66 @@ class MainWindow(HasTraits):
 
         #        self.output_path = os.path.join('data', '{}.{}.csv'.format(self.well_name, datetime.now().isoformat()))
         uid = datetime.now().isoformat().replace(':', '_')
-        self.output_path = os.path.join(PROJECT_ROOT, 'data', '{}.{}.csv'.format(self.well_name, uid))
-
-        root = os.path.dirname(self.output_path)
-        if not os.path.isdir(root):
-            os.mkdir(root)
-
-        with open(self.output_path, 'w') as wfile:
-            line = ['Counter', 'Time', 'Rate', 'TimeStamp', 'Raw', 'Temp']
-            wfile.write('{}\n'.format(','.join(line)))
-
-        return True
+        ext = 'wtb' if self.log_format == 'Binary' else 'csv'
+        self.output_path = os.path.join(PROJECT_ROOT, 'data', '{}.{}.{}'.format(self.well_name, uid, ext))
+
+        self._close_writer()
+        kw = dict(flush_rows=self.flush_rows,
+                  flush_interval=self.flush_interval,
+                  fsync=self.fsync)
+        if self.log_format == 'Binary':
+            md = self.measurement_device
+            model = md.calibration_model
+            meta = {'well_name': self.well_name,
+                    'started': datetime.now().isoformat(),
+                    'measurement_device': md.device_id,
+                    'signal_device': self.signal_device.device_id,
+                    'npoints': md.npoints,
+                    'calibration_model': model.name,
+                    'calibration_coefficients': model.coefficients}
+            self._writer = BinaryLogWriter(self.output_path, meta,
+                                           segment_rows=self.segment_rows,
+                                           compression=self.compression, **kw)
+            return self._writer.open()
+
+        self._writer = LogWriter(self.output_path, **kw)
+        header = ['Counter', 'Time', 'Rate', 'TimeStamp', 'Raw', 'Temp']
+        return self._writer.open(header)
+
+    def _close_writer(self):
+        if self._writer:
+            self._writer.close()
+            self.write_throughput = self._writer.throughput_str()
+            self._writer = None
+
+    def _open_publisher(self):
+        if self.publish:
+            self.publisher = Publisher(self.publish)
+            try:
+                self.publisher.open()
+            except OSError as e:
+                warning(None, 'Cannot publish on {}. Error:{}'.format(self.publish, e))
+                self.publisher = None
+
+    def _close_publisher(self):
+        if self.publisher:
+            self.publisher.close()
+            self.publisher = None
 
     def _initialize_devices(self):
         if not self._initialized:
             self._initialized = True
-            self.measurement_device = MeasurementDevice()
+            self.measurement_device.reset()
+
+            failed = self.session.open()
+            if failed:
+                warning(None, 'Failed to open channels {}'.format(', '.join([c.name for c in failed])))
+            self._open_publisher()
 
             if self.signal_device.open():
                 if self.measurement_device.open():
+                    if self.measurement_device.simulate:
+                        self.signal_device.connect(self.measurement_device._handle.trigger)
                     return True
             if DEBUG:
                 return True
@@ -169,94 +383,212 @@ class MainWindow(HasTraits):
         if mb and sb:
             information(None, 'Connection Test Successful. Devices Connected')
             
-    def _scan(self):
+    def _consume(self, worker):
+        # a consume loop left over from a previous Start is stale
+        if worker is not self._worker:
+            return
 
-        self._iteration()
-        if self._alive:
-            do_after(self.post_measurement_delay * 1000, self._scan)
+        ms = worker.drain()
+        # the live stream goes out before the rows are written and plotted
+        if self.publisher:
+            self.publisher.publish_many(ms)
+        for measurement in ms:
+            self._iteration(measurement)
+
+        tuner = worker.autotune
+        if tuner and self._writer:
+            for note in tuner.pop_notes():
+                self._writer.note(note)
+
+        if len(self.session):
+            self.session.consume()
+
+        # the UI is refreshed at frame_rate no matter how many samples arrived
+        tm = self.timings
+        st = tm.start()
+        if self.update_coalescer.tick(force=not self._alive):
+            tm.stop('plot', st)
+            if tm.enabled and st - self._timing_reported > 1:
+                self._timing_reported = st
+                self.timing_report = tm.report()
+
+            if len(self.session):
+                self.channels_status = self.session.status_str()
+
+            self.queue_depth = worker.depth
+            self.dropped = worker.dropped
+            self.trigger_edges = self.signal_device.edges
+            self.trigger_missed = self.signal_device.missed
+            if tuner:
+                self.autotune_status = tuner.status_str()
+            if self.publisher:
+                self.publish_status = self.publisher.status_str()
+            if self.replay_source:
+                self.replay_status = self.replay_source.status_str()
+            if self._writer:
+                self.write_throughput = self._writer.throughput_str()
+
+        # a replay stops by itself once the log is done and everything was consumed
+        source = self.replay_source
+        if source and self._alive and source.finished and not worker.depth:
+            self.replay_status = source.status_str()
+            do_later(self._stop_button_fired)
+            return
 
-    def _iteration(self):
-        if self.signal_device.waitfor() or DEBUG:
-            measurement = self.measurement_device.get_measurement()
-            if measurement:
-                self._report_measurement(measurement)
-                self._write_measurement(measurement)
-                self._plot_measurement(measurement)
+        if self._alive:
+            do_after(self.consume_period * 1000, self._consume, worker)
+
+    def _iteration(self, measurement):
+        tm = self.timings
+        st = tm.start()
+        self._report_measurement(measurement)
+        st = tm.stop('report', st)
+        self._write_measurement(measurement)
+        tm.stop('write', st)
+        self._plot_measurement(measurement)
+        self.profile.add(measurement.counter, measurement.time, measurement.temp)
+        self.update_coalescer.push(measurement)
+
+    def _apply_frame(self, row):
+        self.last_measurement = '{}\n{}'.format(REPORT_HEADER, row.report())
+        self.rate = row.rate
+
+    def _dump_timings(self):
+        if self.timing_enabled and self.output_path:
+            self.timings.dump('{}.timing.yaml'.format(self.output_path))
+
+    def _session_default(self):
+        return SessionManager(PROJECT_ROOT)
+
+    def _timings_default(self):
+        return Timings(STAGES, enabled=self.timing_enabled)
+
+    def _timing_enabled_changed(self, new):
+        self.timings.enabled = new
+        if not new:
+            self.timing_report = ''
 
     def _plot_measurement(self, ms):
-        self.xs = hstack((self.xs, [-ms[0]]))
-        self.ys = hstack((self.ys, [ms[-2]]))
-        self.ts = hstack((self.ts, [ms[-1]]))
+        self.sample_store.append(-ms.counter, ms.raw, ms.temp)
 
-    def _report_measurement(self, row):
-        fmt = '{:<10s}{:<10s}{:<10s}{:<30s}{:<20s}{:<10s}'
+    def _update_plots(self):
+        self.raw_plot.update()
+        self.temp_plot.update()
+        self.profile_plot.update()
+
+    def _export_profile(self):
+        if self.output_path and self.profile.samples:
+            p = self.profile.export('{}.profile.csv'.format(os.path.splitext(self.output_path)[0]))
+            print('exported profile to {}'.format(p))
 
-        c = '{:05n}'.format(row[0])
-        t = '{:0.1f}'.format(row[1])
-        r = '{:0.1f}'.format(row[2])
-        dt = '{}'.format(row[3])
-        v = '{:0.6f}'.format(row[4])
-        temp = '{:0.3f}'.format(row[5])
+    def _export_profile_button_fired(self):
+        self._export_profile()
 
-        msg = fmt.format(c, t, r, dt, v, temp)
-        print(msg)
+    def _update_coalescer_default(self):
+        return UpdateCoalescer((self.raw_plot, self.temp_plot, self.profile_plot),
+                               apply=self._apply_frame, rate=self.frame_rate)
 
-        header = 'Counter  Time      Rate    TimeStamp                                     Raw                     Temp'
-        msg = '{}\n{}'.format(header, msg)
-        self.last_measurement = msg
+    def _frame_rate_changed(self, new):
+        self.update_coalescer.rate = new
+
+    def _profile_default(self):
+        return DepthProfile(self.profile_bin_size, self.depth_per_trigger)
+
+    def _profile_plot_default(self):
+        return ProfilePlot(profile=self.profile)
+
+    def _profile_bin_size_changed(self, new):
+        # binning only applies to new samples, changes take effect after Reset
+        if not self.profile.samples and new > 0:
+            self.profile.bin_size = new
+
+    def _depth_per_trigger_changed(self, new):
+        if not self.profile.samples:
+            self.profile.depth_per_trigger = new
+
+    def _plot_window_changed(self, new):
+        self.sample_store.set_window(max(new, 0))
+        self._update_plots()
+
+    def _sample_store_default(self):
+        return SampleStore(('x', 'y', 't'), window=self.plot_window)
+
+    def _raw_plot_default(self):
+        return DecimatedPlot(store=self.sample_store, xname='x', yname='y',
+                             x_label='Depth', y_label='Signal(ohm)')
+
+    def _temp_plot_default(self):
+        return DecimatedPlot(store=self.sample_store, xname='x', yname='t',
+                             x_label='Depth', y_label='Temp C')
+
+    def _report_measurement(self, row):
+        self.status_line.update(row)
 
     def _write_measurement(self, row):
-        with open(self.output_path, 'a') as wfile:
-            line = ','.join([str(r) for r in row])
-            wfile.write('{}\n'.format(line))
+        self._writer.write_row(row)
 
 
 agrp = HGroup(UItem('start_button', enabled_when='not _alive'),
               UItem('stop_button', enabled_when='_alive'),
               UItem('reset_button', enabled_when='not _alive'),
               UItem('calibrate_button', enabled_when='not _alive'),
+              UItem('replay_button', enabled_when='replay_path and not _alive and replay_source is None'),
               UItem('test_button', enabled_when='not _alive')
               )
 
 bgrp = HGroup(Readonly('last_measurement', show_label=False), 
-              Readonly('object.measurement_device.rate', label='Rate (m/s)'),
+              VGroup(Readonly('rate', label='Rate (m/s)'),
+                     Readonly('write_throughput', label='Write'),
+                     HGroup(Readonly('queue_depth', label='Queue'),
+                            Readonly('dropped', label='Dropped')),
+                     HGroup(Readonly('trigger_edges', label='Triggers'),
+                            Readonly('trigger_missed', label='Missed')),
+                     Readonly('autotune_status', label='Auto Tune', visible_when='autotune'),
+                     Readonly('publish_status', label='Publish', visible_when='publish'),
+                     Readonly('replay_status', label='Replay', visible_when='replay_source')),
+              VGroup(Item('timing_enabled', label='Timing'),
+                     Readonly('timing_report', show_label=False, visible_when='timing_enabled')),
               label='Last Measurement', show_border=True)
-fgrp = HGroup(Item('well_name', width=-200), spring, Readonly('output_path', show_label=False), label='Output File',
+fgrp = HGroup(Item('well_name', width=-200),
+              Item('log_format', tooltip='Binary writes fixed size records that load instantly. See src/binlog.py'),
+              Item('segment_rows', enabled_when='log_format=="Binary"', tooltip='Split binary logs into segments of this many rows. 0 writes one file'),
+              Item('compression', enabled_when='log_format=="Binary" and segment_rows', tooltip='Compress closed segments'),
+              Item('replay_path', label='Replay', tooltip='Recorded CSV or binary log to play back through the pipeline with the Replay button'),
+              Item('replay_speed', label='Speed', tooltip='1 replays in real time, 10 ten times faster, 0 as fast as possible'),
+              spring, Readonly('output_path', show_label=False), label='Output File',
               show_border=True)
 cgrp = HGroup(Item('post_measurement_delay', tooltip='Time (s) to wait after a triggered measurement before trying to get the next measurement. Increase this value if descending at a slow rate'),
-              Item('object.measurement_device.npoints'),
+              # SENSE:FRES:NPLC goes to the handle the worker reads from, during a scan only the
+              # auto tuner changes it, from the worker thread
+              Item('object.measurement_device.npoints', label='NPLC', enabled_when='not _alive'),
+              Item('autotune', tooltip='Pick the largest NPLC and the smallest delays that keep up with the measured trigger rate. Adjustments are written to the log. Single acquisition mode only',
+                   enabled_when='object.measurement_device.acquisition_mode=="Single"'),
               Item('object.signal_device.period'),
-              Item('object.measurement_device.use_air_calibration'))
-pgrp = Tabbed(VGroup(ChacoPlotItem('xs', 'ys',
-                                   resizable=True,
-                                   orientation='v',
-                                   x_label='Depth',
-                                   y_label='Signal(ohm)',
-                                   color='blue',
-                                   bgcolor='white',
-                                   border_visible=True,
-                                   border_width=1,
-                                   padding_bg_color='lightgray',
-                                   width=800,
-                                   height=380,
-                                   marker_size=2,
-                                   title='',
-                                   show_label=False), label='Raw'),
-              VGroup(ChacoPlotItem('xs', 'ts',
-                                   resizable=True,
-                                   orientation='v',
-                                   x_label='Depth',
-                                   y_label='Temp C',
-                                   color='blue',
-                                   bgcolor='white',
-                                   border_visible=True,
-                                   border_width=1,
-                                   padding_bg_color='lightgray',
-                                   width=800,
-                                   height=380,
-                                   marker_size=2,
-                                   title='',
-                                   show_label=False), label='Temp'))
+              Item('object.signal_device.trigger_backend', tooltip='auto uses the modem line wait where available and falls back to polling. simulate generates a pulse train'),
+              Item('object.signal_device.sim_rate', label='Sim Rate', visible_when='object.signal_device.trigger_backend=="simulate"'),
+              Item('object.signal_device.sim_jitter', label='Jitter', visible_when='object.signal_device.trigger_backend=="simulate"'),
+              Item('object.measurement_device.simulate', tooltip='Use the simulated multimeter'),
+              Item('object.measurement_device.use_air_calibration'),
+              Item('object.measurement_device.acquisition_mode', tooltip='Batch lets the multimeter take readings on the hardware trigger and fetches them in bulk'),
+              Item('object.measurement_device.batch_size', enabled_when='object.measurement_device.acquisition_mode=="Batch"'),
+              # the format is set on the VISA handle the worker is reading from, only between scans
+              Item('object.measurement_device.data_format', enabled_when='not _alive',
+                   tooltip='REAL64 transfers readings in binary. Falls back to ASCII if the multimeter does not support it'),
+              Item('publish', tooltip='Serve samples to other programs on a socket, e.g. tcp:127.0.0.1:5555 or unix:/tmp/wt.sock. See src/publish.py'),
+              Item('frame_rate', tooltip='Maximum number of display updates per second. Only the visible plot is redrawn'),
+              Item('plot_window', tooltip='Number of samples kept in memory for plotting. 0 keeps all samples'),
+              Item('flush_rows', tooltip='Number of buffered rows that triggers a write to the output file'),
+              Item('flush_interval', tooltip='Maximum time (s) rows are buffered before being written to the output file'),
+              Item('fsync', tooltip='Force data to disk after every write. Safer but slower'))
+pgrp = Tabbed(VGroup(UItem('object.raw_plot.component', editor=ComponentEditor(size=(800, 380))), label='Raw'),
+              VGroup(UItem('object.temp_plot.component', editor=ComponentEditor(size=(800, 380))), label='Temp'),
+              VGroup(HGroup(Item('depth_per_trigger', tooltip='Depth (m) the probe descends per trigger'),
+                            Item('profile_bin_size', label='Bin (m)', tooltip='Depth bin size. Applies after Reset'),
+                            UItem('export_profile_button')),
+                     UItem('object.profile_plot.component', editor=ComponentEditor(size=(800, 350))),
+                     label='Profile'),
+              VGroup(Readonly('channels_status', show_label=False), label='Channels',
+                     visible_when='len(object.session)'))
 
 view = View(VGroup(agrp, bgrp, fgrp, cgrp, pgrp), resizable=True,
             width=900,
@@ -266,5 +598,6 @@ if __name__ == '__main__':
     m = MainWindow()
     m.load()
     m.configure_traits(view=view)
+    m.close()
     m.dump()
 # ============= EOF =============================================